@@ -41,6 +41,9 @@ load_dotenv()
 BOT_TOKEN = os.environ['DISCORD_TOKEN']
 BOT_OWNER = os.environ.get('BOT_OWNER')
 DB_KEY = os.environ.get('SQLITE_KEY', "2DD29CA851E7B56E4697B0E1F08507293D761A05CE4D1B628663F411A8086D99")
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))
+DB_WRITE_BEHIND_INTERVAL = float(os.environ.get('DB_WRITE_BEHIND_INTERVAL', 0))
+DB_WRITE_BEHIND_BATCH = int(os.environ.get('DB_WRITE_BEHIND_BATCH', 500))
 COMMAND_PREFIX = "k!"
 STREAMING_URL = "https://twitch.tv/jaydwee"
 COGS_DIR = "cogs"
@@ -78,7 +81,9 @@ if discord.__version__ != "1.3.4":
 else:
     logging.info("discord.py v1.3.4: Intents Disabled")
     client = commands.Bot(command_prefix=COMMAND_PREFIX)
-database_manager = DBManager(DATABASE_PATH, DB_KEY, config_dir)
+database_manager = DBManager(DATABASE_PATH, DB_KEY, config_dir, pool_size=DB_POOL_SIZE,
+                             write_behind_interval=DB_WRITE_BEHIND_INTERVAL,
+                             write_behind_batch_size=DB_WRITE_BEHIND_BATCH)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s %(message)s')
 logger = logging.getLogger('discord')
 is_dpytest = False
@@ -183,5 +188,6 @@ async def on_command_error(ctx, error):
 if __name__ == "__main__":  # pragma: no cover
     os.system("title " + "KoalaBot")
     load_all_cogs()
+    database_manager.migrate()
     # Starts bot using the given BOT_ID
     client.run(BOT_TOKEN)
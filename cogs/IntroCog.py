@@ -104,7 +104,8 @@ class IntroCog(commands.Cog, name="KoalaBot"):
         On member joining guild, send DM to member with welcome message.
         :param member: Member which just joined guild
         """
-        await KoalaBot.dm_group_message([member], get_guild_welcome_message(member.guild.id))
+        welcome_message = await DBManager.async_manager.run(get_guild_welcome_message, member.guild.id)
+        await KoalaBot.dm_group_message([member], welcome_message)
         KoalaBot.logger.info(f"New member {member.name} joined guild id {member.guild.id}. Sent them welcome message.")
 
     @commands.Cog.listener()
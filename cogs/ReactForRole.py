@@ -9,7 +9,10 @@ Commented using reStructuredText (reST)
 # Futures
 
 # Built-in/Generic Imports
+import asyncio
 import re
+import threading
+import time
 from io import BytesIO
 from typing import *
 
@@ -30,6 +33,12 @@ UNICODE_DISCORD_EMOJI_REGEXP: re.Pattern = re.compile(r"^:(\w+):$")
 CUSTOM_EMOJI_REGEXP: re.Pattern = re.compile(r"^<a?:(\w+):(\d+)>$")
 UNICODE_EMOJI_REGEXP: re.Pattern = re.compile(emoji.get_emoji_regexp())
 IMAGE_FORMATS = ("image/png", "image/jpeg", "image/gif")
+RFR_MAX_CONCURRENT_REQUESTS = 5
+RFR_BULK_MAX_ATTEMPTS = 3
+RFR_BULK_RETRY_DELAY = 1
+RFR_BULK_STATUS_INTERVAL = 2
+RFR_INDEX_RETRY_DELAY = 1
+RFR_INDEX_MAX_RETRY_DELAY = 300
 
 
 def rfr_is_enabled(ctx):
@@ -47,6 +56,32 @@ def rfr_is_enabled(ctx):
     return result or (str(ctx.author) == KoalaBot.TEST_USER and KoalaBot.is_dpytest)
 
 
+def rfr_emoji_key(emoji_raw: str) -> str:
+    """
+    Gets the key an emoji is indexed by. Custom emojis are keyed by ID so they still match after being renamed, other
+    emojis by the raw string stored in the database
+    :param emoji_raw: raw emoji representation in string format, as stored in RFRMessageEmojiRoles
+    :return: Index key of the emoji
+    """
+    search_result = CUSTOM_EMOJI_REGEXP.match(emoji_raw)
+    if search_result:
+        return search_result.group(2)
+    return emoji_raw
+
+
+def rfr_reaction_key(emoji_reacted: discord.PartialEmoji) -> Optional[str]:
+    """
+    Gets the index key of the emoji of a raw reaction, matching the key rfr_emoji_key gives its stored emoji
+    :param emoji_reacted: Emoji of the raw reaction payload
+    :return: Index key of the emoji, or None if it is neither a unicode nor a custom emoji
+    """
+    if emoji_reacted.is_custom_emoji():
+        return str(emoji_reacted.id)
+    if emoji_reacted.is_unicode_emoji():
+        return emoji.demojize(emoji_reacted.name)
+    return None
+
+
 class ReactForRole(commands.Cog):
     """
     A discord.py cog pertaining to a React for Role system to allow for automation in getting roles.
@@ -58,6 +93,14 @@ class ReactForRole(commands.Cog):
         KoalaBot.database_manager.insert_extension("ReactForRole", 0, True, True)
         self.rfr_database_manager = ReactForRoleDBManager(KoalaBot.database_manager)
         self.rfr_database_manager.create_tables()
+        self.rfr_database_manager.load_rfr_message_index()
+        self.async_db_manager = KoalaBot.database_manager.async_manager
+        # guild_id -> the last guild-wide rfr operation that didn't finish, so it can be resumed
+        self.rfr_bulk_operations: Dict[int, RFRBulkOperation] = {}
+        # Retries of a failed rfr message index load, see load_rfr_message_index
+        self.rfr_index_load: Optional[asyncio.Future] = None
+        self.rfr_index_retry_delay = RFR_INDEX_RETRY_DELAY
+        self.rfr_index_retry_time = 0.0
 
     @commands.check(KoalaBot.is_guild_channel)
     @commands.check(KoalaBot.is_admin)
@@ -354,23 +397,22 @@ class ReactForRole(commands.Cog):
                     await ctx.send("Invalid input for Y/N. Okay, cancelling command")
                     return
                 else:
-                    await ctx.send(
-                        "Keep in mind that this process may take a while if you have a lot of RFR messages on your "
-                        "server.")
-                    # fetch rfr messages
-                    guild: discord.Guild = ctx.guild
-                    text_channels: List[discord.TextChannel] = guild.text_channels
-                    guild_rfr_messages = self.rfr_database_manager.get_guild_rfr_messages(guild.id)
-                    for rfr_message in guild_rfr_messages:
-                        channel: discord.TextChannel = discord.utils.get(text_channels, id=rfr_message[1])
-                        msg: discord.Message = await channel.fetch_message(id=rfr_message[2])
+                    inline = change_all == "Y"
+
+                    async def set_inline(msg: discord.Message):
                         embed: discord.Embed = self.get_embed_from_message(msg)
-                        length = self.get_number_of_embed_fields(embed)
-                        for i in range(length):
+                        if not embed:
+                            return False
+                        for i in range(self.get_number_of_embed_fields(embed)):
                             field = embed.fields[i]
-                            embed.set_field_at(i, name=field.name, value=field.value, inline=change_all == "Y")
+                            embed.set_field_at(i, name=field.name, value=field.value, inline=inline)
                         await msg.edit(embed=embed)
-                    await ctx.send("Okay, the process should be finished now. Please check.")
+
+                    await self.load_rfr_message_index()
+                    guild_rfr_messages = self.rfr_database_manager.get_indexed_guild_rfr_messages(ctx.guild.id)
+                    if await self.run_rfr_bulk_operation(ctx, RFRBulkOperation("edit inline", set_inline,
+                                                                               guild_rfr_messages)):
+                        await ctx.send("Okay, the process should be finished now. Please check.")
             elif input_comm.lstrip().rstrip().lower() == "specific":
                 # try and get specific message
                 await ctx.send("Okay, I'll need the information about the specific rfr message.")
@@ -399,46 +441,112 @@ class ReactForRole(commands.Cog):
     @commands.check(KoalaBot.is_admin)
     @commands.check(rfr_is_enabled)
     @edit_group.command(name="fixEmbed")
-    async def rfr_fix_embed(self, ctx: commands.Context):
+    async def rfr_fix_embed(self, ctx: commands.Context, scope: str = None):
         """
         Cosmetic fix method if the bot ever has a moment and doesn't react with the correct emojis/has duplicates.
+        Fixes a specific message from prompts, or every rfr message on the server if scope is "all".
+        :param ctx: Context of the command
+        :param scope: "all" to fix every rfr message on the server
+        :return:
         """
+        if scope and scope.strip().lower() == "all":
+            guild: discord.Guild = ctx.guild
+            await self.load_rfr_message_index()
+            guild_rfr_messages = self.rfr_database_manager.get_indexed_guild_rfr_messages(guild.id)
+            for channel_id in {channel_id for channel_id, _ in guild_rfr_messages}:
+                channel: discord.TextChannel = guild.get_channel(channel_id)
+                if channel:
+                    await self.overwrite_channel_add_reaction_perms(guild, channel)
+
+            async def fix(msg: discord.Message):
+                return await self.fix_rfr_embed(guild, msg)
+
+            if await self.run_rfr_bulk_operation(ctx, RFRBulkOperation("fixEmbed", fix, guild_rfr_messages)):
+                await ctx.send("Tried fixing the messages, please check that they're fixed.")
+            return
         msg, chnl = await self.get_rfr_message_from_prompts(ctx)
         await self.overwrite_channel_add_reaction_perms(chnl.guild, chnl)
+        if await self.fix_rfr_embed(ctx.guild, msg):
+            await ctx.send("Tried fixing the message, please check that it's fixed.")
+
+    async def fix_rfr_embed(self, guild: discord.Guild, msg: discord.Message) -> bool:
+        """
+        Rebuilds the embed and reactions of an rfr message from its emoji-role combos in the database
+        :param guild: Guild the rfr message is in
+        :param msg: The rfr message
+        :return: True if the message was fixed, False if it isn't a working rfr message
+        """
+        chnl: discord.TextChannel = msg.channel
         emb = self.get_embed_from_message(msg)
         reacts: List[Union[discord.PartialEmoji, discord.Emoji, str]] = [x.emoji for x in msg.reactions]
         if not emb:
             KoalaBot.logger.error(
-                f"RFR: Can't find embed for message id {msg.id}, channel {chnl.id}, guild id {ctx.guild.id}.")
+                f"RFR: Can't find embed for message id {msg.id}, channel {chnl.id}, guild id {guild.id}.")
+            return False
+        rfr_message = self.rfr_database_manager.get_rfr_message(guild.id, chnl.id, msg.id)
+        if not rfr_message:
+            KoalaBot.logger.error(
+                f"RFR: Can't find rfr message with {msg.id}, channel {chnl.id}, guild id {guild.id}.")
+            return False
+        er_id = rfr_message[3]
+        rfr_er = self.rfr_database_manager.get_rfr_message_emoji_roles(er_id)
+        if not rfr_er:
+            KoalaBot.logger.error(
+                f"RFR: Can't retrieve RFR message (ER_ID: {er_id})'s emoji role combinations.")
+            return False
+        er_list: List[Tuple[Union[discord.Emoji, discord.PartialEmoji, str], discord.Role]] = []
+        for _, emoji_raw, role_id in rfr_er:
+            role: discord.Role = guild.get_role(role_id)
+            if not role:
+                KoalaBot.logger.error(f"RFR: Can't find role {role_id} of RFR message (ER_ID: {er_id}) in guild "
+                                      f"{guild.id}.")
+                continue
+            er_list.append((self.get_rfr_emoji(rfr_emoji_key(emoji_raw)), role))
+        embed: discord.Embed = discord.Embed(title=emb.title, description=emb.description,
+                                             colour=KoalaColours.KOALA_GREEN)
+        embed.set_footer(text=emb.footer)
+        embed.set_thumbnail(url=emb.thumbnail.url)
+        emb.set_image(url=emb.image.url)
+        for e in reacts:
+            if e not in [x for x, _ in er_list]:
+                await msg.clear_reaction(e)
+        for e, r in er_list:
+            embed.add_field(name=str(e), value=r.mention, inline=False)
+            if e not in reacts:
+                await msg.add_reaction(e)
+        await msg.edit(embed=embed)
+        return True
+
+    @commands.check(KoalaBot.is_admin)
+    @commands.check(rfr_is_enabled)
+    @edit_group.command(name="resume")
+    async def rfr_resume_bulk_operation(self, ctx: commands.Context):
+        """
+        Resumes the last guild-wide rfr operation on the server that didn't finish, retrying only the messages that
+        failed. User requires admin perms
+        :param ctx: Context of the command
+        :return:
+        """
+        bulk_operation = self.rfr_bulk_operations.get(ctx.guild.id)
+        if not bulk_operation:
+            await ctx.send("There's nothing to resume, every rfr operation on this server has finished.")
+            return
+        if await self.run_rfr_bulk_operation(ctx, bulk_operation):
+            await ctx.send("Okay, the process should be finished now. Please check.")
+
+    async def run_rfr_bulk_operation(self, ctx: commands.Context, bulk_operation: "RFRBulkOperation") -> bool:
+        """
+        Runs a guild-wide rfr operation, keeping it to be resumed if any messages fail
+        :param ctx: Context of the command running the operation, its channel gets the status message
+        :param bulk_operation: The operation
+        :return: True if the operation finished on every message, False otherwise
+        """
+        finished = await bulk_operation.run(ctx.guild, ctx.channel)
+        if finished:
+            self.rfr_bulk_operations.pop(ctx.guild.id, None)
         else:
-            er_id, _, _, _ = self.rfr_database_manager.get_rfr_message(ctx.guild.id, chnl.id, msg.id)
-            if not er_id:
-                KoalaBot.logger.error(
-                    f"RFR: Can't find rfr message with {msg.id}, channel {chnl.id}, guild id {ctx.guild.id}. DB ER_ID : {er_id}")
-            else:
-                rfr_er = self.rfr_database_manager.get_rfr_message_emoji_roles(er_id)
-                if not rfr_er:
-                    KoalaBot.logger.error(
-                        f"RFR: Can't retrieve RFR message (ER_ID: {er_id})'s emoji role combinations.")
-                else:
-                    combos = ""
-                    for er in rfr_er:
-                        combos += er[1] + ", " + str(er[2]) + "\n"
-                    er_list = await self.parse_emoji_and_role_input_str(ctx, combos, 20)
-                    embed: discord.Embed = discord.Embed(title=emb.title, description=emb.description,
-                                                         colour=KoalaColours.KOALA_GREEN)
-                    embed.set_footer(text=emb.footer)
-                    embed.set_thumbnail(url=emb.thumbnail.url)
-                    emb.set_image(url=emb.image.url)
-                    for e in reacts:
-                        if e not in [x for x, _ in er_list]:
-                            await msg.clear_reaction(e)
-                    for e, r in er_list:
-                        embed.add_field(name=str(e), value=r.mention, inline=False)
-                        if e not in reacts:
-                            await msg.add_reaction(e)
-                    await msg.edit(embed=embed)
-                    await ctx.send("Tried fixing the message, please check that it's fixed.")
+            self.rfr_bulk_operations[ctx.guild.id] = bulk_operation
+        return finished
 
     @commands.check(KoalaBot.is_admin)
     @commands.check(rfr_is_enabled)
@@ -594,7 +702,7 @@ class ReactForRole(commands.Cog):
                         self.rfr_database_manager.remove_rfr_message_emoji_role(rfr_msg_row[3],
                                                                                 emoji_raw=emoji.demojize(row))
                     else:
-                        self.rfr_database_manager.remove_rfr_message_emoji_role(rfr_msg_row[3], emoji_raw=row)
+                        self.rfr_database_manager.remove_rfr_message_emoji_role(rfr_msg_row[3], emoji_raw=str(row))
                 else:
                     # row is instance of role
                     field_index = [x.value for x in rfr_embed_fields].index(row.mention)
@@ -627,6 +735,35 @@ class ReactForRole(commands.Cog):
             await msg.edit(embed=new_embed)
             await ctx.send("Okay, I've removed those options from the react for role message.")
 
+    async def load_rfr_message_index(self):
+        """
+        Loads the rfr message index on the database executor if an earlier load failed. Failed loads are retried after
+        a delay that doubles each time, until then the index is left unloaded and no rfr messages are found.
+        :return:
+        """
+        if self.rfr_database_manager.rfr_message_index is not None:
+            return
+        if self.rfr_index_load is None:
+            if time.monotonic() < self.rfr_index_retry_time:
+                return
+            self.rfr_index_load = asyncio.ensure_future(self.retry_rfr_message_index_load())
+        await asyncio.shield(self.rfr_index_load)
+
+    async def retry_rfr_message_index_load(self):
+        """
+        Makes one attempt at loading the rfr message index, setting when the next attempt can be made if it fails
+        :return:
+        """
+        try:
+            await self.async_db_manager.run(self.rfr_database_manager.load_rfr_message_index)
+        finally:
+            self.rfr_index_load = None
+        if self.rfr_database_manager.rfr_message_index is None:
+            self.rfr_index_retry_time = time.monotonic() + self.rfr_index_retry_delay
+            self.rfr_index_retry_delay = min(self.rfr_index_retry_delay * 2, RFR_INDEX_MAX_RETRY_DELAY)
+        else:
+            self.rfr_index_retry_delay = RFR_INDEX_RETRY_DELAY
+
     @commands.Cog.listener()
     @commands.check(KoalaBot.is_guild_channel)
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
@@ -638,48 +775,107 @@ class ReactForRole(commands.Cog):
         """
         if payload.guild_id is not None:
             if not payload.member.bot:
-                rfr_message = self.rfr_database_manager.get_rfr_message(payload.guild_id, payload.channel_id,
-                                                                        payload.message_id)
-                if not rfr_message:
+                await self.load_rfr_message_index()
+                if self.rfr_database_manager.get_indexed_rfr_message_roles(payload.guild_id, payload.channel_id,
+                                                                           payload.message_id) is None:
                     return
 
                 member_role = await self.get_role_member_info(payload.emoji, payload.guild_id,
                                                               payload.channel_id,
-                                                              payload.message_id, payload.user_id)
+                                                              payload.message_id, payload.user_id,
+                                                              member=payload.member)
                 if not member_role:
                     # Remove the reaction
                     guild: discord.Guild = self.bot.get_guild(payload.guild_id)
                     channel: discord.TextChannel = guild.get_channel(payload.channel_id)
-                    msg: discord.Message = await channel.fetch_message(payload.message_id)
-                    await msg.clear_reaction(payload.emoji)
+                    await channel.get_partial_message(payload.message_id).clear_reaction(payload.emoji)
                 else:
-                    if self.can_have_rfr_role(member_role[0]):
+                    if self.rfr_database_manager.get_cached_guild_rfr_required_roles(payload.guild_id) is not None:
+                        can_have_role = self.can_have_rfr_role(member_role[0])
+                    else:
+                        can_have_role = await self.async_db_manager.run(self.can_have_rfr_role, member_role[0])
+                    if can_have_role:
                         await member_role[0].add_roles(member_role[1])
                     else:
-                        # Remove all rfr roles from member
-                        role_ids = self.rfr_database_manager.get_guild_rfr_roles(payload.guild_id)
-                        roles: List[discord.Role] = []
-                        for role_id in role_ids:
-                            role = discord.utils.get(member_role[0].guild.roles, id=role_id)
-                            if not role:
-                                continue
-                            roles.append(role)
-                        for role_to_remove in roles:
-                            await member_role[0].remove_roles(role_to_remove)
-                        # Remove members' reaction from all rfr messages in guild
-                        guild_rfr_messages = self.rfr_database_manager.get_guild_rfr_messages(payload.guild_id)
-                        if not guild_rfr_messages:
-                            KoalaBot.logger.error(
-                                f"ReactForRole: Guild RFR messages is empty on raw reaction add. Please check"
-                                f" guild ID {payload.guild_id}")
-
-                        else:
-                            for guild_rfr_message in guild_rfr_messages:
-                                guild: discord.Guild = member_role[0].guild
-                                channel: discord.TextChannel = guild.get_channel(guild_rfr_message[1])
-                                msg: discord.Message = await channel.fetch_message(guild_rfr_message[2])
-                                for x in msg.reactions:
-                                    await x.remove(payload.member)
+                        await self.revoke_rfr_roles(member_role[0], payload)
+
+    async def revoke_rfr_roles(self, member: discord.Member, payload: discord.RawReactionActionEvent):
+        """
+        Strips all rfr roles from a member who isn't allowed them in one request, and removes their reactions from the
+        guild's rfr messages. The reactions removed are the one they just made and the ones matching the rfr roles they
+        hold, worked out from the rfr index rather than by fetching every message. Channels are handled concurrently,
+        but the reactions of each channel one at a time as they share a rate limit.
+        :param member: Member to take the roles from
+        :param payload: RawReactionActionEvent of the reaction they weren't allowed to make
+        :return:
+        """
+        guild: discord.Guild = member.guild
+        guild_rfr_messages = self.rfr_database_manager.get_indexed_guild_rfr_messages(guild.id)
+        if not guild_rfr_messages:
+            KoalaBot.logger.error(f"ReactForRole: Guild RFR messages is empty on raw reaction add. Please check"
+                                  f" guild ID {guild.id}")
+            return
+        rfr_role_ids = {role_id for emoji_roles in guild_rfr_messages.values() for role_id in emoji_roles.values()}
+        roles: List[discord.Role] = [role for role in member.roles if role.id in rfr_role_ids]
+        held_role_ids = {role.id for role in roles}
+
+        # channel_id -> (message_id, emoji key) -> emoji
+        reactions: Dict[int, Dict[Tuple[int, str], Union[discord.Emoji, discord.PartialEmoji, str]]] = {}
+        for (channel_id, message_id), emoji_roles in guild_rfr_messages.items():
+            for emoji_key, role_id in emoji_roles.items():
+                if role_id in held_role_ids:
+                    reactions.setdefault(channel_id, {})[(message_id, emoji_key)] = self.get_rfr_emoji(emoji_key)
+        reactions.setdefault(payload.channel_id, {})[(payload.message_id, rfr_reaction_key(payload.emoji))] = \
+            payload.emoji
+
+        requests = []
+        if roles:
+            # Non-atomic removal edits the member's roles in one request rather than one per role
+            requests.append(member.remove_roles(*roles, reason="ReactForRole: Missing a required role",
+                                                atomic=False))
+        for channel_id, channel_reactions in reactions.items():
+            channel: discord.TextChannel = guild.get_channel(channel_id)
+            if channel:
+                requests.append(self.remove_member_reactions(channel, member, channel_reactions))
+
+        semaphore = asyncio.Semaphore(RFR_MAX_CONCURRENT_REQUESTS)
+
+        async def limited(request):
+            async with semaphore:
+                return await request
+
+        for result in await asyncio.gather(*(limited(request) for request in requests), return_exceptions=True):
+            if isinstance(result, Exception):
+                KoalaBot.logger.error(f"ReactForRole: Failed to revoke rfr roles of member {member.id} in guild "
+                                      f"{guild.id}: {result}")
+
+    @staticmethod
+    async def remove_member_reactions(
+            channel: discord.TextChannel, member: discord.Member,
+            reactions: Dict[Tuple[int, str], Union[discord.Emoji, discord.PartialEmoji, str]]):
+        """
+        Removes a member's reactions from messages in a channel one at a time, without fetching the messages
+        :param channel: Channel the messages are in
+        :param member: Member whose reactions to remove
+        :param reactions: (message ID, emoji key) -> emoji of the reactions to remove
+        :return:
+        """
+        for (message_id, _), reaction_emoji in reactions.items():
+            try:
+                await channel.get_partial_message(message_id).remove_reaction(reaction_emoji, member)
+            except discord.NotFound:
+                continue
+
+    def get_rfr_emoji(self, emoji_key: str) -> Union[discord.Emoji, discord.PartialEmoji, str]:
+        """
+        Gets an emoji that can be reacted with from its rfr index key
+        :param emoji_key: Index key of the emoji, see rfr_emoji_key
+        :return: The custom emoji with that ID, or the unicode emoji
+        """
+        if emoji_key.isdigit():
+            # Discord only uses the ID of a custom emoji, so the name doesn't matter if it isn't cached
+            return self.bot.get_emoji(int(emoji_key)) or discord.PartialEmoji(name="_", id=int(emoji_key))
+        return emoji.emojize(emoji_key)
 
     @commands.check(KoalaBot.is_admin)
     @commands.check(rfr_is_enabled)
@@ -730,18 +926,24 @@ class ReactForRole(commands.Cog):
         :param ctx: Context of the command.
         :return:
         """
-        role_ids = self.rfr_database_manager.get_guild_rfr_required_roles(ctx.guild.id)
-        msg_str = "You will need one of these roles to react to rfr messages on this server:\n"
+        role_ids = self.rfr_database_manager.get_cached_guild_rfr_required_roles(ctx.guild.id)
+        if role_ids is None:
+            role_ids = await self.async_db_manager.run(self.rfr_database_manager.get_guild_rfr_required_role_set,
+                                                       ctx.guild.id)
+        roles: List[discord.Role] = []
         for role_id in role_ids:
-
-            role: discord.Role = discord.utils.get(ctx.guild.roles, id=role_id)
+            role: discord.Role = ctx.guild.get_role(role_id)
             if not role:
                 KoalaBot.logger.error(f"ReactForRole: Couldn't find role {role_id} in guild {ctx.guild.id}. Please "
                                       f"check.")
             else:
-                msg_str += f"{role.mention}\n"
-        if msg_str == "You will need one of these roles to react to rfr messages on this server:\n":
+                roles.append(role)
+        if not roles:
             msg_str = "Anyone can react to rfr messages on this server."
+        else:
+            # Highest role first, as in the server's role list
+            msg_str = "You will need one of these roles to react to rfr messages on this server:\n" + \
+                      "".join(f"{role.mention}\n" for role in sorted(roles, reverse=True))
         await ctx.send(msg_str)
 
     @commands.Cog.listener()
@@ -754,13 +956,14 @@ class ReactForRole(commands.Cog):
         :return:
         """
         if payload.guild_id is not None:
-            rfr_message = self.rfr_database_manager.get_rfr_message(payload.guild_id, payload.channel_id,
-                                                                    payload.message_id)
-            if not rfr_message:
+            await self.load_rfr_message_index()
+            if self.rfr_database_manager.get_indexed_rfr_message_roles(payload.guild_id, payload.channel_id,
+                                                                       payload.message_id) is None:
                 return
             member_role = await self.get_role_member_info(payload.emoji, payload.guild_id,
                                                           payload.channel_id,
-                                                          payload.message_id, payload.user_id)
+                                                          payload.message_id, payload.user_id,
+                                                          member=payload.member)
             if not member_role or member_role[0].bot:
                 return
             await member_role[0].remove_roles(member_role[1])
@@ -771,10 +974,10 @@ class ReactForRole(commands.Cog):
         :param member: Member to check rfr perms for
         :return: True if member has one of the required roles, or if there are no required roles. False otherwise
         """
-        required_roles: List[int] = self.rfr_database_manager.get_guild_rfr_required_roles(member.guild.id)
-        if not required_roles or len(required_roles) == 0:
+        required_roles: FrozenSet[int] = self.rfr_database_manager.get_guild_rfr_required_role_set(member.guild.id)
+        if not required_roles:
             return True
-        return any(x in required_roles for x in [y.id for y in member.roles])
+        return not required_roles.isdisjoint(role.id for role in member.roles)
 
     async def get_rfr_message_from_prompts(self, ctx: commands.Context) -> Tuple[discord.Message, discord.TextChannel]:
         """
@@ -800,56 +1003,42 @@ class ReactForRole(commands.Cog):
         return msg, channel
 
     async def get_role_member_info(self, emoji_reacted: discord.PartialEmoji, guild_id: int,
-                                   channel_id: int, message_id: int, user_id: int) -> Optional[
+                                   channel_id: int, message_id: int, user_id: int,
+                                   member: Optional[discord.Member] = None) -> Optional[
         Tuple[discord.Member, discord.Role]]:
         """
         Gets the role that should be added/removed to/from a Member on reacting to a known RFR message, and works out
-        which Member reacted.
+        which Member reacted. The role is looked up in the RFR message index, so neither the database nor the message
+        is read, and the member and role by ID, so the cost doesn't grow with the size of the guild.
         :param emoji_reacted: Emoji of the raw reaction payload
-        :param emoji_role_id: DB key identifying specific RFR message in a Guild
         :param guild_id: ID of the guild this event occurred in
         :param channel_id: ID of the channel that the message was in
         :param message_id: ID of the message that was reacted to
         :param user_id: ID of the user who reacted
+        :param member: The Member who reacted if the gateway sent it with the payload, otherwise looked up by user_id
         :return: Optional 2-Tuple (member, role) where member is the Member that reacted, and Role is the role that
         should be given/taken away. If a role or member couldn't be found, returns None instead.
         """
 
         guild: discord.Guild = self.bot.get_guild(guild_id)
-        member: discord.Member = discord.utils.get(guild.members, id=user_id)
-        if not member:
-            return
-        channel: discord.TextChannel = discord.utils.get(guild.text_channels, id=channel_id)
-        if not channel:
+        if not guild:
             return
-        message: discord.Message = await channel.fetch_message(message_id)
-        if not message:
+        if member is None:
+            member = guild.get_member(user_id)
+        if not member:
             return
-        embed: discord.Embed = self.get_embed_from_message(message)
-
-        if emoji_reacted.is_unicode_emoji():
-            rep = emoji.demojize(emoji_reacted.name)
-            field = await self.get_field_by_emoji(embed, rep)
-            if not field:
-                return
-            role_str: str = field
-            if not role_str:
-                return
-            role: discord.Role = discord.utils.get(guild.roles, mention=role_str.lstrip().rstrip())
-            if not role:
-                return
-        elif emoji_reacted.is_custom_emoji():
-            rep = str(emoji_reacted)
-            field = await self.get_field_by_emoji(embed, rep)
-            if not field:
-                return
-            role_str = field
-            role: discord.Role = discord.utils.get(guild.roles, mention=role_str.lstrip().rstrip())
-        else:
+        emoji_roles = self.rfr_database_manager.get_indexed_rfr_message_roles(guild_id, channel_id, message_id)
+        if emoji_roles is None:
             KoalaBot.logger.error(
                 f"ReactForRole: Database error, guild {guild_id} has no entry in rfr database for message_id "
                 f"{message_id} in channel_id {channel_id}. Please check this.")
             return
+        role_id = emoji_roles.get(rfr_reaction_key(emoji_reacted))
+        if not role_id:
+            return
+        role: discord.Role = guild.get_role(role_id)
+        if not role:
+            return
         return member, role
 
     async def parse_emoji_and_role_input_str(self, ctx: commands.Context, input_str: str, remaining_slots: int) -> List[
@@ -936,7 +1125,7 @@ class ReactForRole(commands.Cog):
         :return:
         """
         #  Get the @everyone role.
-        role: discord.Role = discord.utils.get(guild.roles, id=guild.id)
+        role: discord.Role = guild.default_role
         overwrite: discord.PermissionOverwrite = discord.PermissionOverwrite()
         overwrite.update(add_reactions=False)
         await channel.set_permissions(role, overwrite=overwrite)
@@ -1028,6 +1217,135 @@ class ReactForRole(commands.Cog):
             return field.value
 
 
+class RFRBulkOperation:
+    """
+    An operation run over many rfr messages of a guild, e.g. editing every rfr embed. Messages are fetched and edited
+    concurrently, with at most max_concurrent at once, and progress is shown in a single status message that is edited
+    in place. Failed requests are retried with a backoff, and messages that still fail are kept so that running the
+    operation again resumes it on just those.
+    """
+
+    def __init__(self, name: str, operation: Callable[[discord.Message], Awaitable[Any]],
+                 rfr_messages: Iterable[Tuple[int, int]], max_concurrent: int = RFR_MAX_CONCURRENT_REQUESTS,
+                 max_attempts: int = RFR_BULK_MAX_ATTEMPTS, retry_delay: float = RFR_BULK_RETRY_DELAY,
+                 status_interval: float = RFR_BULK_STATUS_INTERVAL):
+        """
+        Initialises the class variables
+        :param name: Name of the operation, shown in the status message
+        :param operation: Coroutine function run on each fetched rfr message, returning False if it isn't one it can
+        work on
+        :param rfr_messages: (channel ID, message ID) of each rfr message to run on
+        :param max_concurrent: Most messages to work on at once
+        :param max_attempts: Most attempts at each message before it counts as failed
+        :param retry_delay: Seconds before the first retry, doubled each retry after
+        :param status_interval: Least seconds between edits of the status message
+        """
+        self.name = name
+        self.operation = operation
+        self.pending: List[Tuple[int, int]] = list(dict.fromkeys(rfr_messages))
+        self.max_concurrent = max_concurrent
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.status_interval = status_interval
+        self.total = 0
+        self.done = 0
+        # (channel ID, message ID) -> reason, of messages worth retrying and of messages that are gone or not rfr
+        # messages
+        self.failed: Dict[Tuple[int, int], str] = {}
+        self.missing: Dict[Tuple[int, int], str] = {}
+        self.status_message: Optional[discord.Message] = None
+        self.status_updated = 0.0
+
+    def get_status(self, finished: bool = False) -> str:
+        """
+        Gets the progress of the operation as the content of its status message
+        :param finished: Whether the operation has finished
+        :return: The status message content
+        """
+        status = f"{'Finished' if finished else 'Running'} {self.name} on rfr messages: {self.done}/{self.total} done"
+        if self.failed:
+            status += f", {len(self.failed)} failed"
+        if self.missing:
+            status += f", {len(self.missing)} skipped as missing or not rfr messages"
+        if finished and self.failed:
+            status += f". Use {KoalaBot.COMMAND_PREFIX}rfr edit resume to retry the ones that failed."
+        return status + "."
+
+    async def update_status(self, finished: bool = False):
+        """
+        Edits the status message to show the progress, at most once every status_interval seconds until finished
+        :param finished: Whether the operation has finished
+        :return:
+        """
+        now = time.monotonic()
+        if not finished and now - self.status_updated < self.status_interval:
+            return
+        self.status_updated = now
+        try:
+            await self.status_message.edit(content=self.get_status(finished))
+        except discord.HTTPException as e:
+            KoalaBot.logger.warning(f"ReactForRole: Couldn't update the status of {self.name}: {e}")
+
+    async def run_message(self, guild: discord.Guild, channel_id: int, message_id: int):
+        """
+        Fetches an rfr message and runs the operation on it, retrying with a backoff if a request fails
+        :param guild: Guild of the rfr message
+        :param channel_id: Channel ID of the rfr message
+        :param message_id: Message ID of the rfr message
+        :return:
+        """
+        key = (channel_id, message_id)
+        channel: discord.TextChannel = guild.get_channel(channel_id)
+        if not channel:
+            self.missing[key] = "channel not found"
+            return
+        for attempt in range(self.max_attempts):
+            try:
+                msg: discord.Message = await channel.fetch_message(message_id)
+                if await self.operation(msg) is False:
+                    self.missing[key] = "not an rfr message"
+                else:
+                    self.done += 1
+                return
+            except discord.NotFound:
+                self.missing[key] = "message not found"
+                return
+            except Exception as e:
+                retry = isinstance(e, (discord.HTTPException, asyncio.TimeoutError, aiohttp.ClientError)) and \
+                    not isinstance(e, discord.Forbidden)
+                if not retry or attempt + 1 == self.max_attempts:
+                    KoalaBot.logger.error(f"ReactForRole: {self.name} failed on message {message_id} in channel "
+                                          f"{channel_id}, guild {guild.id}: {e}")
+                    self.failed[key] = str(e)
+                    return
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    async def run(self, guild: discord.Guild, status_channel: discord.TextChannel) -> bool:
+        """
+        Runs the operation on the pending rfr messages, showing its progress in a status message
+        :param guild: Guild of the rfr messages
+        :param status_channel: Channel to send the status message in
+        :return: True if the operation finished on every message, False if some failed and can be resumed
+        """
+        self.total = len(self.pending)
+        self.done = 0
+        self.failed = {}
+        self.missing = {}
+        self.status_message = await status_channel.send(self.get_status())
+        self.status_updated = time.monotonic()
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        async def limited(channel_id: int, message_id: int):
+            async with semaphore:
+                await self.run_message(guild, channel_id, message_id)
+            await self.update_status()
+
+        await asyncio.gather(*(limited(channel_id, message_id) for channel_id, message_id in self.pending))
+        self.pending = list(self.failed)
+        await self.update_status(finished=True)
+        return not self.pending
+
+
 class ReactForRoleDBManager:
     """
     A class for interacting with the KoalaBot ReactForRole database
@@ -1035,6 +1353,14 @@ class ReactForRoleDBManager:
 
     def __init__(self, database_manager: KoalaDBManager):
         self.database_manager: KoalaDBManager.KoalaDBManager = database_manager
+        # guild_id -> (channel_id, message_id) -> emoji key -> role_id, None until loaded
+        self.rfr_message_index: Optional[Dict[int, Dict[Tuple[int, int], Dict[str, int]]]] = None
+        # emoji_role_id -> (guild_id, channel_id, message_id)
+        self.rfr_message_keys: Dict[int, Tuple[int, int, int]] = {}
+        self.index_lock = threading.RLock()
+        # guild_id -> role IDs required to use rfr, loaded as needed
+        self.required_roles: Dict[int, FrozenSet[int]] = {}
+        self.required_roles_versions: Dict[int, int] = {}
 
     def get_parent_database_manager(self):
         """
@@ -1094,6 +1420,13 @@ class ReactForRoleDBManager:
         self.database_manager.db_execute_commit(
             "INSERT INTO GuildRFRMessages  (guild_id, channel_id, message_id) VALUES (?, ?, ?);",
             args=[guild_id, channel_id, message_id])
+        if self.rfr_message_index is None:
+            return
+        rfr_message = self.get_rfr_message(guild_id, channel_id, message_id)
+        if rfr_message:
+            with self.index_lock:
+                if self.rfr_message_index is not None:
+                    self.index_rfr_message(*rfr_message)
 
     def add_rfr_message_emoji_role(self, emoji_role_id: int, emoji_raw: str, role_id: int):
         """
@@ -1106,6 +1439,13 @@ class ReactForRoleDBManager:
         self.database_manager.db_execute_commit(
             "INSERT INTO RFRMessageEmojiRoles (emoji_role_id, emoji_raw, role_id) VALUES (?, ?, ?);",
             args=[emoji_role_id, emoji_raw, role_id])
+        # Only index the combo if the insert didn't break a uniqueness constraint
+        if self.rfr_message_index is None or not self.get_rfr_reaction_role(emoji_role_id, emoji_raw, role_id):
+            return
+        with self.index_lock:
+            emoji_roles = self.get_indexed_emoji_roles(emoji_role_id)
+            if emoji_roles is not None:
+                emoji_roles[rfr_emoji_key(emoji_raw)] = role_id
 
     def remove_rfr_message_emoji_role(self, emoji_role_id: int, emoji_raw: str = None, role_id: int = None):
         """
@@ -1124,6 +1464,15 @@ class ReactForRoleDBManager:
             self.database_manager.db_execute_commit(
                 "DELETE FROM RFRMessageEmojiRoles WHERE emoji_role_id = ? AND emoji_raw = ?;",
                 args=[emoji_role_id, emoji_raw])
+        with self.index_lock:
+            emoji_roles = self.get_indexed_emoji_roles(emoji_role_id)
+            if emoji_roles is None:
+                return
+            if not emoji_raw:
+                for key in [key for key, indexed_role_id in emoji_roles.items() if indexed_role_id == role_id]:
+                    del emoji_roles[key]
+            else:
+                emoji_roles.pop(rfr_emoji_key(emoji_raw), None)
 
     def remove_rfr_message_emoji_roles(self, emoji_role_id: int):
         """
@@ -1133,6 +1482,10 @@ class ReactForRoleDBManager:
         """
         self.database_manager.db_execute_commit(
             "DELETE FROM RFRMessageEmojiRoles WHERE emoji_role_id = ?;", args=[emoji_role_id])
+        with self.index_lock:
+            emoji_roles = self.get_indexed_emoji_roles(emoji_role_id)
+            if emoji_roles is not None:
+                emoji_roles.clear()
 
     def remove_rfr_message(self, guild_id: int, channel_id: int, message_id: int):
         """
@@ -1150,6 +1503,86 @@ class ReactForRoleDBManager:
         self.database_manager.db_execute_commit(
             "DELETE FROM GuildRFRMessages WHERE guild_id = ? AND channel_id = ? AND message_id = ?;",
             args=[guild_id, channel_id, message_id])
+        with self.index_lock:
+            self.rfr_message_keys.pop(emoji_role_id[3], None)
+            if self.rfr_message_index is not None:
+                guild_rfr_messages = self.rfr_message_index.get(guild_id, {})
+                guild_rfr_messages.pop((channel_id, message_id), None)
+                if not guild_rfr_messages:
+                    self.rfr_message_index.pop(guild_id, None)
+
+    def load_rfr_message_index(self):
+        """
+        Loads every rfr message and its emoji-role combos into memory in one query, so reactions can be handled
+        without reading the database. The index is kept up to date by the add/remove methods of this class. If the
+        query fails the index is left unloaded, and the cog retries the load (see ReactForRole.load_rfr_message_index).
+        """
+        rows: List[Tuple[int, int, int, int, Optional[str], Optional[int]]] = self.database_manager.db_execute_select(
+            "SELECT GuildRFRMessages.guild_id, GuildRFRMessages.channel_id, GuildRFRMessages.message_id, "
+            "GuildRFRMessages.emoji_role_id, RFRMessageEmojiRoles.emoji_raw, RFRMessageEmojiRoles.role_id "
+            "FROM GuildRFRMessages LEFT JOIN RFRMessageEmojiRoles "
+            "ON GuildRFRMessages.emoji_role_id = RFRMessageEmojiRoles.emoji_role_id;")
+        if rows is None:
+            KoalaBot.logger.error("ReactForRole: Couldn't load the rfr message index, it will be retried")
+            return
+        with self.index_lock:
+            self.rfr_message_index = {}
+            self.rfr_message_keys = {}
+            for guild_id, channel_id, message_id, emoji_role_id, emoji_raw, role_id in rows:
+                emoji_roles = self.index_rfr_message(guild_id, channel_id, message_id, emoji_role_id)
+                if emoji_raw is not None:
+                    emoji_roles[rfr_emoji_key(emoji_raw)] = role_id
+
+    def index_rfr_message(self, guild_id: int, channel_id: int, message_id: int, emoji_role_id: int) -> Dict[str, int]:
+        """
+        Adds an rfr message to the index if it isn't in it already. Callers must hold index_lock.
+        :param guild_id: Guild ID of the rfr message
+        :param channel_id: Channel ID of the rfr message
+        :param message_id: Message ID of the rfr message
+        :param emoji_role_id: unique ID/key of the rfr message
+        :return: The indexed emoji key -> role ID combos of the rfr message
+        """
+        self.rfr_message_keys[emoji_role_id] = (guild_id, channel_id, message_id)
+        return self.rfr_message_index.setdefault(guild_id, {}).setdefault((channel_id, message_id), {})
+
+    def get_indexed_emoji_roles(self, emoji_role_id: int) -> Optional[Dict[str, int]]:
+        """
+        Gets the indexed emoji-role combos of an rfr message from its emoji_role_id. Callers must hold index_lock.
+        :param emoji_role_id: unique ID/key of the rfr message
+        :return: The emoji key -> role ID combos of the rfr message, or None if it isn't indexed
+        """
+        if self.rfr_message_index is None or emoji_role_id not in self.rfr_message_keys:
+            return None
+        guild_id, channel_id, message_id = self.rfr_message_keys[emoji_role_id]
+        return self.rfr_message_index.get(guild_id, {}).get((channel_id, message_id))
+
+    def get_indexed_rfr_message_roles(self, guild_id: int, channel_id: int, message_id: int) -> Optional[
+            Dict[str, int]]:
+        """
+        Gets the emoji-role combos of an rfr message from the in-memory index
+        :param guild_id: Guild ID of the rfr message
+        :param channel_id: Channel ID of the rfr message
+        :param message_id: Message ID of the rfr message
+        :return: Emoji key (see rfr_emoji_key) -> role ID of the rfr message, or None if it isn't an rfr message or the
+        index isn't loaded
+        """
+        with self.index_lock:
+            if self.rfr_message_index is None:
+                return None
+            emoji_roles = self.rfr_message_index.get(guild_id, {}).get((channel_id, message_id))
+            return None if emoji_roles is None else dict(emoji_roles)
+
+    def get_indexed_guild_rfr_messages(self, guild_id: int) -> Dict[Tuple[int, int], Dict[str, int]]:
+        """
+        Gets every rfr message in a guild from the in-memory index
+        :param guild_id: ID of the guild
+        :return: (channel ID, message ID) -> emoji key -> role ID of each rfr message in the guild, empty if the index
+        couldn't be loaded
+        """
+        with self.index_lock:
+            if self.rfr_message_index is None:
+                return {}
+            return {key: dict(emoji_roles) for key, emoji_roles in self.rfr_message_index.get(guild_id, {}).items()}
 
     def get_rfr_message(self, guild_id: int, channel_id: int, message_id: int) -> Optional[Tuple[int, int, int, int]]:
         """
@@ -1249,6 +1682,7 @@ class ReactForRoleDBManager:
         """
         self.database_manager.db_execute_commit("INSERT INTO GuildRFRRequiredRoles VALUES (?,?);",
                                                 args=[guild_id, role_id])
+        self.invalidate_guild_rfr_required_roles(guild_id)
 
     def remove_guild_rfr_required_role(self, guild_id: int, role_id: int):
         """
@@ -1259,6 +1693,7 @@ class ReactForRoleDBManager:
         """
         self.database_manager.db_execute_commit("DELETE FROM GuildRFRRequiredRoles WHERE guild_id = ? AND role_id = ?",
                                                 args=[guild_id, role_id])
+        self.invalidate_guild_rfr_required_roles(guild_id)
 
     def get_guild_rfr_required_roles(self, guild_id) -> List[int]:
         """
@@ -1273,6 +1708,43 @@ class ReactForRoleDBManager:
             return []
         return role_ids
 
+    def get_cached_guild_rfr_required_roles(self, guild_id: int) -> Optional[FrozenSet[int]]:
+        """
+        Gets the role IDs required to use rfr functionality in a guild if they are cached, without touching the database
+        :param guild_id: guild ID
+        :return: Set of role IDs, or None if they aren't cached
+        """
+        with self.index_lock:
+            return self.required_roles.get(guild_id)
+
+    def get_guild_rfr_required_role_set(self, guild_id: int) -> FrozenSet[int]:
+        """
+        Gets the role IDs required to use rfr functionality in a guild, loading them into the cache if needed
+        :param guild_id: guild ID
+        :return: Set of role IDs
+        """
+        with self.index_lock:
+            required_roles = self.required_roles.get(guild_id)
+            if required_roles is not None:
+                return required_roles
+            version = self.required_roles_versions.get(guild_id, 0)
+        required_roles = frozenset(self.get_guild_rfr_required_roles(guild_id))
+        with self.index_lock:
+            # Only cache it if the required roles haven't changed while it loaded
+            if self.required_roles_versions.get(guild_id, 0) == version:
+                self.required_roles[guild_id] = required_roles
+        return required_roles
+
+    def invalidate_guild_rfr_required_roles(self, guild_id: int):
+        """
+        Forgets the cached required roles of a guild
+        :param guild_id: guild ID
+        :return:
+        """
+        with self.index_lock:
+            self.required_roles_versions[guild_id] = self.required_roles_versions.get(guild_id, 0) + 1
+            self.required_roles.pop(guild_id, None)
+
 
 def setup(bot: KoalaBot) -> None:
     """
@@ -10,6 +10,8 @@ import os
 import asyncio
 import time
 import re
+import threading
+from collections import deque
 
 # Libs
 from discord.ext import commands, tasks
@@ -20,6 +22,13 @@ import KoalaBot
 from utils.KoalaColours import *
 from utils.KoalaUtils import error_embed, is_channel_in_guild, extract_id
 from utils.KoalaDBManager import KoalaDBManager
+from utils.KoalaRegexSandbox import RegexSandbox, RegexSandboxStoppedError, RegexTimeoutError, \
+    check_regex_complexity
+
+# Constants
+REGEX_SANDBOX = eval(os.environ.get('TEXT_FILTER_REGEX_SANDBOX', "False"))
+FILTER_SEVERITY = {"risky": 1, "banned": 2}
+REGEX_BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
 
 
 def text_filter_is_enabled(ctx):
@@ -51,6 +60,18 @@ class TextFilter(commands.Cog, name="TextFilter"):
         database_manager.insert_extension("TextFilter", 0, True, True)
         self.tf_database_manager = TextFilterDBManager(database_manager, bot)
         self.tf_database_manager.create_tables()
+        self.async_db_manager = database_manager.async_manager
+        self.regex_sandbox = None
+        if REGEX_SANDBOX:
+            self.regex_sandbox = RegexSandbox()
+            self.regex_sandbox.start()
+
+    def cog_unload(self):
+        """
+        Stops the regex sandbox when the cog is unloaded
+        """
+        if self.regex_sandbox is not None:
+            self.regex_sandbox.close()
 
     @commands.command(name="filter", aliases=["filter_word"])
     @commands.check(KoalaBot.is_admin)
@@ -93,11 +114,18 @@ class TextFilter(commands.Cog, name="TextFilter"):
         if too_many_arguments is None and type_exists(filter_type):
             try:
                 re.compile(regex)
+            except:
+                raise Exception(error)
+            problem = check_regex_complexity(regex)
+            if problem:
+                raise Exception(f"This regex has not been filtered because {problem}, which could make it too slow "
+                                f"to check messages with. Please try a simpler regex.")
+            try:
                 await self.filter_text(ctx, regex, filter_type, True)
                 await ctx.channel.send("*" + regex + "* has been filtered as **"+filter_type+"**.")
                 return
             except:
-                raise Exception(error)    
+                raise Exception(error)
         raise Exception(error)
 
     @commands.command(name="unfilter", aliases=["unfilter_word"])
@@ -281,20 +309,37 @@ class TextFilter(commands.Cog, name="TextFilter"):
                 message.content.startswith(KoalaBot.COMMAND_PREFIX+"unfilter"):
             return
         elif str(message.channel.type) == 'text' and message.channel.guild is not None:
-            censor_list = self.tf_database_manager.get_filtered_text_for_guild(message.channel.guild.id)
-            for word, filter_type, is_regex in censor_list:
-                if (word in message.content or (is_regex == '1' and re.search(word, message.content))) and not self.is_ignored(message):
-                    if filter_type == "risky":
-                        await message.author.send("Watch your language! Your message: '*"+message.content+"*' in " +
-                                                  message.channel.mention+" contains a 'risky' word. "
-                                                  "This is a warning.")
-                        return
-                    elif filter_type == "banned":
-                        await message.author.send("Watch your language! Your message: '*"+message.content+"*' in " +
-                                                  message.channel.mention+" has been deleted by KoalaBot.")
-                        await self.send_to_moderation_channels(message)
-                        await message.delete()
-                        return
+            guild_id = message.channel.guild.id
+            ignore_lists = self.tf_database_manager.get_cached_ignore_lists(guild_id)
+            if ignore_lists is None:
+                ignore_lists = await self.async_db_manager.run(self.tf_database_manager.get_ignore_lists, guild_id)
+            if message.channel.id in ignore_lists.channels or message.author.id in ignore_lists.users:
+                return
+            engine = self.tf_database_manager.get_cached_filter_engine(guild_id)
+            if engine is None:
+                engine = await self.async_db_manager.run(self.tf_database_manager.get_filter_engine, guild_id)
+            if self.regex_sandbox is None:
+                filter_type = engine.most_severe(message.content)
+            else:
+                try:
+                    filter_type = await engine.most_severe_sandboxed(message.content, self.regex_sandbox)
+                except RegexTimeoutError:
+                    await self.send_regex_timeout_to_moderation_channels(message)
+                    filter_type = engine.most_severe_literal(message.content)
+                except RegexSandboxStoppedError as err:
+                    KoalaBot.logger.error(f"TextFilter: Regex filters skipped on message {message.id}: {err}")
+                    filter_type = engine.most_severe_literal(message.content)
+            if filter_type is None:
+                return
+            if filter_type == "risky":
+                await message.author.send("Watch your language! Your message: '*"+message.content+"*' in " +
+                                          message.channel.mention+" contains a 'risky' word. "
+                                          "This is a warning.")
+            elif filter_type == "banned":
+                await message.author.send("Watch your language! Your message: '*"+message.content+"*' in " +
+                                          message.channel.mention+" has been deleted by KoalaBot.")
+                await self.send_to_moderation_channels(message)
+                await message.delete()
 
     def build_channel_list(self, channels, embed):
         """
@@ -334,9 +379,8 @@ class TextFilter(commands.Cog, name="TextFilter"):
         :param message: The newly received message
         :return boolean if should be ignored or not:
         """
-        ignore_list_users = self.tf_database_manager.get_ignore_list_users(message.guild.id)
-        ignore_list_channels = self.tf_database_manager.get_ignore_list_channels(message.guild.id)
-        return message.channel.id in ignore_list_channels or message.author.id in ignore_list_users
+        ignore_lists = self.tf_database_manager.get_ignore_lists(message.guild.id)
+        return message.channel.id in ignore_lists.channels or message.author.id in ignore_lists.users
 
     async def filter_text(self, ctx, text, filter_type, is_regex):
         """
@@ -368,17 +412,38 @@ class TextFilter(commands.Cog, name="TextFilter"):
         channels = self.tf_database_manager.get_mod_channel(guild_id)
         return len(channels) > 0
 
+    async def get_moderation_channels(self, guild_id):
+        """
+        Gets the mod channels of a guild, reading the database off the event loop
+
+        :param guild_id: The guild to retrieve mod channels from
+        :return: The mod channels, empty if none are available
+        """
+        rows = await self.async_db_manager.run(self.tf_database_manager.get_mod_channel, guild_id)
+        if not rows:
+            return []
+        channels = [self.bot.get_channel(id=int(row[0])) for row in rows]
+        return [channel for channel in channels if channel is not None]
+
     async def send_to_moderation_channels(self, message):
         """
         Send details about deleted message to mod channels
 
         :param message: The message in question which is being deleted
         """
-        if self.is_moderation_channel_available(message.guild.id):
-            channels = self.tf_database_manager.get_mod_channel(message.guild.id)
-            for each_channel in channels:
-                channel = self.bot.get_channel(id=int(each_channel[0]))
-                await channel.send(embed=build_moderation_deleted_embed(message))
+        for channel in await self.get_moderation_channels(message.guild.id):
+            await channel.send(embed=build_moderation_deleted_embed(message))
+
+    async def send_regex_timeout_to_moderation_channels(self, message):
+        """
+        Tell mod channels a message could not be checked against the regex filters in time
+
+        :param message: The message which timed out
+        """
+        KoalaBot.logger.warning(f"TextFilter: Regex filters timed out on message {message.id} "
+                                f"in guild {message.guild.id}")
+        for channel in await self.get_moderation_channels(message.guild.id):
+            await channel.send(embed=build_moderation_regex_timeout_embed(message))
 
     def get_list_of_words(self, ctx):
         """
@@ -506,6 +571,235 @@ def build_moderation_deleted_embed(message):
     return embed
 
 
+def build_moderation_regex_timeout_embed(message):
+    """
+    Builds the embed that is sent when checking a message against the regex filters takes too long
+
+    :param message: the message object which timed out
+    :return embed with information about the message:
+    """
+    embed = create_default_embed(message)
+    embed.title = "Koala Moderation - Regex Filter Timed Out"
+    embed.add_field(name="Reason", value="A regex filter took too long to check this message, please review your "
+                                         "regex filters")
+    embed.add_field(name="User", value=message.author.mention)
+    embed.add_field(name="Channel", value=message.channel.mention)
+    embed.add_field(name="Message", value=message.content)
+    embed.add_field(name="Timestamp", value=message.created_at)
+    return embed
+
+
+class AhoCorasick:
+    """
+    An Aho-Corasick automaton, finding every occurrence of a set of words in a single pass over a text
+    """
+
+    def __init__(self, words):
+        """
+        Builds the automaton
+
+        :param words: The words to search for, their position in this list is what search reports
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        for index, word in enumerate(words):
+            if not word:
+                continue
+            node = 0
+            for char in word:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.output[node].add(index)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] |= self.output[self.fail[child]]
+
+    def search(self, text):
+        """
+        Finds which words occur in a text
+
+        :param text: The text to search
+        :return: A set of the indexes of the words found
+        """
+        found = set()
+        goto, fail, output = self.goto, self.fail, self.output
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found |= output[node]
+        return found
+
+
+class FilterEngine:
+    """
+    The compiled filter rules of a guild
+
+    Every rule's text is matched literally by one Aho-Corasick automaton, and regex rules of each filter type are
+    joined into a single pre-compiled alternation, so a message is checked with one pass per filter type.
+    """
+
+    def __init__(self, rules):
+        """
+        Compiles the rules
+
+        :param rules: A list of (filtered_text, filter_type, is_regex) as from get_filtered_text_for_guild
+        """
+        self.rules = list(rules)
+        self.literals = AhoCorasick([text for text, _, _ in self.rules])
+        self.regexes = {}
+        for filter_type in {filter_type for _, filter_type, _ in self.rules}:
+            indexes = [i for i, (_, rule_type, is_regex) in enumerate(self.rules)
+                       if rule_type == filter_type and is_regex == '1']
+            self.regexes[filter_type] = self.compile_regexes(indexes)
+
+    def compile_regexes(self, indexes):
+        """
+        Compiles regex rules into as few patterns as possible
+
+        Patterns using backreferences would refer to the wrong group once combined, and global inline flags such as
+        (?i) would apply to every other rule, so these, and any that fail to combine, are compiled on their own.
+
+        :param indexes: The indexes of the regex rules to compile
+        :return: A list of (compiled pattern, {group name: rule index}) pairs
+        """
+        combinable, compiled = [], []
+        for index in indexes:
+            pattern = self.rules[index][0]
+            try:
+                if REGEX_BACKREFERENCE.search(pattern):
+                    raise re.error("backreference")
+                if re.compile(pattern).flags & ~re.UNICODE:
+                    raise re.error("global flags")
+                re.compile(f"(?P<r{index}>{pattern})")
+                combinable.append(index)
+            except re.error:
+                try:
+                    compiled.append((re.compile(pattern), {None: index}))
+                except re.error:
+                    KoalaBot.logger.error(f"TextFilter: Invalid regex rule skipped: {pattern}")
+        if combinable:
+            try:
+                combined = re.compile("|".join(f"(?P<r{index}>{self.rules[index][0]})" for index in combinable))
+                compiled.append((combined, {f"r{index}": index for index in combinable}))
+            except re.error:
+                compiled.extend((re.compile(self.rules[index][0]), {None: index}) for index in combinable)
+        return compiled
+
+    def match(self, content):
+        """
+        Finds the rules matching a message
+
+        :param content: The message content
+        :return: A list of the (filtered_text, filter_type, is_regex) rules that matched
+        """
+        matched = self.literals.search(content)
+        for compiled in self.regexes.values():
+            for pattern, groups in compiled:
+                for found in pattern.finditer(content):
+                    matched.add(self.get_rule_index(found, groups))
+        return [self.rules[index] for index in sorted(matched)]
+
+    def most_severe(self, content):
+        """
+        Finds the most severe filter type matched by a message, stopping as soon as it is known
+
+        :param content: The message content
+        :return: The filter type, or None if no rule matched
+        """
+        literal_types = {self.rules[index][1] for index in self.literals.search(content)}
+        for filter_type in self.by_severity():
+            if filter_type in literal_types or \
+                    any(pattern.search(content) for pattern, _ in self.regexes[filter_type]):
+                return filter_type
+        return None
+
+    def most_severe_literal(self, content):
+        """
+        Finds the most severe filter type matched by a message, ignoring the regex rules
+
+        :param content: The message content
+        :return: The filter type, or None if no rule matched
+        """
+        literal_types = {self.rules[index][1] for index in self.literals.search(content)}
+        return next((filter_type for filter_type in self.by_severity() if filter_type in literal_types), None)
+
+    async def most_severe_sandboxed(self, content, sandbox):
+        """
+        Finds the most severe filter type matched by a message, running the regex rules in a sandbox
+
+        Only regexes of filter types more severe than the most severe literal match are run, in one sandbox call.
+
+        :param content: The message content
+        :param sandbox: The RegexSandbox to run regex rules in
+        :return: The filter type, or None if no rule matched
+        :raises RegexTimeoutError: If the regex rules took longer than the sandbox's time budget
+        """
+        literal_type = self.most_severe_literal(content)
+        patterns = []
+        for filter_type in self.by_severity():
+            if filter_type == literal_type:
+                break
+            patterns.extend((filter_type, pattern.pattern) for pattern, _ in self.regexes[filter_type])
+        if patterns:
+            return await sandbox.search(patterns, content) or literal_type
+        return literal_type
+
+    def by_severity(self):
+        """
+        Gets the filter types of the rules, most severe first
+
+        :return: A list of filter types
+        """
+        return sorted(self.regexes, key=lambda filter_type: FILTER_SEVERITY.get(filter_type, 0), reverse=True)
+
+    @staticmethod
+    def get_rule_index(found, groups):
+        """
+        Gets the rule a regex match came from
+
+        :param found: The regex match
+        :param groups: The {group name: rule index} of the pattern that matched
+        :return: The rule index
+        """
+        if None in groups:
+            return groups[None]
+        if found.lastgroup in groups:
+            return groups[found.lastgroup]
+        return next(index for name, index in groups.items() if found.group(name) is not None)
+
+
+class IgnoreLists:
+    """
+    The IDs of the users and channels ignored by the text filter in a guild
+    """
+
+    def __init__(self, users, channels):
+        """
+        Initialises local variables
+
+        :param users: frozenset of ignored user IDs
+        :param channels: frozenset of ignored channel IDs
+        """
+        self.users = users
+        self.channels = channels
+
+
 class TextFilterDBManager:
     """
     A class for interacting with the Koala text filter database
@@ -520,6 +814,10 @@ class TextFilterDBManager:
         """
         self.database_manager = database_manager
         self.bot = bot_client
+        self.filter_engines = {}
+        self.ignore_lists = {}
+        self.cache_versions = {}
+        self.cache_lock = threading.Lock()
 
     def create_tables(self):
         """
@@ -584,7 +882,8 @@ class TextFilterDBManager:
                 "INSERT INTO TextFilter (filtered_text_id, guild_id, filtered_text, filter_type, is_regex)"
                 " VALUES (?,?,?,?,?)",
                 args=[ft_id, guild_id, filtered_text, filter_type, is_regex])
-            return 
+            self.invalidate_filter_engine(guild_id)
+            return
         raise Exception("Filtered word already exists")
             
     def remove_filter_text(self, guild_id, filtered_text):
@@ -599,6 +898,7 @@ class TextFilterDBManager:
         if self.does_word_exist(ft_id):
             self.database_manager.db_execute_commit(
                 "DELETE FROM TextFilter WHERE filtered_text_id = ?", args=[ft_id])
+            self.invalidate_filter_engine(guild_id)
             return
         raise Exception("Filtered word does not exist")
 
@@ -615,6 +915,7 @@ class TextFilterDBManager:
             self.database_manager.db_execute_commit(
                 "INSERT INTO TextFilterIgnoreList (ignore_id, guild_id, ignore_type, ignore) VALUES (?,?,?,?)",
                 args=[ignore_id, guild_id, ignore_type, ignore])
+            self.invalidate_cached(self.ignore_lists, guild_id)
             return
         raise Exception("Ignore already exists")
 
@@ -629,6 +930,7 @@ class TextFilterDBManager:
         if self.does_ignore_exist(ignore_id):
             self.database_manager.db_execute_commit(
                 "DELETE FROM TextFilterIgnoreList WHERE ignore_id=?", args=[ignore_id])
+            self.invalidate_cached(self.ignore_lists, guild_id)
             return
         raise Exception("Ignore does not exist")
 
@@ -645,6 +947,100 @@ class TextFilterDBManager:
             censor_list.append((row[2], row[3], str(row[4])))
         return censor_list
 
+    def get_cached_filter_engine(self, guild_id):
+        """
+        Gets the compiled filter rules of a guild if they are cached
+
+        :param guild_id: Guild ID to retrieve the filter engine of
+        :return: FilterEngine or None
+        """
+        return self.filter_engines.get(guild_id)
+
+    def get_filter_engine(self, guild_id):
+        """
+        Gets the compiled filter rules of a guild, compiling and caching them if needed
+
+        :param guild_id: Guild ID to retrieve the filter engine of
+        :return: FilterEngine
+        """
+        return self.get_cached(self.filter_engines, guild_id,
+                               lambda: FilterEngine(self.get_filtered_text_for_guild(guild_id)))
+
+    def invalidate_filter_engine(self, guild_id):
+        """
+        Forgets the compiled filter rules of a guild, so they are recompiled on next use
+
+        :param guild_id: Guild ID whose filter rules changed
+        """
+        self.invalidate_cached(self.filter_engines, guild_id)
+
+    def get_cached_ignore_lists(self, guild_id):
+        """
+        Gets the ignored users and channels of a guild if they are cached
+
+        :param guild_id: Guild ID to retrieve the ignore lists of
+        :return: IgnoreLists or None
+        """
+        return self.ignore_lists.get(guild_id)
+
+    def get_ignore_lists(self, guild_id):
+        """
+        Gets the ignored users and channels of a guild as sets of IDs, loading and caching them if needed
+
+        :param guild_id: Guild ID to retrieve the ignore lists of
+        :return: IgnoreLists
+        """
+        return self.get_cached(self.ignore_lists, guild_id, lambda: self.load_ignore_lists(guild_id))
+
+    def load_ignore_lists(self, guild_id):
+        """
+        Reads the ignored users and channels of a guild from the database
+
+        :param guild_id: Guild ID to retrieve the ignore lists of
+        :return: IgnoreLists
+        """
+        rows = self.database_manager.db_execute_select(
+            "SELECT ignore_type, ignore FROM TextFilterIgnoreList WHERE guild_id = ?", args=[guild_id])
+        users = frozenset(int(ignore) for ignore_type, ignore in rows if ignore_type == "user")
+        channels = frozenset(int(ignore) for ignore_type, ignore in rows if ignore_type == "channel")
+        return IgnoreLists(users, channels)
+
+    def get_cached(self, cache, guild_id, load):
+        """
+        Gets a guild's entry from one of the caches, loading it if needed
+
+        The loaded value is only cached if the entry was not invalidated while loading, so a concurrent change is
+        never hidden by a stale value.
+
+        :param cache: The cache dictionary
+        :param guild_id: Guild ID of the entry
+        :param load: A function loading the entry from the database
+        :return: The cached or loaded value
+        """
+        value = cache.get(guild_id)
+        if value is not None:
+            return value
+        key = (id(cache), guild_id)
+        with self.cache_lock:
+            version = self.cache_versions.get(key, 0)
+        value = load()
+        with self.cache_lock:
+            if self.cache_versions.get(key, 0) == version:
+                cache[guild_id] = value
+        return value
+
+    def invalidate_cached(self, cache, guild_id):
+        """
+        Forgets a guild's entry in one of the caches
+
+        :param cache: The cache dictionary
+        :param guild_id: Guild ID of the entry
+        """
+        key = (id(cache), guild_id)
+        with self.cache_lock:
+            self.cache_versions[key] = self.cache_versions.get(key, 0) + 1
+            cache.pop(guild_id, None)
+
     def get_ignore_list_channels(self, guild_id):
         """
         Get lists of ignored channels
@@ -9,12 +9,20 @@ Commented using reStructuredText (reST)
 
 # Built-in/Generic Imports
 import os
+import json
 import time
 import re
 import aiohttp
 import logging
 import random
 import sys
+import itertools
+import functools
+import math
+import hmac
+import hashlib
+import calendar
+from collections import OrderedDict, deque
 
 logging.basicConfig(filename='TwitchAlert.log')
 logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
@@ -27,6 +35,7 @@ from utils import KoalaDBManager
 
 # Libs
 import discord
+from aiohttp import web
 from discord.ext import commands, tasks
 from dotenv import load_dotenv
 import asyncio
@@ -39,10 +48,45 @@ TWITCH_ICON = "https://cdn3.iconfinder.com/data/icons/social-messaging-ui-color-
 TWITCH_CLIENT_ID = os.environ.get('TWITCH_TOKEN')
 TWITCH_SECRET = os.environ.get('TWITCH_SECRET')
 TWITCH_USERNAME_REGEX = "^[a-z0-9][a-z0-9_]{3,24}$"
+TWITCH_EVENTSUB_CALLBACK = os.environ.get('TWITCH_EVENTSUB_CALLBACK')
+TWITCH_EVENTSUB_SECRET = os.environ.get('TWITCH_EVENTSUB_SECRET')
+TWITCH_EVENTSUB_HOST = os.environ.get('TWITCH_EVENTSUB_HOST', "0.0.0.0")
+TWITCH_EVENTSUB_PORT = int(os.environ.get('TWITCH_EVENTSUB_PORT', 8080))
+TWITCH_EVENTSUB_PATH = "/eventsub"
+TWITCH_API_URL = os.environ.get('TWITCH_API_URL', "https://api.twitch.tv/helix")
+TWITCH_OAUTH_URL = os.environ.get('TWITCH_OAUTH_URL', "https://id.twitch.tv/oauth2/token")
+EVENTSUB_SUBSCRIPTION_TYPES = ("stream.online", "stream.offline")
+EVENTSUB_ACTIVE_STATUSES = ("enabled", "webhook_callback_verification_pending")
+EVENTSUB_MAX_MESSAGE_AGE = 10 * 60
+EVENTSUB_REMEMBERED_MESSAGES = 1000
 
 LOOP_CHECK_LIVE_DELAY = 1
-TEAMS_LOOP_CHECK_LIVE_DELAY = 1
+TWITCH_POLL_BUDGET = int(os.environ.get('TWITCH_POLL_BUDGET', 20))
+POLL_HOT_WINDOW = 6 * 60 * 60
+POLL_WARM_WINDOW = 7 * 24 * 60 * 60
+POLL_WARM_INTERVAL = 5 * 60
+POLL_COLD_INTERVAL = 15 * 60
+POLL_TYPICAL_HOUR_MIN_DAYS = 2
 REFRESH_TEAMS_DELAY = 5
+TWITCH_MAX_LOGINS_PER_REQUEST = 100
+TWITCH_MAX_CONCURRENT_REQUESTS = 8
+TWITCH_CONNECTION_LIMIT = 16
+TWITCH_DNS_CACHE_TTL = 300
+TWITCH_KEEPALIVE_TIMEOUT = 90
+TWITCH_RATE_LIMIT = 800
+TWITCH_RATE_LIMIT_PERIOD = 60
+TWITCH_MAX_ATTEMPTS = 5
+TWITCH_BACKOFF_BASE = 0.5
+TWITCH_BACKOFF_MAX = 30
+TWITCH_PRIORITY_STREAMS = 0
+TWITCH_PRIORITY_LOOKUP = 1
+TWITCH_PRIORITY_TEAMS = 2
+ALERT_MAX_CONCURRENT_REQUESTS = 10
+BULK_DELETE_MAX_AGE = 14 * 24 * 60 * 60 - 60 * 60
+BULK_DELETE_MAX_MESSAGES = 100
+TWITCH_USER_CACHE_TTL = 60 * 60
+TWITCH_GAME_CACHE_TTL = 24 * 60 * 60
+TWITCH_CACHE_MAX_SIZE = 4096
 
 # Variables
 
@@ -80,10 +124,14 @@ class TwitchAlert(commands.Cog):
         database_manager.insert_extension("TwitchAlert", 0, True, True)
         self.ta_database_manager = TwitchAlertDBManager(database_manager, bot)
         self.ta_database_manager.create_tables()
+        self.async_db_manager = database_manager.async_manager
         self.loop_thread = None
-        self.loop_team_thread = None
         self.running = False
         self.stop_loop = False
+        self.live_users = None
+        self.poll_scheduler = PollScheduler()
+        self.live_lock = asyncio.Lock()
+        self.eventsub = None
 
     @commands.command(name="twitchEditMsg", aliases=["edit_default_message"])
     @commands.check(KoalaBot.is_admin)
@@ -382,112 +430,335 @@ class TwitchAlert(commands.Cog):
             self.start_loops()
 
     def start_loops(self):
+        self.ta_database_manager.twitch_handler.open_session()
         self.loop_update_teams.start()
-        self.loop_check_team_live.start()
         self.loop_check_live.start()
         self.running = True
+        if TWITCH_EVENTSUB_CALLBACK and TWITCH_EVENTSUB_SECRET:
+            asyncio.ensure_future(self.start_eventsub()).add_done_callback(self.eventsub_started)
 
     def end_loops(self):
         self.loop_update_teams.cancel()
-        self.loop_check_team_live.cancel()
         self.loop_check_live.cancel()
         self.running = False
+        if self.eventsub is not None:
+            self.loop_sync_eventsub.cancel()
+            asyncio.ensure_future(self.eventsub.stop())
+            self.eventsub = None
+        if self.ta_database_manager.twitch_handler.session is not None:
+            asyncio.ensure_future(self.ta_database_manager.twitch_handler.close_session())
+
+    def cog_unload(self):
+        """
+        Stops the loops and closes the Twitch API session when the cog is unloaded
+        """
+        self.end_loops()
 
     @tasks.loop(minutes=LOOP_CHECK_LIVE_DELAY)
     async def loop_check_live(self):
         """
-        A loop that continually checks the live status of users and
-        sends alerts when online, removing them when offline
+        A loop that continually checks the live status of users followed individually or through a team, sending
+        alerts when they go live and removing them when they go offline. With EventSub enabled this reconciles any
+        notifications that were missed
         :return:
         """
-        start = time.time()
-        # logging.info("TwitchAlert: User Loop Started")
-        sql_find_users = "SELECT twitch_username " \
-                         "FROM UserInTwitchAlert " \
-                         "JOIN TwitchAlerts TA on UserInTwitchAlert.channel_id = TA.channel_id " \
-                         "JOIN (SELECT extension_id, guild_id FROM GuildExtensions " \
-                         "WHERE extension_id = 'TwitchAlert' OR extension_id = 'All') GE on TA.guild_id = GE.guild_id;"
-        users = self.ta_database_manager.database_manager.db_execute_select(sql_find_users)
-        usernames = []
-        for user in users:
-            if not re.search(TWITCH_USERNAME_REGEX, user[0]):
-                sql_remove_invalid_user = "DELETE FROM UserInTwitchAlert WHERE twitch_username = ?"
-                self.ta_database_manager.database_manager.db_execute_commit(sql_remove_invalid_user, args=[user[0]])
-            else:
-                usernames.append(user[0])
+        async with self.live_lock:
+            await self.check_live()
 
-        # user_streams = self.ta_database_manager.twitch_handler.get_streams_data(usernames)
-        if not usernames:
+    async def check_live(self):
+        """
+        Checks the live status of the users due to be polled, sending and removing alerts for users who went live or
+        offline
+        :return:
+        """
+        start = time.time()
+        alerts = await self.load_live_alerts()
+        if self.live_users is None:
+            # Users with an alert posted were live when the bot last ran
+            self.live_users = {username for username, user_alerts in alerts.items()
+                               if any(alert[1] is not None for alert in user_alerts)}
+            self.poll_scheduler.load(await self.async_db_manager.run(self.ta_database_manager.get_poll_states))
+        if not alerts and not self.live_users:
             return
 
-        user_streams = await self.ta_database_manager.twitch_handler.get_streams_data(usernames)
-        if user_streams is None:
-            return
+        polled = self.poll_scheduler.due_logins(alerts, self.live_users)
+        if polled:
+            streams_data = await self.ta_database_manager.twitch_handler.get_streams_data(polled)
+            if streams_data is None:
+                return
+        else:
+            streams_data = []
+        live_streams = {str.lower(stream_data.get("user_login")): stream_data for stream_data in streams_data
+                        if stream_data.get('type') == "live"}
+        self.poll_scheduler.record(polled, live_streams)
+
+        fan_out = AlertFanOut()
+        await self.post_live_alerts(list(live_streams.values()), alerts, fan_out)
+
+        # Deals with streams that went offline
+        # Live users are always polled, so any not found live went offline
+        offline_usernames = list(self.live_users.difference(live_streams))
+        if offline_usernames:
+            await self.ta_database_manager.delete_all_offline_streams(False, offline_usernames, fan_out=fan_out)
+            await self.ta_database_manager.delete_all_offline_streams(True, offline_usernames, fan_out=fan_out)
+        self.live_users = self.live_users.intersection(alerts).difference(polled).union(live_streams)
+        fan_out.log_latency("Live Loop")
+        await self.async_db_manager.run(self.ta_database_manager.save_poll_states, *self.poll_scheduler.changes())
 
-        # Deals with online streams
-        for streams_details in user_streams:
-            try:
-                if streams_details.get('type') == "live":
-                    current_username = str.lower(streams_details.get("user_login"))
-                    temp = usernames
-                    usernames.remove(current_username)
-                    if usernames == temp:
-                        logging.error(f"TwitchAlert: {streams_details.get('user_login')} not found in the user list {usernames}")
-
-                    sql_find_message_id = \
-                        "SELECT UserInTwitchAlert.channel_id, message_id, custom_message, default_message " \
-                        "FROM UserInTwitchAlert " \
-                        "JOIN TwitchAlerts TA on UserInTwitchAlert.channel_id = TA.channel_id " \
-                        "JOIN (SELECT extension_id, guild_id FROM GuildExtensions " \
-                        "WHERE extension_id = 'TwitchAlert' " \
-                        "  OR extension_id = 'All') GE on TA.guild_id = GE.guild_id " \
-                        "WHERE twitch_username = ?;"
-
-                    results = self.ta_database_manager.database_manager.db_execute_select(
-                        sql_find_message_id, args=[current_username])
-
-                    new_message_embed = None
-
-                    for result in results:
-                        channel_id = result[0]
-                        message_id = result[1]
-                        custom_message = result[2]
-                        channel_default_message = result[3]
-
-                        channel = self.bot.get_channel(id=channel_id)
-                        try:
-                            # If no Alert is posted
-                            if message_id is None:
-                                if new_message_embed is None:
-                                    if custom_message is not None:
-                                        message = custom_message
-                                    else:
-                                        message = channel_default_message
-
-                                    new_message_embed = await self.create_alert_embed(streams_details, message)
-
-                                if new_message_embed is not None and channel is not None:
-                                    new_message = await channel.send(embed=new_message_embed)
-                                    sql_update_message_id = """
-                                    UPDATE UserInTwitchAlert 
-                                    SET message_id = ? 
-                                    WHERE channel_id = ? 
-                                        AND twitch_username = ?"""
-                                    self.ta_database_manager.database_manager.db_execute_commit(
-                                        sql_update_message_id, args=[new_message.id, result[0], current_username])
-                        except discord.errors.Forbidden as err:
-                            logging.warning(f"TwitchAlert: {err}  Name: {channel} ID: {channel.id}")
-                            sql_remove_invalid_channel = "DELETE FROM TwitchAlerts WHERE channel_id = ?"
-                            self.ta_database_manager.database_manager.db_execute_commit(sql_remove_invalid_channel,
-                                                                                        args=[channel.id])
-            except Exception as err:
-                logging.error(f"TwitchAlert: User Loop error {err}")
-
-        # Deals with remaining offline streams
-        await self.ta_database_manager.delete_all_offline_streams(False, usernames)
         time_diff = time.time() - start
         if time_diff > 5:
-            logging.warning(f"TwitchAlert: User Loop Finished in > 5s | {time_diff}s")
+            logging.warning(f"TwitchAlert: Live Loop Finished in > 5s | {time_diff}s")
+
+    async def post_live_alerts(self, streams_data, alerts, fan_out):
+        """
+        Sends the alerts still to be posted for live streams, saving the new message IDs in one transaction
+        :param streams_data: The twitch stream data of live streams
+        :param alerts: An index of twitch username -> alerts, as built by load_live_alerts
+        :param fan_out: The AlertFanOut limiting how many messages are sent at once
+        :return:
+        """
+        # Only users with an alert still to post need any work, which are the users who just went live and the
+        # users live while a new alert was added
+        new_streams = [stream_data for stream_data in streams_data
+                       if any(alert[1] is None for alert in alerts.get(str.lower(stream_data.get("user_login")), []))]
+        if not new_streams:
+            return
+        await self.prefetch_alert_details(new_streams, alerts)
+
+        sql_update_user_message_id = """
+        UPDATE UserInTwitchAlert 
+        SET message_id = ? 
+        WHERE channel_id = ? 
+            AND twitch_username = ?"""
+        sql_update_team_message_id = """
+        UPDATE UserInTwitchTeam 
+        SET message_id = ?
+        WHERE team_twitch_alert_id = ?
+        AND twitch_username = ?"""
+        updates = []
+        results = await asyncio.gather(*(
+            self.send_live_alerts(stream_data, alerts[str.lower(stream_data.get("user_login"))], fan_out)
+            for stream_data in new_streams), return_exceptions=True)
+        for stream_data, result in zip(new_streams, results):
+            if isinstance(result, Exception):
+                logging.error(f"TwitchAlert: Live Loop error {result}")
+                continue
+            current_username = str.lower(stream_data.get("user_login"))
+            sent, forbidden = result
+            for (channel_id, _, _, _, team_twitch_alert_id), message_id in sent:
+                if team_twitch_alert_id is None:
+                    updates.append((sql_update_user_message_id, [message_id, channel_id, current_username]))
+                else:
+                    updates.append((sql_update_team_message_id,
+                                    [message_id, team_twitch_alert_id, current_username]))
+            updates.extend(forbidden)
+
+        if updates:
+            await self.async_db_manager.transaction(updates)
+
+    async def start_eventsub(self):
+        """
+        Starts the EventSub web server and the loop keeping subscriptions in step with the alerts
+        :return:
+        """
+        self.eventsub = EventSubServer(TWITCH_EVENTSUB_SECRET, {"stream.online": self.on_stream_online,
+                                                                "stream.offline": self.on_stream_offline})
+        await self.eventsub.start(TWITCH_EVENTSUB_HOST, TWITCH_EVENTSUB_PORT)
+        self.loop_sync_eventsub.start()
+
+    def eventsub_started(self, task):
+        """
+        Logs why the EventSub web server failed to start, in which case alerts are only sent by the live loop
+        :param task: The finished start_eventsub task
+        :return:
+        """
+        if task.cancelled() or task.exception() is None:
+            return
+        logging.error(f"TwitchAlert: Failed to start EventSub {task.exception()}")
+        if self.eventsub is not None:
+            asyncio.ensure_future(self.eventsub.stop())
+            self.eventsub = None
+
+    @tasks.loop(minutes=REFRESH_TEAMS_DELAY)
+    async def loop_sync_eventsub(self):
+        """
+        A loop that keeps EventSub subscriptions in step with the users followed individually or through a team
+        :return:
+        """
+        await self.sync_eventsub_subscriptions()
+
+    async def sync_eventsub_subscriptions(self, callback=None):
+        """
+        Subscribes to stream.online and stream.offline for every user with an alert, and removes this bot's
+        subscriptions for users without one or that Twitch stopped sending
+        :param callback: The URL Twitch sends notifications to, TWITCH_EVENTSUB_CALLBACK by default
+        :return:
+        """
+        callback = callback or TWITCH_EVENTSUB_CALLBACK
+        twitch_handler = self.ta_database_manager.twitch_handler
+        alerts = await self.load_live_alerts()
+        users_data = await twitch_handler.get_users_data(list(alerts)) if alerts else {}
+        wanted = {(subscription_type, user_data.get("id")) for user_data in users_data.values() if user_data
+                  for subscription_type in EVENTSUB_SUBSCRIPTION_TYPES}
+
+        subscriptions = await twitch_handler.get_eventsub_subscriptions()
+        if subscriptions is None:
+            return
+        current = set()
+        stale = []
+        for subscription in subscriptions:
+            if subscription.get("transport", {}).get("callback") != callback:
+                continue
+            key = (subscription.get("type"), subscription.get("condition", {}).get("broadcaster_user_id"))
+            if key in wanted and key not in current and subscription.get("status") in EVENTSUB_ACTIVE_STATUSES:
+                current.add(key)
+            else:
+                stale.append(subscription.get("id"))
+
+        semaphore = asyncio.Semaphore(TWITCH_MAX_CONCURRENT_REQUESTS)
+
+        async def bounded(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        results = await asyncio.gather(
+            *(bounded(twitch_handler.create_eventsub_subscription(subscription_type, user_id, callback,
+                                                                  TWITCH_EVENTSUB_SECRET))
+              for subscription_type, user_id in wanted.difference(current)),
+            *(bounded(twitch_handler.delete_eventsub_subscription(subscription_id)) for subscription_id in stale),
+            return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.warning(f"TwitchAlert: Failed to update EventSub subscription {result}")
+
+    async def on_stream_online(self, event):
+        """
+        Sends alerts for a stream.online EventSub notification
+        :param event: The event of the notification
+        :return:
+        """
+        username = str.lower(event.get("broadcaster_user_login"))
+        streams_data = await self.ta_database_manager.twitch_handler.get_streams_data([username])
+        # Helix can lag behind the notification, the live loop will pick the stream up if it is not listed yet
+        live_streams = [stream_data for stream_data in streams_data or [] if stream_data.get("type") == "live"]
+        if not live_streams:
+            self.poll_scheduler.mark_live(username)
+            return
+        async with self.live_lock:
+            fan_out = AlertFanOut()
+            await self.post_live_alerts(live_streams, await self.load_live_alerts(username), fan_out)
+            self.poll_scheduler.record([username], {username})
+            if self.live_users is not None:
+                self.live_users.add(username)
+            fan_out.log_latency("EventSub")
+
+    async def on_stream_offline(self, event):
+        """
+        Removes alerts for a stream.offline EventSub notification
+        :param event: The event of the notification
+        :return:
+        """
+        username = str.lower(event.get("broadcaster_user_login"))
+        async with self.live_lock:
+            fan_out = AlertFanOut()
+            await self.ta_database_manager.delete_all_offline_streams(False, [username], fan_out=fan_out)
+            await self.ta_database_manager.delete_all_offline_streams(True, [username], fan_out=fan_out)
+            self.poll_scheduler.record([username], set())
+            if self.live_users is not None:
+                self.live_users.discard(username)
+            fan_out.log_latency("EventSub")
+
+    async def load_live_alerts(self, username=None):
+        """
+        Loads every alert of users followed individually or through a team in guilds with TwitchAlert enabled,
+        removing any with an invalid username or team name
+        :param username: Only load the alerts of this twitch username
+        :return: An index of twitch username -> alerts (channel_id, message_id, custom_message, default_message,
+        team_twitch_alert_id), where team_twitch_alert_id is None for users followed individually
+        """
+        sql_find_users = "SELECT twitch_username, NULL, UserInTwitchAlert.channel_id, message_id, NULL, " \
+                         "  custom_message, default_message " \
+                         "FROM UserInTwitchAlert " \
+                         "JOIN TwitchAlerts TA on UserInTwitchAlert.channel_id = TA.channel_id " \
+                         "JOIN (SELECT extension_id, guild_id FROM GuildExtensions " \
+                         "WHERE extension_id = 'TwitchAlert' " \
+                         "  OR extension_id = 'All') GE on TA.guild_id = GE.guild_id " \
+                         "WHERE ? IS NULL OR twitch_username = ? " \
+                         "UNION ALL " \
+                         "SELECT twitch_username, twitch_team_name, TITA.channel_id, " \
+                         "  UserInTwitchTeam.message_id, TITA.team_twitch_alert_id, custom_message, " \
+                         "  default_message " \
+                         "FROM UserInTwitchTeam " \
+                         "JOIN TeamInTwitchAlert TITA " \
+                         "  ON UserInTwitchTeam.team_twitch_alert_id = TITA.team_twitch_alert_id " \
+                         "JOIN TwitchAlerts TA on TITA.channel_id = TA.channel_id " \
+                         "JOIN (SELECT extension_id, guild_id FROM GuildExtensions " \
+                         "WHERE extension_id = 'TwitchAlert' " \
+                         "  OR extension_id = 'All') GE on TA.guild_id = GE.guild_id " \
+                         "WHERE ? IS NULL OR twitch_username = ?"
+        users = await self.async_db_manager.select(sql_find_users, args=[username] * 4)
+
+        alerts = {}
+        invalid_usernames = set()
+        invalid_teams = set()
+        for username, team_name, channel_id, message_id, team_twitch_alert_id, custom_message, default_message \
+                in users:
+            if team_name is None and not re.search(TWITCH_USERNAME_REGEX, username):
+                invalid_usernames.add(username)
+            elif team_name is not None and not re.search(TWITCH_USERNAME_REGEX, team_name):
+                invalid_teams.add(team_name)
+            else:
+                alerts.setdefault(username, []).append(
+                    (channel_id, message_id, custom_message, default_message, team_twitch_alert_id))
+
+        sql_remove_invalid_user = "DELETE FROM UserInTwitchAlert WHERE twitch_username = ?"
+        sql_remove_invalid_team = "DELETE FROM TeamInTwitchAlert WHERE twitch_team_name = ?"
+        removals = [(sql_remove_invalid_user, [username]) for username in invalid_usernames] + \
+                   [(sql_remove_invalid_team, [team_name]) for team_name in invalid_teams]
+        if removals:
+            await self.async_db_manager.transaction(removals)
+        return alerts
+
+    async def send_live_alerts(self, stream_data, stream_alerts, fan_out=None):
+        """
+        Sends an alert for a live stream to every channel that does not have one posted yet, several channels at once
+        :param stream_data: The twitch stream data of the live stream
+        :param stream_alerts: A list of (channel_id, message_id, custom_message, default_message, ...) for every alert
+        of the stream
+        :param fan_out: The AlertFanOut limiting how many messages are sent at once
+        :return: A list of (alert, new message_id) for the alerts sent, and a list of (sql, args) statements removing
+        any channels the bot can no longer post in
+        """
+        if fan_out is None:
+            fan_out = AlertFanOut()
+        # Alerts with no message posted, and their channels
+        pending = [(alert, self.bot.get_channel(id=alert[0])) for alert in stream_alerts if alert[1] is None]
+        pending = [(alert, channel) for alert, channel in pending if channel is not None]
+
+        embeds = {}
+        for (_, _, custom_message, channel_default_message, *_), _ in pending:
+            message = custom_message if custom_message is not None else channel_default_message
+            if message not in embeds:
+                embeds[message] = await self.create_alert_embed(stream_data, message)
+
+        async def send(alert, channel):
+            message = alert[2] if alert[2] is not None else alert[3]
+            if embeds[message] is not None:
+                return await channel.send(embed=embeds[message])
+
+        results = await fan_out.map(send, pending)
+        sent = []
+        forbidden = []
+        for (alert, channel), result in zip(pending, results):
+            if isinstance(result, discord.errors.Forbidden):
+                logging.warning(f"TwitchAlert: {result}  Name: {channel} ID: {channel.id}")
+                sql_remove_invalid_channel = "DELETE FROM TwitchAlerts WHERE channel_id = ?"
+                forbidden.append((sql_remove_invalid_channel, [channel.id]))
+            elif isinstance(result, Exception):
+                logging.error(f"TwitchAlert: Failed to send alert to {channel.id} {result}")
+            elif result is not None:
+                sent.append((alert, result.id))
+        return sent, forbidden
 
     async def create_alert_embed(self, stream_data, message):
         """
@@ -497,11 +768,32 @@ class TwitchAlert(commands.Cog):
         :return: The discord message id of the sent message
         """
         user_details = await self.ta_database_manager.twitch_handler.get_user_data(
-            stream_data.get("user_name"))
+            stream_data.get("user_login"))
         game_details = await self.ta_database_manager.twitch_handler.get_game_data(
             stream_data.get("game_id"))
         return create_live_embed(stream_data, user_details, game_details, message)
 
+    async def prefetch_alert_details(self, streams_data, alerts):
+        """
+        Looks up the users and games of every live stream that needs a new alert in one request each, so
+        create_alert_embed finds them in the Twitch API handler's cache
+        :param streams_data: The twitch stream data of this loop
+        :param alerts: An index of twitch username -> alerts, as built by load_live_alerts
+        """
+        new_streams = [stream_data for stream_data in streams_data
+                       if stream_data.get("type") == "live" and
+                       any(alert[1] is None for alert in alerts.get(str.lower(stream_data.get("user_login")), []))]
+        if not new_streams:
+            return
+        twitch_handler = self.ta_database_manager.twitch_handler
+        try:
+            await asyncio.gather(
+                twitch_handler.get_users_data([stream_data.get("user_login") for stream_data in new_streams]),
+                twitch_handler.get_games_data([stream_data.get("game_id") for stream_data in new_streams
+                                               if stream_data.get("game_id")]))
+        except Exception as err:
+            logging.warning(f"TwitchAlert: Failed to prefetch alert details {err}")
+
     @tasks.loop(minutes=REFRESH_TEAMS_DELAY)
     async def loop_update_teams(self):
         start = time.time()
@@ -511,109 +803,6 @@ class TwitchAlert(commands.Cog):
         if time_diff > 5:
             logging.warning(f"TwitchAlert: Teams updated in > 5s | {time_diff}s")
 
-    @tasks.loop(minutes=TEAMS_LOOP_CHECK_LIVE_DELAY)
-    async def loop_check_team_live(self):
-        """
-        A loop to repeatedly send messages if a member of a team is live, and remove it when they are not
-
-        :return:
-        """
-        start = time.time()
-        # logging.info("TwitchAlert: Team Loop Started")
-        sql_select_team_users = "SELECT twitch_username, twitch_team_name " \
-                                "FROM UserInTwitchTeam " \
-                                "JOIN TeamInTwitchAlert TITA " \
-                                "  ON UserInTwitchTeam.team_twitch_alert_id = TITA.team_twitch_alert_id " \
-                                "JOIN TwitchAlerts TA on TITA.channel_id = TA.channel_id " \
-                                "JOIN (SELECT extension_id, guild_id FROM GuildExtensions " \
-                                "WHERE extension_id = 'TwitchAlert' " \
-                                "  OR extension_id = 'All') GE on TA.guild_id = GE.guild_id "
-
-        users_and_teams = self.ta_database_manager.database_manager.db_execute_select(sql_select_team_users)
-        usernames = []
-        for user in users_and_teams:
-            if not re.search(TWITCH_USERNAME_REGEX, user[1]):
-                sql_remove_invalid_user = "DELETE FROM TeamInTwitchAlert WHERE twitch_team_name = ?"
-                self.ta_database_manager.database_manager.db_execute_commit(sql_remove_invalid_user, args=[user[1]])
-            else:
-                usernames.append(user[0])
-
-        if not usernames:
-            return
-
-        streams_data = await self.ta_database_manager.twitch_handler.get_streams_data(usernames)
-
-        if streams_data is None:
-            return
-        # Deals with online streams
-        for stream_data in streams_data:
-            try:
-                if stream_data.get('type') == "live":
-                    current_username = str.lower(stream_data.get("user_login"))
-                    temp = usernames
-                    usernames.remove(current_username)
-                    if usernames == temp:
-                        logging.error(f"TwitchAlert: {stream_data.get('user_login')} not found in the user list {usernames}")
-
-                    sql_find_message_id = """
-                    SELECT TITA.channel_id, UserInTwitchTeam.message_id, TITA.team_twitch_alert_id, custom_message, 
-                      default_message 
-                    FROM UserInTwitchTeam
-                    JOIN TeamInTwitchAlert TITA on UserInTwitchTeam.team_twitch_alert_id = TITA.team_twitch_alert_id
-                    JOIN TwitchAlerts TA on TITA.channel_id = TA.channel_id
-                    JOIN (SELECT extension_id, guild_id 
-                          FROM GuildExtensions 
-                          WHERE extension_id = 'TwitchAlert' OR extension_id = 'All') GE ON TA.guild_id = GE.guild_id 
-                    WHERE twitch_username = ?"""
-
-                    results = self.ta_database_manager.database_manager.db_execute_select(
-                        sql_find_message_id, args=[current_username])
-
-                    new_message_embed = None
-
-                    for result in results:
-                        channel_id = result[0]
-                        message_id = result[1]
-                        team_twitch_alert_id = result[2]
-                        custom_message = result[3]
-                        channel_default_message = result[4]
-                        channel = self.bot.get_channel(id=channel_id)
-                        try:
-                            # If no Alert is posted
-                            if message_id is None:
-                                if new_message_embed is None:
-                                    if custom_message is not None:
-                                        message = custom_message
-                                    else:
-                                        message = channel_default_message
-
-                                    new_message_embed = await self.create_alert_embed(stream_data, message)
-
-                                if new_message_embed is not None and channel is not None:
-                                    new_message = await channel.send(embed=new_message_embed)
-
-                                    sql_update_message_id = """
-                                    UPDATE UserInTwitchTeam 
-                                    SET message_id = ?
-                                    WHERE team_twitch_alert_id = ?
-                                    AND twitch_username = ?"""
-                                    self.ta_database_manager.database_manager.db_execute_commit(
-                                        sql_update_message_id,
-                                        args=[new_message.id, team_twitch_alert_id, current_username])
-                        except discord.errors.Forbidden as err:
-                            logging.warning(f"TwitchAlert: {err}  Name: {channel} ID: {channel.id}")
-                            sql_remove_invalid_channel = "DELETE FROM TwitchAlerts WHERE channel_id = ?"
-                            self.ta_database_manager.database_manager.db_execute_commit(sql_remove_invalid_channel,
-                                                                                        args=[channel.id])
-            except Exception as err:
-                logging.error(f"TwitchAlert: Team Loop error {err}")
-
-        # Deals with remaining offline streams
-        await self.ta_database_manager.delete_all_offline_streams(True, usernames)
-        time_diff = time.time() - start
-        if time_diff > 5:
-            logging.warning(f"TwitchAlert: Teams Loop Finished in > 5s | {time_diff}s")
-
 
 def create_live_embed(stream_info, user_info, game_info, message):
     """
@@ -642,18 +831,600 @@ def create_live_embed(stream_info, user_info, game_info, message):
     return embed
 
 
+def parse_eventsub_timestamp(timestamp):
+    """
+    Parses the RFC3339 timestamp of an EventSub message, which can have more fractional digits than strptime allows
+    :param timestamp: The timestamp e.g. 2021-05-14T10:11:12.123456789Z
+    :return: The timestamp in seconds since the epoch, or None if it could not be parsed
+    """
+    match = re.match(r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(\.\d+)?Z$", timestamp or "")
+    if match is None:
+        return None
+    seconds = calendar.timegm(time.strptime(match.group(1), "%Y-%m-%dT%H:%M:%S"))
+    return seconds + float(match.group(2) or 0)
+
+
+def verify_eventsub_signature(secret, headers, body):
+    """
+    Checks an EventSub message was signed by Twitch with the subscription secret
+    :param secret: The secret used when subscribing
+    :param headers: The headers of the request
+    :param body: The raw body of the request
+    :return: True if the signature is valid, False otherwise
+    """
+    message = headers.get("Twitch-Eventsub-Message-Id", "").encode() + \
+        headers.get("Twitch-Eventsub-Message-Timestamp", "").encode() + body
+    expected = "sha256=" + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, headers.get("Twitch-Eventsub-Message-Signature", ""))
+
+
+class EventSubServer:
+    """
+    A web server receiving Twitch EventSub webhook notifications, which are verified and passed to a handler for
+    their subscription type
+    """
+
+    def __init__(self, secret, handlers, path=TWITCH_EVENTSUB_PATH):
+        """
+        Initialises local variables
+        :param secret: The secret used when subscribing
+        :param handlers: A dict of subscription type -> async function given the event of a notification
+        :param path: The path notifications are posted to
+        """
+        self.secret = secret
+        self.handlers = handlers
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle)
+        self.runner = None
+        self.seen_message_ids = set()
+        self.seen_message_order = deque()
+        self.tasks = set()
+
+    async def start(self, host, port):
+        """
+        Starts listening for notifications
+        :param host: The interface to listen on
+        :param port: The port to listen on, 0 for any free port
+        :return: The (host, port) the server is listening on
+        """
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        return self.runner.addresses[0][:2]
+
+    async def stop(self):
+        """
+        Stops listening for notifications
+        """
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def is_duplicate(self, message_id):
+        """
+        Checks whether a message was already received, since Twitch may resend notifications
+        :param message_id: The ID of the message
+        :return: True if the message was already received
+        """
+        if message_id in self.seen_message_ids:
+            return True
+        self.seen_message_ids.add(message_id)
+        self.seen_message_order.append(message_id)
+        if len(self.seen_message_order) > EVENTSUB_REMEMBERED_MESSAGES:
+            self.seen_message_ids.discard(self.seen_message_order.popleft())
+        return False
+
+    async def handle(self, request):
+        """
+        Handles a request from Twitch
+        :param request: The aiohttp request
+        :return: The aiohttp response
+        """
+        body = await request.read()
+        if not verify_eventsub_signature(self.secret, request.headers, body):
+            logging.warning("TwitchAlert: EventSub message with an invalid signature")
+            return web.Response(status=403)
+        timestamp = parse_eventsub_timestamp(request.headers.get("Twitch-Eventsub-Message-Timestamp"))
+        if timestamp is None or abs(time.time() - timestamp) > EVENTSUB_MAX_MESSAGE_AGE:
+            logging.warning("TwitchAlert: EventSub message is too old")
+            return web.Response(status=403)
+        if self.is_duplicate(request.headers.get("Twitch-Eventsub-Message-Id")):
+            return web.Response(status=204)
+
+        payload = json.loads(body)
+        message_type = request.headers.get("Twitch-Eventsub-Message-Type")
+        subscription_type = payload.get("subscription", {}).get("type")
+        if message_type == "webhook_callback_verification":
+            return web.Response(text=payload.get("challenge"), content_type="text/plain")
+        elif message_type == "notification":
+            handler = self.handlers.get(subscription_type)
+            if handler is not None:
+                # Twitch expects a quick response, so the event is handled after responding
+                task = asyncio.ensure_future(self.dispatch(handler, payload.get("event", {})))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+        elif message_type == "revocation":
+            logging.warning(f"TwitchAlert: EventSub subscription {subscription_type} revoked "
+                            f"{payload.get('subscription', {}).get('status')}")
+        return web.Response(status=204)
+
+    @staticmethod
+    async def dispatch(handler, event):
+        """
+        Passes an event to its handler, logging any errors
+        :param handler: The async function handling the event
+        :param event: The event of the notification
+        """
+        try:
+            await handler(event)
+        except Exception as err:
+            logging.error(f"TwitchAlert: EventSub handler error {err}")
+
+
+class StreamerPollState:
+    """
+    What the poll scheduler has learnt about a Twitch user
+    """
+
+    def __init__(self):
+        """
+        Initialises local variables
+        """
+        self.last_polled = None
+        self.last_live = None
+        self.last_live_hour = None
+        self.live_hours = [0] * 24
+
+
+class PollScheduler:
+    """
+    Decides which Twitch users to request each live check. Users who are live, were live recently or usually stream
+    at this hour (UTC) are requested every check. Other users are requested less often, and each check stays within a
+    budget of stream requests
+    """
+
+    def __init__(self, budget=TWITCH_POLL_BUDGET, tick=LOOP_CHECK_LIVE_DELAY * 60):
+        """
+        Initialises local variables
+        :param budget: The most stream requests of TWITCH_MAX_LOGINS_PER_REQUEST users per check, 0 for no limit
+        :param tick: The seconds between live checks
+        """
+        self.budget = budget
+        self.tick = tick
+        self.states = {}
+        # Users whose state changed or was removed since the last call of changes
+        self.changed = set()
+        self.removed = set()
+
+    def poll_interval(self, state, now):
+        """
+        Gets how often a user should be requested
+        :param state: The StreamerPollState of the user
+        :param now: The current time
+        :return: The seconds between requests, 0 for every check
+        """
+        if state.last_polled is None:
+            return 0
+        if state.last_live is not None and now - state.last_live < POLL_HOT_WINDOW:
+            return 0
+        hour = int(now // 3600) % 24
+        if max(state.live_hours[hour], state.live_hours[(hour + 1) % 24]) >= POLL_TYPICAL_HOUR_MIN_DAYS:
+            return 0
+        if state.last_live is not None and now - state.last_live < POLL_WARM_WINDOW:
+            return POLL_WARM_INTERVAL
+        return POLL_COLD_INTERVAL
+
+    def due_logins(self, logins, live_users, now=None):
+        """
+        Gets the users to request this check. Live users are always requested so alerts are removed when they go
+        offline, then users polled every check, then the most overdue users up to the budget
+        :param logins: Every user with an alert
+        :param live_users: The users currently live
+        :param now: The current time
+        :return: A list of the users to request
+        """
+        if now is None:
+            now = time.time()
+        for login in set(self.states).difference(logins):
+            del self.states[login]
+            self.changed.discard(login)
+            self.removed.add(login)
+
+        required = []
+        due = []
+        for login in logins:
+            state = self.states.setdefault(login, StreamerPollState())
+            if login in live_users:
+                required.append(login)
+                continue
+            interval = self.poll_interval(state, now)
+            if state.last_polled is None:
+                due.append((interval > 0, -float("inf"), login))
+            elif now - state.last_polled >= interval - self.tick / 2:
+                due.append((interval > 0, -(now - state.last_polled - interval), login))
+
+        due.sort()
+        if self.budget:
+            due = due[:max(self.budget * TWITCH_MAX_LOGINS_PER_REQUEST - len(required), 0)]
+        return required + [login for _, _, login in due]
+
+    def mark_live(self, login, now=None):
+        """
+        Records that a user was reported live without requesting their stream, so they are requested every check
+        until the hot window passes
+        :param login: The user reported live
+        :param now: The current time
+        """
+        if now is None:
+            now = time.time()
+        self.states.setdefault(login, StreamerPollState()).last_live = now
+        self.changed.add(login)
+
+    def record(self, polled, live_logins, now=None):
+        """
+        Records the result of a check
+        :param polled: The users requested
+        :param live_logins: The users found live
+        :param now: The current time
+        """
+        if now is None:
+            now = time.time()
+        for login in polled:
+            self.states.setdefault(login, StreamerPollState()).last_polled = now
+        hour_mark = int(now // 3600)
+        for login in live_logins:
+            state = self.states.setdefault(login, StreamerPollState())
+            state.last_live = now
+            if state.last_live_hour != hour_mark:
+                state.last_live_hour = hour_mark
+                state.live_hours[hour_mark % 24] += 1
+        self.changed.update(polled, live_logins)
+        self.removed.difference_update(polled, live_logins)
+
+    def load(self, rows):
+        """
+        Restores the states saved from changes, keeping any already recorded
+        :param rows: (twitch_username, last_polled, last_live, last_live_hour, live_hours) rows
+        """
+        for login, last_polled, last_live, last_live_hour, live_hours in rows:
+            if login in self.states:
+                continue
+            state = StreamerPollState()
+            state.last_polled = last_polled
+            state.last_live = last_live
+            state.last_live_hour = last_live_hour
+            state.live_hours = [int(days) for days in live_hours.split(",")]
+            self.states[login] = state
+
+    def changes(self):
+        """
+        Gets the states to save since the last call
+        :return: A list of (twitch_username, last_polled, last_live, last_live_hour, live_hours) rows of changed
+        states, and a list of the users removed
+        """
+        rows = []
+        for login in self.changed:
+            state = self.states[login]
+            rows.append((login, state.last_polled, state.last_live, state.last_live_hour,
+                         ",".join(map(str, state.live_hours))))
+        removed = list(self.removed)
+        self.changed = set()
+        self.removed = set()
+        return rows, removed
+
+
+def message_age(message_id):
+    """
+    Gets the age of a discord message from the timestamp in its ID
+    :param message_id: The discord message ID
+    :return: The age of the message in seconds
+    """
+    return time.time() - ((int(message_id) >> 22) + discord.utils.DISCORD_EPOCH) / 1000
+
+
+def latency_percentiles(latencies):
+    """
+    Gets the 50th and 95th percentile and maximum of a list of latencies, using the nearest rank
+    :param latencies: A non-empty list of latencies in seconds
+    :return: A tuple of p50, p95, max
+    """
+    ordered = sorted(latencies)
+
+    def percentile(percent):
+        return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+    return percentile(50), percentile(95), ordered[-1]
+
+
+class AlertFanOut:
+    """
+    Runs the Discord requests of a loop concurrently, at most a fixed number at a time, recording how long each took.
+    Rate limits per route are still handled by discord.py, which queues requests to a route until its bucket resets
+    """
+
+    def __init__(self, max_concurrent_requests=ALERT_MAX_CONCURRENT_REQUESTS):
+        """
+        Initialises local variables
+        :param max_concurrent_requests: The maximum number of requests in flight at once
+        """
+        self.semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self.latencies = []
+
+    async def run(self, coroutine):
+        """
+        Awaits a coroutine once there is room for it
+        :param coroutine: The coroutine making the request
+        :return: The result of the coroutine
+        """
+        async with self.semaphore:
+            start = time.monotonic()
+            try:
+                return await coroutine
+            finally:
+                self.latencies.append(time.monotonic() - start)
+
+    async def map(self, func, items):
+        """
+        Calls a coroutine function for each item concurrently
+        :param func: The coroutine function
+        :param items: A list of argument tuples for func
+        :return: A list of results in the order of items, exceptions raised are returned in place of their result
+        """
+        return await asyncio.gather(*(self.run(func(*item)) for item in items), return_exceptions=True)
+
+    def log_latency(self, name):
+        """
+        Logs the latency percentiles of the requests made
+        :param name: The name of the loop making the requests
+        """
+        if self.latencies:
+            p50, p95, maximum = latency_percentiles(self.latencies)
+            logging.info(f"TwitchAlert: {name} made {len(self.latencies)} Discord requests | "
+                         f"p50 {p50:.3f}s p95 {p95:.3f}s max {maximum:.3f}s")
+
+
+def chunks(items, size):
+    """
+    Splits a list into consecutive chunks by index, without copying the rest of the list for every chunk
+    :param items: The list to split
+    :param size: The maximum length of each chunk
+    :return: A generator of the chunks
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class TwitchCache:
+    """
+    An async-safe TTL and LRU cache for Twitch API lookups. Concurrent lookups of a key share one request
+    """
+
+    def __init__(self, ttl, max_size=TWITCH_CACHE_MAX_SIZE):
+        """
+        Initialises local variables
+        :param ttl: The seconds an entry stays valid
+        :param max_size: The number of entries kept before the least recently used are dropped
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def put(self, key, value):
+        """
+        Caches a value, dropping the least recently used entries if the cache is full
+        :param key: The key of the value
+        :param value: The value to cache
+        """
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes every cached value
+        """
+        self.entries.clear()
+
+    async def get_many(self, keys, load):
+        """
+        Gets the values of several keys, loading every missing key in one call
+        :param keys: The keys to get
+        :param load: An async function given a list of missing keys, returning a dict of key -> value, or None if
+        the lookup failed and should not be cached
+        :return: A dict of key -> value, without the keys that could not be loaded
+        """
+        result = {}
+        loading = {}
+        missing = []
+        now = time.monotonic()
+        for key in dict.fromkeys(keys):
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                result[key] = entry[1]
+            elif key in self.in_flight:
+                self.hits += 1
+                loading[key] = self.in_flight[key]
+            else:
+                self.misses += 1
+                missing.append(key)
+
+        if missing:
+            task = asyncio.ensure_future(load(missing))
+            task.add_done_callback(functools.partial(self.store, missing))
+            for key in missing:
+                self.in_flight[key] = task
+                loading[key] = task
+
+        for key, task in loading.items():
+            loaded = await asyncio.shield(task)
+            if loaded is not None and key in loaded:
+                result[key] = loaded[key]
+        return result
+
+    def store(self, keys, task):
+        """
+        Caches the result of a finished load
+        :param keys: The keys the load was for
+        :param task: The finished load
+        """
+        for key in keys:
+            if self.in_flight.get(key) is task:
+                del self.in_flight[key]
+        if task.cancelled() or task.exception() is not None or task.result() is None:
+            return
+        loaded = task.result()
+        for key in keys:
+            self.put(key, loaded.get(key))
+
+
+class TwitchRateLimiter:
+    """
+    A token bucket shared by every request to the Twitch API, kept in step with the Ratelimit headers Twitch sends
+    back. When tokens run short, waiting requests are let through in order of priority
+    """
+
+    def __init__(self, capacity=TWITCH_RATE_LIMIT, period=TWITCH_RATE_LIMIT_PERIOD):
+        """
+        Initialises local variables
+        :param capacity: The number of requests allowed per period, updated from Ratelimit-Limit
+        :param period: The seconds it takes for an empty bucket to refill
+        """
+        self.capacity = capacity
+        self.period = period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.reset_at = None
+        self.blocked_until = 0
+        self.waiters = []
+        self.counter = itertools.count()
+
+    def refill(self):
+        """
+        Adds the tokens earned since the last refill, or fills the bucket if Twitch's reset time has passed
+        """
+        now = time.monotonic()
+        if self.reset_at is not None and time.time() >= self.reset_at:
+            self.tokens = self.capacity
+            self.reset_at = None
+        else:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.period)
+        self.updated = now
+
+    async def acquire(self, priority=TWITCH_PRIORITY_LOOKUP):
+        """
+        Waits until a request of the given priority may be sent, then takes a token for it
+        :param priority: Lower numbers are sent first when tokens run short
+        """
+        entry = (priority, next(self.counter))
+        self.waiters.append(entry)
+        try:
+            while True:
+                self.refill()
+                ahead = sum(1 for waiter in self.waiters if waiter < entry)
+                delay = self.blocked_until - time.monotonic()
+                if delay <= 0 and self.tokens - ahead >= 1:
+                    self.tokens -= 1
+                    return
+                if delay <= 0:
+                    delay = (ahead + 1 - self.tokens) * self.period / self.capacity
+                    if self.reset_at is not None:
+                        delay = min(delay, self.reset_at - time.time())
+                await asyncio.sleep(max(delay, 0.01))
+        finally:
+            self.waiters.remove(entry)
+
+    def update(self, headers):
+        """
+        Brings the bucket in line with the Ratelimit headers of a response
+        :param headers: The headers of a response from the Twitch API
+        """
+        try:
+            limit = int(headers["Ratelimit-Limit"])
+            remaining = int(headers["Ratelimit-Remaining"])
+            reset_at = float(headers["Ratelimit-Reset"])
+        except (KeyError, ValueError):
+            return
+        self.refill()
+        self.capacity = max(limit, 1)
+        self.tokens = min(self.tokens, remaining)
+        self.reset_at = reset_at
+
+    def backoff(self, status, headers, attempt):
+        """
+        Works out how long to wait before retrying a throttled or failed request. A 429 empties the bucket so every
+        request waits until Twitch's reset time
+        :param status: The HTTP status of the response
+        :param headers: The headers of the response
+        :param attempt: The number of times the request has already been attempted
+        :return: The number of seconds to wait
+        """
+        delay = min(TWITCH_BACKOFF_MAX, TWITCH_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1)
+        if status == 429:
+            self.tokens = 0
+            try:
+                delay = min(TWITCH_BACKOFF_MAX, max(float(headers["Ratelimit-Reset"]) - time.time(), delay))
+            except (KeyError, ValueError):
+                pass
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        return delay
+
+
 class TwitchAPIHandler:
     """
     A wrapper to interact with the twitch API
     """
 
-    def __init__(self, client_id: str, client_secret: str):
+    def __init__(self, client_id: str, client_secret: str, api_url=TWITCH_API_URL, oauth_url=TWITCH_OAUTH_URL):
+        """
+        Initialises local variables
+        :param client_id: The Twitch client ID
+        :param client_secret: The Twitch client secret
+        :param api_url: The base URL of the Helix API, without a trailing slash
+        :param oauth_url: The URL OAuth2 tokens are requested from
+        """
+        self.api_url = api_url
+        self.oauth_url = oauth_url
         self.client_id = client_id
         self.client_secret = client_secret
         self.params = {'client_id': self.client_id,
                        'client_secret': self.client_secret,
                        'grant_type': 'client_credentials'}
         self.token = {}
+        self.session = None
+        self.oauth_lock = asyncio.Lock()
+        self.rate_limiter = TwitchRateLimiter()
+        self.user_cache = TwitchCache(TWITCH_USER_CACHE_TTL)
+        self.game_cache = TwitchCache(TWITCH_GAME_CACHE_TTL)
+
+    def open_session(self):
+        """
+        Gets the session shared by every request to Twitch, opening it if needed, so connections are kept alive
+        and reused between requests
+        :return: The aiohttp ClientSession
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=TWITCH_CONNECTION_LIMIT, ttl_dns_cache=TWITCH_DNS_CACHE_TTL,
+                                             keepalive_timeout=TWITCH_KEEPALIVE_TIMEOUT)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(60))
+        return self.session
+
+    async def close_session(self):
+        """
+        Closes the shared session and its connections
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
 
     @property
     def base_headers(self):
@@ -667,83 +1438,208 @@ class TwitchAPIHandler:
         Get a new OAuth2 token from twitch using client_id and client_secret
         :return: The new OAuth2 token
         """
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(60)) as client:
-            async with client.post('https://id.twitch.tv/oauth2/token', params=self.params) as response:
-                if response.status > 399:
-                    logging.critical(f'TwitchAlert: Error {response.status} while getting Oauth token')
-                    self.token = {}
+        async with self.open_session().post(self.oauth_url, params=self.params) as response:
+            if response.status > 399:
+                logging.critical(f'TwitchAlert: Error {response.status} while getting Oauth token')
+                self.token = {}
 
-                response_json = await response.json()
+            response_json = await response.json()
 
-                try:
-                    response_json['expires_in'] += time.time()
-                except KeyError:
-                    # probably shouldn't need this, but catch just in case
-                    logging.warning('TwitchAlert: Failed to set token expiration time')
+            try:
+                response_json['expires_in'] += time.time()
+            except KeyError:
+                # probably shouldn't need this, but catch just in case
+                logging.warning('TwitchAlert: Failed to set token expiration time')
 
-                self.token = response_json
+            self.token = response_json
 
-                return self.token
+            return self.token
 
-    async def requests_get(self, url, headers=None, params=None, attempts=None):
+    async def refresh_twitch_oauth(self, rejected_token=None):
+        """
+        Gets a new OAuth2 token unless another request already replaced the rejected one
+        :param rejected_token: The access token Twitch rejected, or None to refresh only an expired token
+        """
+        async with self.oauth_lock:
+            if rejected_token is None:
+                if self.token and self.token.get('expires_in', 0) > time.time() + 1:
+                    return
+            elif self.token.get('access_token') != rejected_token:
+                return
+            await self.get_new_twitch_oauth()
+
+    async def requests_get(self, url, headers=None, params=None, priority=TWITCH_PRIORITY_LOOKUP):
         """
         Gets a response from a curl get request to the given url using headers of this object
         :param headers: the Headers required for the request, will use self.headers by default
         :param url: The URL to send the request to
         :param params: The parameters of the request
-        :param attempts: The count of the number of time this request was attempted
+        :param priority: The rate limiter priority of the request, lower numbers are sent first
         :return: The response of the request
         """
-        if attempts is None:
-            attempts = 0
-        if attempts >= 5:
-            raise TimeoutError("Twitch API did not respond")
+        return await self.request("GET", url, headers=headers, params=params, priority=priority)
 
-        if self.token.get('expires_in', 0) <= time.time() + 1 or not self.token:
-            await self.get_new_twitch_oauth()
+    async def request(self, method, url, headers=None, params=None, json=None, priority=TWITCH_PRIORITY_LOOKUP):
+        """
+        Sends a request to the given url using headers of this object, waiting for the rate limiter and retrying with
+        a new token on 401 or with a backoff on 429 and server errors
+        :param method: The HTTP method of the request
+        :param url: The URL to send the request to
+        :param headers: the Headers required for the request, will use self.headers by default
+        :param params: The parameters of the request
+        :param json: The JSON body of the request
+        :param priority: The rate limiter priority of the request, lower numbers are sent first
+        :return: The response of the request, an empty dict if it had no content
+        """
+        for attempt in range(TWITCH_MAX_ATTEMPTS):
+            await self.refresh_twitch_oauth()
+            await self.rate_limiter.acquire(priority)
+            access_token = self.token.get('access_token')
 
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(60)) as client:
-            async with client.get(url=url, headers=headers if headers else self.base_headers, params=params) as \
-                    response:
+            async with self.open_session().request(method, url=url,
+                                                   headers=headers if headers else self.base_headers,
+                                                   params=params, json=json) as response:
+                self.rate_limiter.update(response.headers)
 
                 if response.status == 401:
                     logging.info(f"TwitchAlert: {response.status}, getting new oauth and retrying")
-                    await asyncio.sleep(random.randint(1, 100)*0.0001)
-                    await self.get_new_twitch_oauth()
-                    return await self.requests_get(url, headers, params, attempts+1)
-                elif response.status > 399:
-                    logging.warning(f'TwitchAlert: {response.status} while getting requesting URL:{url}')
+                    delay = 0
+                elif response.status == 429 or response.status >= 500:
+                    delay = self.rate_limiter.backoff(response.status, response.headers, attempt)
+                    logging.warning(f'TwitchAlert: {response.status} while getting requesting URL:{url}, '
+                                    f'retrying in {delay:.1f}s')
+                else:
+                    if response.status > 399:
+                        logging.warning(f'TwitchAlert: {response.status} while getting requesting URL:{url}')
+                    if response.status == 204:
+                        return {}
+                    return await response.json()
+
+            if response.status == 401:
+                await self.refresh_twitch_oauth(access_token)
+            else:
+                await asyncio.sleep(delay)
+
+        raise TimeoutError("Twitch API did not respond")
+
+    async def get_eventsub_subscriptions(self):
+        """
+        Gets every EventSub subscription of this client
+        :return: The JSON data of the subscriptions, or None if a request failed
+        """
+        subscriptions = []
+        params = {}
+        while True:
+            response = await self.requests_get(self.api_url + "/eventsub/subscriptions", params=params,
+                                               priority=TWITCH_PRIORITY_TEAMS)
+            if response.get("data") is None:
+                return None
+            subscriptions += response.get("data")
+            cursor = response.get("pagination", {}).get("cursor")
+            if not cursor:
+                return subscriptions
+            params = {"after": cursor}
+
+    async def create_eventsub_subscription(self, subscription_type, user_id, callback, secret):
+        """
+        Subscribes to an EventSub event of a user, delivered to a webhook
+        :param subscription_type: The EventSub subscription type e.g. stream.online
+        :param user_id: The twitch user ID of the broadcaster
+        :param callback: The URL Twitch sends notifications to
+        :param secret: The secret Twitch signs notifications with
+        :return: The JSON response of the request
+        """
+        return await self.request("POST", self.api_url + "/eventsub/subscriptions", json={
+            "type": subscription_type,
+            "version": "1",
+            "condition": {"broadcaster_user_id": user_id},
+            "transport": {"method": "webhook", "callback": callback, "secret": secret}
+        }, priority=TWITCH_PRIORITY_TEAMS)
 
-                return await response.json()
+    async def delete_eventsub_subscription(self, subscription_id):
+        """
+        Removes an EventSub subscription
+        :param subscription_id: The ID of the subscription
+        :return: The JSON response of the request
+        """
+        return await self.request("DELETE", self.api_url + "/eventsub/subscriptions",
+                                  params={"id": subscription_id}, priority=TWITCH_PRIORITY_TEAMS)
 
     async def get_streams_data(self, usernames):
         """
         Gets all stream information from a list of given usernames
         :param usernames: The list of usernames
-        :return: The JSON data of the request
+        :return: The JSON data of the request, or None if any page of the request failed
         """
-        url = 'https://api.twitch.tv/helix/streams?'
+        result = []
+        pages = self.iter_streams_data(usernames)
+        try:
+            async for streams_data in pages:
+                if streams_data is None:
+                    return None
+                result += streams_data
+        finally:
+            await pages.aclose()
+        return result
 
-        next_hundred_users = usernames[:100]
-        usernames = usernames[100:]
-        result = (await self.requests_get(url + "user_login=" + "&user_login=".join(next_hundred_users))).get("data")
+    async def iter_streams_data(self, usernames, max_concurrent_requests=TWITCH_MAX_CONCURRENT_REQUESTS):
+        """
+        Requests the stream information of a list of given usernames a page at a time, with several pages in flight
+        at once, yielding each page as it arrives
+        :param usernames: The list of usernames
+        :param max_concurrent_requests: The maximum number of pages requested at once
+        :return: An async generator of the JSON data of each page, None for a page that failed
+        """
+        url = self.api_url + '/streams?'
+        semaphore = asyncio.Semaphore(max_concurrent_requests)
 
-        while usernames:
-            next_hundred_users = usernames[:100]
-            usernames = usernames[100:]
-            result += (await self.requests_get(url + "user_login=" + "&user_login=".join(next_hundred_users))).get(
-                "data")
+        async def get_page(page_usernames):
+            async with semaphore:
+                return (await self.requests_get(url + "user_login=" + "&user_login=".join(page_usernames),
+                                                priority=TWITCH_PRIORITY_STREAMS)).get("data")
 
-        return result
+        pages = [asyncio.ensure_future(get_page(page_usernames))
+                 for page_usernames in chunks(usernames, TWITCH_MAX_LOGINS_PER_REQUEST)]
+        try:
+            for page in asyncio.as_completed(pages):
+                yield await page
+        finally:
+            for page in pages:
+                page.cancel()
 
     async def get_user_data(self, username):
         """
         Gets the user information of a given user
-        :param username: The display twitch username of the user
-        :return: The JSON information of the user's data
+        :param username: The twitch username of the user
+        :return: The JSON information of the user's data, or None if the user was not found
+        """
+        return (await self.get_users_data([username])).get(str.lower(username))
+
+    async def get_users_data(self, usernames):
+        """
+        Gets the user information of several users, from the cache where possible and otherwise in one request
+        per page of usernames
+        :param usernames: The twitch usernames of the users
+        :return: A dict of lowercase username -> JSON information of the user's data
         """
-        url = 'https://api.twitch.tv/helix/users?login=' + username
-        return (await self.requests_get(url)).get("data")[0]
+        return await self.user_cache.get_many([str.lower(username) for username in usernames],
+                                              self.request_users_data)
+
+    async def request_users_data(self, usernames):
+        """
+        Requests the user information of several users from the Twitch API
+        :param usernames: The lowercase twitch usernames of the users
+        :return: A dict of username -> JSON information, None for users not found, or None if a request failed
+        """
+        users_data = dict.fromkeys(usernames)
+        for page_usernames in chunks(usernames, TWITCH_MAX_LOGINS_PER_REQUEST):
+            url = self.api_url + '/users?login=' + "&login=".join(page_usernames)
+            page = (await self.requests_get(url)).get("data")
+            if page is None:
+                return None
+            for user_data in page:
+                users_data[str.lower(user_data.get("login"))] = user_data
+        return users_data
 
     async def get_game_data(self, game_id):
         """
@@ -751,21 +1647,44 @@ class TwitchAPIHandler:
         :param game_id: The twitch game ID of a game
         :return: The JSON information of the game's data
         """
-        if game_id != "":
-            url = 'https://api.twitch.tv/helix/games?id=' + game_id
-            game_data = await self.requests_get(url)
-            return game_data.get("data")[0]
+        if game_id:
+            return (await self.get_games_data([game_id])).get(game_id)
         else:
             return None
 
+    async def get_games_data(self, game_ids):
+        """
+        Gets the game information of several games, from the cache where possible and otherwise in one request
+        per page of game IDs
+        :param game_ids: The twitch game IDs of the games
+        :return: A dict of game ID -> JSON information of the game's data
+        """
+        return await self.game_cache.get_many(game_ids, self.request_games_data)
+
+    async def request_games_data(self, game_ids):
+        """
+        Requests the game information of several games from the Twitch API
+        :param game_ids: The twitch game IDs of the games
+        :return: A dict of game ID -> JSON information, None for games not found, or None if a request failed
+        """
+        games_data = dict.fromkeys(game_ids)
+        for page_game_ids in chunks(game_ids, TWITCH_MAX_LOGINS_PER_REQUEST):
+            url = self.api_url + '/games?id=' + "&id=".join(page_game_ids)
+            page = (await self.requests_get(url)).get("data")
+            if page is None:
+                return None
+            for game_data in page:
+                games_data[game_data.get("id")] = game_data
+        return games_data
+
     async def get_team_users(self, team_id):
         """
         Gets the users data about a given team
         :param team_id: The team name of the twitch team
         :return: the JSON information of the users
         """
-        url = 'https://api.twitch.tv/helix/teams?name=' + team_id
-        return (await self.requests_get(url)).get("data")[0].get("users")
+        url = self.api_url + '/teams?name=' + team_id
+        return (await self.requests_get(url, priority=TWITCH_PRIORITY_TEAMS)).get("data")[0].get("users")
 
 
 class TwitchAlertDBManager:
@@ -849,11 +1768,42 @@ class TwitchAlertDBManager:
             ON DELETE CASCADE 
         );"""
 
+        # TwitchPollState
+        sql_create_twitch_poll_state_table = """
+        CREATE TABLE IF NOT EXISTS TwitchPollState (
+        twitch_username text PRIMARY KEY,
+        last_polled real,
+        last_live real,
+        last_live_hour integer,
+        live_hours text NOT NULL
+        );"""
+
         # Create Tables
         self.database_manager.db_execute_commit(sql_create_twitch_alerts_table)
         self.database_manager.db_execute_commit(sql_create_user_in_twitch_alert_table)
         self.database_manager.db_execute_commit(sql_create_team_in_twitch_alert_table)
         self.database_manager.db_execute_commit(sql_create_user_in_twitch_team_table)
+        self.database_manager.db_execute_commit(sql_create_twitch_poll_state_table)
+
+    def get_poll_states(self):
+        """
+        Gets what the poll scheduler saved about each twitch user
+        :return: (twitch_username, last_polled, last_live, last_live_hour, live_hours) rows, empty if the select failed
+        """
+        return self.database_manager.db_execute_select(
+            "SELECT twitch_username, last_polled, last_live, last_live_hour, live_hours FROM TwitchPollState") or []
+
+    def save_poll_states(self, rows, removed):
+        """
+        Saves poll scheduler states in one transaction
+        :param rows: (twitch_username, last_polled, last_live, last_live_hour, live_hours) rows to save
+        :param removed: The twitch usernames whose states to delete
+        :return:
+        """
+        statements = [("INSERT OR REPLACE INTO TwitchPollState VALUES (?, ?, ?, ?, ?)", list(row)) for row in rows]
+        statements.extend(("DELETE FROM TwitchPollState WHERE twitch_username = ?", [login]) for login in removed)
+        if statements:
+            self.database_manager.db_execute_transaction(statements)
 
     def new_ta(self, guild_id, channel_id, default_message=None, replace=False):
         """
@@ -950,21 +1900,48 @@ class TwitchAlertDBManager:
         :param channel_id: discord channel ID which has the message
         :return:
         """
-        try:
-            channel = self.bot.get_channel(int(channel_id))
-            if channel is None:
-                logging.warning(f"TwitchAlert: Channel ID {channel_id} does not exist, removing from database")
+        await self.delete_messages(channel_id, [message_id])
+
+    async def delete_messages(self, channel_id, message_ids):
+        """
+        Deletes discord messages in a channel by ID, without fetching them first. Messages younger than 14 days are
+        bulk deleted when the bot can manage messages in the channel, the rest are deleted one at a time
+        :param channel_id: discord channel ID which has the messages
+        :param message_ids: discord message IDs of the messages to delete
+        :return:
+        """
+        channel = self.bot.get_channel(int(channel_id))
+        if channel is None:
+            logging.warning(f"TwitchAlert: Channel ID {channel_id} does not exist, removing from database")
+            sql_remove_invalid_channel = "DELETE FROM TwitchAlerts WHERE channel_id = ?"
+            await self.database_manager.async_manager.commit(sql_remove_invalid_channel, args=[channel_id])
+            return
+
+        single_deletes = list(message_ids)
+        if len(message_ids) > 1 and channel.permissions_for(channel.guild.me).manage_messages:
+            recent = [message_id for message_id in message_ids if message_age(message_id) < BULK_DELETE_MAX_AGE]
+            single_deletes = [message_id for message_id in message_ids if message_id not in recent]
+            for page in chunks(recent, BULK_DELETE_MAX_MESSAGES):
+                if len(page) == 1:
+                    single_deletes.extend(page)
+                    continue
+                try:
+                    await channel.delete_messages([channel.get_partial_message(message_id) for message_id in page])
+                except discord.errors.HTTPException as err:
+                    logging.warning(f"TwitchAlert: Bulk delete failed in Channel ID: {channel_id}, "
+                                    f"deleting one at a time \nError: {err}")
+                    single_deletes.extend(page)
+
+        for message_id in single_deletes:
+            try:
+                await channel.get_partial_message(message_id).delete()
+            except discord.errors.NotFound as err:
+                logging.warning(f"TwitchAlert: Message ID {message_id} does not exist, skipping \nError: {err}")
+            except discord.errors.Forbidden as err:
+                logging.warning(f"TwitchAlert: {err}  Channel ID: {channel_id}")
                 sql_remove_invalid_channel = "DELETE FROM TwitchAlerts WHERE channel_id = ?"
-                self.database_manager.db_execute_commit(sql_remove_invalid_channel, args=[channel_id])
+                await self.database_manager.async_manager.commit(sql_remove_invalid_channel, args=[channel_id])
                 return
-            message = await channel.fetch_message(message_id)
-            await message.delete()
-        except discord.errors.NotFound as err:
-            logging.warning(f"TwitchAlert: Message ID {message_id} does not exist, skipping \nError: {err}")
-        except discord.errors.Forbidden as err:
-            logging.warning(f"TwitchAlert: {err}  Channel ID: {channel_id}")
-            sql_remove_invalid_channel = "DELETE FROM TwitchAlerts WHERE channel_id = ?"
-            self.database_manager.db_execute_commit(sql_remove_invalid_channel, args=[channel_id])
 
     def get_users_in_ta(self, channel_id):
         """
@@ -1032,9 +2009,9 @@ class TwitchAlertDBManager:
                                  WHERE team_twitch_alert_id = ?"""
         message_ids = self.database_manager.db_execute_select(sql_get_message_id, args=[team_alert_id])
         if message_ids is not None:
-            for message_id in message_ids:
-                if message_id[0] is not None:
-                    await self.delete_message(message_id[0], channel_id)
+            message_ids = [message_id[0] for message_id in message_ids if message_id[0] is not None]
+            if message_ids:
+                await self.delete_messages(channel_id, message_ids)
         sql_remove_users = """DELETE FROM UserInTwitchTeam WHERE team_twitch_alert_id = ?"""
         sql_remove_team = """DELETE FROM TeamInTwitchAlert WHERE team_twitch_alert_id = ?"""
         self.database_manager.db_execute_commit(sql_remove_users, args=[team_alert_id])
@@ -1048,15 +2025,7 @@ class TwitchAlertDBManager:
         :return:
         """
         if re.search(TWITCH_USERNAME_REGEX, team_name):
-            users = await self.twitch_handler.get_team_users(team_name)
-            for user in users:
-                sql_add_user = """INSERT OR IGNORE INTO UserInTwitchTeam(team_twitch_alert_id, twitch_username) 
-                                   VALUES(?, ?)"""
-                try:
-                    self.database_manager.db_execute_commit(sql_add_user, args=[twitch_team_id, user.get("user_login")],
-                                                            pass_errors=True)
-                except KoalaDBManager.sqlite3.IntegrityError as err:
-                    logging.error(f"Twitch Alert: 1034: {err}")
+            await self.sync_team_members({team_name: [twitch_team_id]})
 
     async def update_all_teams_members(self):
         """
@@ -1064,15 +2033,91 @@ class TwitchAlertDBManager:
         :return:
         """
         sql_get_teams = """SELECT team_twitch_alert_id, twitch_team_name FROM TeamInTwitchAlert"""
-        teams_info = self.database_manager.db_execute_select(sql_get_teams)
-        for team_info in teams_info:
-            await self.update_team_members(team_info[0], team_info[1])
+        teams_info = await self.database_manager.async_manager.select(sql_get_teams)
+
+        # Index of team name -> team twitch alert ids, so each team is requested once however many channels follow it
+        team_alerts = {}
+        for team_twitch_alert_id, team_name in teams_info:
+            if re.search(TWITCH_USERNAME_REGEX, team_name):
+                team_alerts.setdefault(team_name, []).append(team_twitch_alert_id)
+        await self.sync_team_members(team_alerts)
 
-    async def delete_all_offline_streams(self, team: bool, usernames):
+    async def sync_team_members(self, team_alerts, max_concurrent_requests=TWITCH_MAX_CONCURRENT_REQUESTS):
+        """
+        Requests the members of each team, with several teams in flight at once, then adds new members and removes
+        members who left in a single transaction. Alerts posted for removed members are deleted
+        :param team_alerts: A dict of team name -> list of team twitch alert ids following the team
+        :param max_concurrent_requests: The maximum number of teams requested at once
+        :return:
+        """
+        if not team_alerts:
+            return
+        semaphore = asyncio.Semaphore(max_concurrent_requests)
+
+        async def get_members(team_name):
+            async with semaphore:
+                try:
+                    users = await self.twitch_handler.get_team_users(team_name)
+                except Exception as err:
+                    logging.warning(f"TwitchAlert: Failed to get members of team {team_name} {err}")
+                    return None
+            if users is None:
+                return None
+            return {user.get("user_login") for user in users}
+
+        team_names = list(team_alerts)
+        teams_members = await asyncio.gather(*(get_members(team_name) for team_name in team_names))
+
+        team_twitch_alert_ids = [team_twitch_alert_id for team_name, members in zip(team_names, teams_members)
+                                 if members is not None for team_twitch_alert_id in team_alerts[team_name]]
+        if not team_twitch_alert_ids:
+            return
+        sql_select_team_users = f"""
+        SELECT TITA.team_twitch_alert_id, TITA.channel_id, twitch_username, message_id
+        FROM UserInTwitchTeam
+        JOIN TeamInTwitchAlert TITA on UserInTwitchTeam.team_twitch_alert_id = TITA.team_twitch_alert_id
+        WHERE TITA.team_twitch_alert_id IN ({','.join(['?'] * len(team_twitch_alert_ids))})"""
+        current_members = {}
+        for team_twitch_alert_id, channel_id, username, message_id in \
+                await self.database_manager.async_manager.select(sql_select_team_users, args=team_twitch_alert_ids):
+            current_members.setdefault(team_twitch_alert_id, {})[username] = (channel_id, message_id)
+
+        sql_add_user = """INSERT OR IGNORE INTO UserInTwitchTeam(team_twitch_alert_id, twitch_username) 
+                           VALUES(?, ?)"""
+        sql_remove_user = """DELETE FROM UserInTwitchTeam WHERE team_twitch_alert_id = ? AND twitch_username = ?"""
+        changes = []
+        removed_messages = {}
+        for team_name, members in zip(team_names, teams_members):
+            if members is None:
+                continue
+            for team_twitch_alert_id in team_alerts[team_name]:
+                current = current_members.get(team_twitch_alert_id, {})
+                changes.extend((sql_add_user, [team_twitch_alert_id, username])
+                               for username in members.difference(current))
+                for username in set(current).difference(members):
+                    changes.append((sql_remove_user, [team_twitch_alert_id, username]))
+                    channel_id, message_id = current[username]
+                    if message_id is not None:
+                        removed_messages.setdefault(channel_id, []).append(message_id)
+
+        if changes:
+            try:
+                await self.database_manager.async_manager.transaction(changes, pass_errors=True)
+            except KoalaDBManager.sqlite3.Error as err:
+                logging.error(f"Twitch Alert: 1034: {err}")
+                return
+        fan_out = AlertFanOut()
+        for result in await fan_out.map(self.delete_messages, removed_messages.items()):
+            if isinstance(result, Exception):
+                logging.error(f"TwitchAlert: Failed to delete alert {result}")
+        fan_out.log_latency("Team Sync")
+
+    async def delete_all_offline_streams(self, team: bool, usernames, fan_out=None):
         """
         A method that deletes all currently offline streams
         :param team: True if the users are from teams, false if individuals
         :param usernames: The usernames of the team members
+        :param fan_out: The AlertFanOut limiting how many messages are deleted at once
         :return:
         """
         if team:
@@ -1100,12 +2145,18 @@ class TwitchAlertDBManager:
             SET message_id = NULL
             WHERE twitch_username in ({','.join(['?'] * len(usernames))})"""
 
-        results = self.database_manager.db_execute_select(
+        results = await self.database_manager.async_manager.select(
             sql_select_offline_streams_with_message_ids, usernames)
 
-        for result in results:
-            await self.delete_message(result[1], result[0])
-        self.database_manager.db_execute_commit(sql_update_offline_streams, usernames)
+        if fan_out is None:
+            fan_out = AlertFanOut()
+        channel_messages = {}
+        for channel_id, message_id in results:
+            channel_messages.setdefault(channel_id, []).append(message_id)
+        for result in await fan_out.map(self.delete_messages, channel_messages.items()):
+            if isinstance(result, Exception):
+                logging.error(f"TwitchAlert: Failed to delete alert {result}")
+        await self.database_manager.async_manager.commit(sql_update_offline_streams, usernames)
 
 
 def setup(bot: KoalaBot) -> None:
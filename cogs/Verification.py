@@ -136,19 +136,19 @@ class Verification(commands.Cog, name="Verify"):
         :param member: the member object who just joined a server
         :return:
         """
-        potential_emails = self.DBManager.db_execute_select("SELECT r_id, email_suffix FROM roles WHERE s_id=?",
-                                                            (member.guild.id,))
+        potential_emails = await self.DBManager.async_manager.select(
+            "SELECT r_id, email_suffix FROM roles WHERE s_id=?", (member.guild.id,))
         if potential_emails:
             roles = {}
             for role_id, suffix in potential_emails:
                 role = discord.utils.get(member.guild.roles, id=role_id)
                 roles[suffix] = role
-                results = self.DBManager.db_execute_select(
+                results = await self.DBManager.async_manager.select(
                     "SELECT * FROM verified_emails WHERE email LIKE ('%' || ?) AND u_id=?",
                     (suffix, member.id))
 
-                blacklisted = self.DBManager.db_execute_select("SELECT * FROM to_re_verify WHERE r_id=? AND u_id=?",
-                                                               (role_id, member.id))
+                blacklisted = await self.DBManager.async_manager.select(
+                    "SELECT * FROM to_re_verify WHERE r_id=? AND u_id=?", (role_id, member.id))
                 if results and not blacklisted:
                     await member.add_roles(role)
             message_string = f"""Welcome to {member.guild.name}. This guild has verification enabled.
@@ -353,11 +353,12 @@ This email is stored so you don't need to verify it multiple times across server
         if not exists:
             raise self.VerifyError("Verification is not enabled for that role")
         role = discord.utils.get(ctx.guild.roles, id=role_id)
+        to_re_verify = []
         for member in ctx.guild.members:
             if role in member.roles:
                 await member.remove_roles(role)
-                self.DBManager.db_execute_commit("INSERT INTO to_re_verify VALUES (?, ?)",
-                                                 (member.id, role.id))
+                to_re_verify.append(("INSERT OR IGNORE INTO to_re_verify VALUES (?, ?)", (member.id, role.id)))
+        self.DBManager.db_execute_transaction(to_re_verify)
         await ctx.send("That role has now been removed from all users and they will need to re-verify the associated email.")
 
     class InvalidArgumentError(Exception):
@@ -158,7 +158,7 @@ class Voting(commands.Cog, name="Vote"):
     @tasks.loop(seconds=30.0)
     async def vote_end_loop(self):
         now = time.time()
-        votes = self.DBManager.db_execute_select("SELECT * FROM Votes WHERE end_time < ?", (now,))
+        votes = await self.DBManager.async_manager.select("SELECT * FROM Votes WHERE end_time < ?", (now,))
         for v_id, a_id, g_id, title, _, _, end_time in votes:
             if v_id in self.vote_manager.sent_votes.keys():
                 vote = self.vote_manager.get_vote_from_id(v_id)
@@ -184,10 +184,11 @@ class Voting(commands.Cog, name="Vote"):
                             user = await self.bot.fetch_user(guild.owner_id)
                             await user.send(f"A vote in your guild titled {title} has closed and the chair is unavailable.")
                             await user.send(embed=embed)
-                    self.DBManager.db_execute_commit("DELETE FROM Votes WHERE vote_id=?", (vote.id,))
+                    await self.DBManager.async_manager.commit("DELETE FROM Votes WHERE vote_id=?", (vote.id,))
                     self.vote_manager.cancel_sent_vote(vote.id)
                 except Exception as e:
-                    self.DBManager.db_execute_commit("UPDATE Votes SET end_time=? WHERE vote_id=?", (time.time() + 86400, vote.id))
+                    await self.DBManager.async_manager.commit("UPDATE Votes SET end_time=? WHERE vote_id=?",
+                                                              (time.time() + 86400, vote.id))
                     logging.error(f"error in vote loop: {e}")
 
     @vote_end_loop.before_loop
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+"""
+Micro-benchmark of the per-reaction cost of ReactForRole as guilds grow, comparing the ID keyed member and role lookups
+get_role_member_info uses with the linear scans of guild.members and guild.roles it used to make
+
+Run from the repository root e.g.
+    python -m tests.benchmarks.bench_rfr_reactions --sizes 1000 10000 100000
+
+Commented using reStructuredText (reST)
+"""
+# Futures
+
+# Built-in/Generic Imports
+import argparse
+import asyncio
+import functools
+import random
+import tempfile
+import time
+
+# Libs
+import discord
+import emoji
+
+# Own modules
+import KoalaBot
+from utils import KoalaDBManager
+
+# Constants
+GUILD_ID = 1
+CHANNEL_ID = 2
+MESSAGE_ID = 3
+RFR_EMOJIS = ["👍", "🔥", "🎉", "🐨", "🌟", "📚", "🎮", "🎵", "⚽", "🍕"]
+
+# Variables
+
+
+@functools.total_ordering
+class FakeRole:
+    def __init__(self, role_id):
+        self.id = role_id
+
+    def __lt__(self, other):
+        return self.id < other.id
+
+
+class FakeMember:
+    def __init__(self, member_id):
+        self.id = member_id
+        self.bot = False
+
+
+def make_guild(num_members, num_roles):
+    """
+    Makes a guild holding its members and roles the way discord.py does, without a connection state
+
+    :param num_members: The number of members in the guild
+    :param num_roles: The number of roles in the guild
+    :return: The guild
+    """
+    guild = discord.Guild.__new__(discord.Guild)
+    guild.id = GUILD_ID
+    guild._members = {member_id: FakeMember(member_id) for member_id in range(1000, 1000 + num_members)}
+    guild._roles = {role_id: FakeRole(role_id) for role_id in range(100, 100 + num_roles)}
+    guild._channels = {}
+    return guild
+
+
+class FakeBot:
+    def __init__(self, guild):
+        self.guild = guild
+
+    def get_guild(self, guild_id):
+        return self.guild if guild_id == self.guild.id else None
+
+
+async def time_reactions(lookup, user_ids):
+    """
+    Times a lookup for each user reacting
+
+    :param lookup: The coroutine function looking up the member and role of a reaction by user ID
+    :param user_ids: The IDs of the users reacting
+    :return: The mean microseconds per reaction
+    """
+    start = time.perf_counter()
+    for user_id in user_ids:
+        assert await lookup(user_id)
+    return (time.perf_counter() - start) / len(user_ids) * 1e6
+
+
+async def run_benchmark(args):
+    """
+    Runs the benchmark, printing the per-reaction cost for each guild size
+
+    :param args: The benchmark arguments
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        # The cog uses KoalaBot's database manager, so point it at a throwaway database
+        KoalaBot.database_manager = KoalaDBManager.KoalaDBManager("bench_rfr_reactions.db", KoalaBot.DB_KEY,
+                                                                  directory)
+        from cogs import ReactForRole
+
+        print(f"{'members':>9} {'roles':>6} {'indexed (us)':>13} {'scan (us)':>10}")
+        try:
+            for size in args.sizes:
+                guild = make_guild(size, args.roles)
+                rfr_cog = ReactForRole.ReactForRole(FakeBot(guild))
+                rfr_database_manager = rfr_cog.rfr_database_manager
+                rfr_database_manager.remove_rfr_message(GUILD_ID, CHANNEL_ID, MESSAGE_ID)
+                rfr_database_manager.add_rfr_message(GUILD_ID, CHANNEL_ID, MESSAGE_ID)
+                emoji_role_id = rfr_database_manager.get_rfr_message(GUILD_ID, CHANNEL_ID, MESSAGE_ID)[3]
+                role_ids = random.sample(list(guild._roles), len(RFR_EMOJIS))
+                for rfr_emoji, role_id in zip(RFR_EMOJIS, role_ids):
+                    rfr_database_manager.add_rfr_message_emoji_role(emoji_role_id, emoji.demojize(rfr_emoji), role_id)
+                reacted_emoji = discord.PartialEmoji(name=RFR_EMOJIS[-1])
+                user_ids = random.choices(list(guild._members), k=args.reactions)
+
+                async def indexed_lookup(user_id):
+                    return await rfr_cog.get_role_member_info(reacted_emoji, GUILD_ID, CHANNEL_ID, MESSAGE_ID,
+                                                              user_id)
+
+                async def scan_lookup(user_id):
+                    member = discord.utils.get(guild.members, id=user_id)
+                    role = discord.utils.get(guild.roles, id=role_ids[-1])
+                    return member, role
+
+                indexed = await time_reactions(indexed_lookup, user_ids)
+                scan = await time_reactions(scan_lookup, user_ids)
+                print(f"{size:>9} {args.roles:>6} {indexed:>13.1f} {scan:>10.1f}")
+        finally:
+            KoalaBot.database_manager.close()
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the per-reaction cost of ReactForRole by guild size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Guild member counts")
+    parser.add_argument("--roles", type=int, default=250, help="Roles in each guild")
+    parser.add_argument("--reactions", type=int, default=200, help="Reactions timed for each guild size")
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(run_benchmark(parse_args()))
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+"""
+Load benchmark of the TwitchAlert live loop against a fake Twitch API, reporting the wall time, database queries,
+Twitch API requests and Discord requests of each tick
+
+Run from the repository root e.g.
+    python -m tests.benchmarks.bench_twitch_alert --users 5000 --teams 50 --channels 500 --latency 0.05
+
+Commented using reStructuredText (reST)
+"""
+# Futures
+
+# Built-in/Generic Imports
+import argparse
+import asyncio
+import datetime
+import itertools
+import logging
+import tempfile
+import time
+from collections import Counter
+
+# Libs
+import discord
+
+# Own modules
+import KoalaBot
+from cogs import TwitchAlert
+from utils import KoalaDBManager
+from tests.utils_testing.FakeTwitchAPI import FakeTwitchAPI
+
+# Constants
+
+# Variables
+message_ids = itertools.count()
+
+
+class FakeMessage:
+    def __init__(self, channel):
+        # Snowflakes for now, so bulk deletes treat the alerts as recent
+        self.id = discord.utils.time_snowflake(datetime.datetime.utcnow()) + next(message_ids) % (1 << 22)
+        self.channel = channel
+
+    async def delete(self):
+        self.channel.stats["deletes"] += 1
+
+
+class FakeChannel:
+    """
+    A text channel that counts the requests made to it instead of sending them to Discord
+    """
+
+    def __init__(self, channel_id, stats):
+        self.id = channel_id
+        self.stats = stats
+        self.guild = self
+        self.me = None
+
+    def permissions_for(self, member):
+        return discord.Permissions(send_messages=True, manage_messages=True)
+
+    async def send(self, embed=None):
+        self.stats["sends"] += 1
+        return FakeMessage(self)
+
+    def get_partial_message(self, message_id):
+        message = FakeMessage(self)
+        message.id = message_id
+        return message
+
+    async def delete_messages(self, messages):
+        self.stats["bulk_deletes"] += 1
+
+
+class FakeBot:
+    def __init__(self, channel_ids):
+        self.stats = Counter()
+        self.channels = {channel_id: FakeChannel(channel_id, self.stats) for channel_id in channel_ids}
+
+    def get_channel(self, id):
+        return self.channels.get(id)
+
+
+def count_queries(database_manager, stats):
+    """
+    Counts the selects and transactions run by a database manager
+
+    :param database_manager: The KoalaDBManager to count the queries of
+    :param stats: The Counter to count in
+    """
+    select = database_manager.db_execute_select
+    execute_transaction = database_manager._execute_transaction
+
+    def counted_select(*args, **kwargs):
+        stats["selects"] += 1
+        return select(*args, **kwargs)
+
+    def counted_transaction(*args, **kwargs):
+        stats["transactions"] += 1
+        return execute_transaction(*args, **kwargs)
+
+    database_manager.db_execute_select = counted_select
+    database_manager._execute_transaction = counted_transaction
+
+
+def seed_database(database_manager, fake_api, channel_ids, args):
+    """
+    Creates the twitch alerts of the benchmark, and the users and teams they follow in the fake Twitch API
+
+    :param database_manager: The KoalaDBManager to seed, with the TwitchAlert tables created
+    :param fake_api: The FakeTwitchAPI to seed
+    :param channel_ids: The channel IDs of the twitch alerts
+    :param args: The benchmark arguments
+    """
+    usernames = [f"benchuser{user}" for user in range(args.users)]
+    for user, username in enumerate(usernames):
+        fake_api.add_user(username, game_id=str(user % 50))
+
+    statements = []
+    for channel_id in channel_ids:
+        statements.append(("INSERT INTO GuildExtensions (extension_id, guild_id) VALUES ('TwitchAlert', ?)",
+                           [channel_id]))
+        statements.append(("INSERT INTO TwitchAlerts (guild_id, channel_id, default_message) VALUES (?, ?, ?)",
+                           [channel_id, channel_id, TwitchAlert.DEFAULT_MESSAGE]))
+    for user, username in enumerate(usernames):
+        for alert in range(args.alerts_per_user):
+            statements.append(("INSERT INTO UserInTwitchAlert (channel_id, twitch_username) VALUES (?, ?)",
+                               [channel_ids[(user + alert) % len(channel_ids)], username]))
+    for team in range(args.teams):
+        team_name = f"benchteam{team}"
+        members = [f"benchteam{team}member{member}" for member in range(args.team_size)]
+        fake_api.add_team(team_name, members)
+        statements.append(("INSERT INTO TeamInTwitchAlert (team_twitch_alert_id, channel_id, twitch_team_name) "
+                           "VALUES (?, ?, ?)", [team + 1, channel_ids[team % len(channel_ids)], team_name]))
+        statements.extend(("INSERT INTO UserInTwitchTeam (team_twitch_alert_id, twitch_username) VALUES (?, ?)",
+                           [team + 1, member]) for member in members)
+    database_manager.db_execute_transaction(statements, pass_errors=True)
+
+    for login in fake_api.random.sample(list(fake_api.users), int(len(fake_api.users) * args.live)):
+        fake_api.set_live(login)
+
+
+async def run_benchmark(args):
+    """
+    Runs the benchmark, printing the stats of each tick
+
+    :param args: The benchmark arguments
+    """
+    fake_api = FakeTwitchAPI(latency=args.latency, rate_limit=args.rate_limit, churn=args.churn, seed=args.seed)
+    await fake_api.start()
+    with tempfile.TemporaryDirectory() as directory:
+        database_manager = KoalaDBManager.KoalaDBManager("bench_twitch_alert.db", KoalaBot.DB_KEY, directory)
+        channel_ids = [1000 + channel for channel in range(args.channels)]
+        bot = FakeBot(channel_ids)
+        twitch_cog = TwitchAlert.TwitchAlert(bot, database_manager=database_manager)
+        seed_database(database_manager, fake_api, channel_ids, args)
+        if args.poll_budget is not None:
+            twitch_cog.poll_scheduler = TwitchAlert.PollScheduler(budget=args.poll_budget)
+        twitch_handler = TwitchAlert.TwitchAPIHandler("benchclientid", "benchsecret", api_url=fake_api.api_url,
+                                                      oauth_url=fake_api.oauth_url)
+        twitch_cog.ta_database_manager.twitch_handler = twitch_handler
+        count_queries(database_manager, bot.stats)
+
+        print(f"{args.users} users, {args.teams} teams of {args.team_size}, {args.channels} channels, "
+              f"{len(fake_api.live)} live")
+        print(f"{'tick':>8} {'wall (s)':>9} {'selects':>8} {'writes':>7} {'http':>6} {'429s':>5} "
+              f"{'sends':>6} {'deletes':>8} {'bulk':>5} {'live':>6}")
+        ticks = [("teams", twitch_cog.loop_update_teams)] if args.update_teams else []
+        ticks += [(str(tick), twitch_cog.loop_check_live) for tick in range(args.ticks)]
+        try:
+            for name, loop in ticks:
+                if name != "teams" and name != "0":
+                    fake_api.tick()
+                bot.stats.clear()
+                requests_before = sum(fake_api.requests.values())
+                throttled_before = fake_api.throttled
+                start = time.perf_counter()
+                await loop()
+                wall_time = time.perf_counter() - start
+                print(f"{name:>8} {wall_time:>9.3f} {bot.stats['selects']:>8} {bot.stats['transactions']:>7} "
+                      f"{sum(fake_api.requests.values()) - requests_before:>6} "
+                      f"{fake_api.throttled - throttled_before:>5} {bot.stats['sends']:>6} "
+                      f"{bot.stats['deletes']:>8} {bot.stats['bulk_deletes']:>5} "
+                      f"{len(twitch_cog.live_users or ()):>6}")
+        finally:
+            await twitch_handler.close_session()
+            await fake_api.stop()
+            database_manager.close()
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the TwitchAlert live loop against a fake Twitch API")
+    parser.add_argument("--users", type=int, default=1000, help="Twitch users followed individually")
+    parser.add_argument("--alerts-per-user", type=int, default=1, help="Channels following each user")
+    parser.add_argument("--teams", type=int, default=10, help="Twitch teams followed")
+    parser.add_argument("--team-size", type=int, default=50, help="Members of each team")
+    parser.add_argument("--channels", type=int, default=100, help="Channels with a twitch alert")
+    parser.add_argument("--live", type=float, default=0.1, help="Fraction of users live at the start")
+    parser.add_argument("--churn", type=float, default=0.02, help="Fraction of users going live or offline a tick")
+    parser.add_argument("--latency", type=float, default=0, help="Seconds each Twitch API request takes")
+    parser.add_argument("--rate-limit", type=int, default=800, help="Twitch API requests allowed a minute")
+    parser.add_argument("--poll-budget", type=int, default=None, help="Cold users polled a tick")
+    parser.add_argument("--ticks", type=int, default=5, help="Live loop ticks to run")
+    parser.add_argument("--update-teams", action="store_true", help="Refresh the team members before the ticks")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the live users and churn")
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.get_event_loop().run_until_complete(run_benchmark(parse_args()))
@@ -9,6 +9,7 @@ Commented using reStructuredText (reST)
 
 # Built-in/Generic Imports
 import os
+import threading
 
 # Libs
 import pytest
@@ -75,3 +76,221 @@ def test_format_db_path_linux_relative():
     db_path = KoalaDBManager.format_db_path("test_dir/", "test.db")
     assert db_path == "test_dir/test.db"
 
+
+@pytest.fixture
+def pooled_db_manager():
+    db_manager = KoalaDBManager.KoalaDBManager("KoalaPoolTest.db", "", pool_size=2)
+    yield db_manager
+    db_manager.close()
+    os.remove(db_manager.db_file_path)
+
+
+def test_pool_reuses_connections(pooled_db_manager):
+    pooled_db_manager.pool.connect = mock.MagicMock(wraps=pooled_db_manager.pool.connect)
+    pooled_db_manager.db_execute_commit("INSERT INTO GuildWelcomeMessages VALUES (?, ?)", args=[1, "hi"])
+    assert pooled_db_manager.fetch_guild_welcome_message(1) == "hi"
+    pooled_db_manager.pool.connect.assert_not_called()
+
+
+def test_pool_same_thread_shares_connection(pooled_db_manager):
+    with pooled_db_manager.pool.connection() as outer:
+        with pooled_db_manager.pool.connection() as inner:
+            assert outer is inner
+
+
+def test_pool_replaces_unhealthy_connection(pooled_db_manager):
+    with pooled_db_manager.pool.connection() as conn:
+        pass
+    conn.close()
+    with pooled_db_manager.pool.connection() as new_conn:
+        assert new_conn is not conn
+        assert new_conn.execute("SELECT 1").fetchall() == [(1,)]
+
+
+def test_pool_exhausted_times_out():
+    pool = KoalaDBManager.KoalaDBConnectionPool(mock.MagicMock(), 1, checkout_timeout=0.01)
+    checked_out = pool._acquire()
+    with pytest.raises(TimeoutError):
+        pool._acquire()
+    pool._release(checked_out)
+    assert pool._acquire() is checked_out
+
+
+@pytest.fixture
+def async_db_manager():
+    db_manager = KoalaDBManager.KoalaDBManager("KoalaAsyncTest.db", "")
+    yield db_manager.async_manager
+    db_manager.close()
+    os.remove(db_manager.db_file_path)
+
+
+@pytest.mark.asyncio
+async def test_async_commit_then_select(async_db_manager):
+    await async_db_manager.commit("INSERT INTO GuildWelcomeMessages VALUES (?, ?)", args=[1, "hi"])
+    assert await async_db_manager.select("SELECT welcome_message FROM GuildWelcomeMessages WHERE guild_id = ?",
+                                         args=[1]) == [("hi",)]
+
+
+@pytest.mark.asyncio
+async def test_async_runs_off_event_loop_thread(async_db_manager):
+    thread_name = await async_db_manager.run(lambda: threading.current_thread().name)
+    assert thread_name != threading.current_thread().name
+    assert thread_name.startswith("KoalaDB")
+
+
+@pytest.mark.asyncio
+async def test_async_run_uses_pinned_connection(async_db_manager):
+    async_db_manager.database_manager.create_connection = mock.MagicMock()
+    assert await async_db_manager.run(async_db_manager.database_manager.fetch_guild_welcome_message, 1) is None
+    async_db_manager.database_manager.create_connection.assert_not_called()
+
+
+@pytest.fixture
+def write_behind_db_manager():
+    db_manager = KoalaDBManager.KoalaDBManager("KoalaWriteBehindTest.db", "", write_behind_interval=60,
+                                               write_behind_batch_size=3)
+    yield db_manager
+    db_manager.close()
+    os.remove(db_manager.db_file_path)
+
+
+def count_welcome_messages(db_manager):
+    conn = db_manager.open_connection()
+    count = conn.execute("SELECT COUNT(*) FROM GuildWelcomeMessages").fetchall()[0][0]
+    conn.close()
+    return count
+
+
+def test_write_behind_buffers_commits(write_behind_db_manager):
+    write_behind_db_manager.db_execute_commit("INSERT INTO GuildWelcomeMessages VALUES (?, ?)", args=[1, "hi"])
+    assert count_welcome_messages(write_behind_db_manager) == 0
+    write_behind_db_manager.flush()
+    assert count_welcome_messages(write_behind_db_manager) == 1
+
+
+def test_write_behind_select_reads_own_writes(write_behind_db_manager):
+    write_behind_db_manager.db_execute_commit("INSERT INTO GuildWelcomeMessages VALUES (?, ?)", args=[1, "hi"])
+    assert write_behind_db_manager.fetch_guild_welcome_message(1) == "hi"
+
+
+def test_write_behind_full_batch_flushes_early(write_behind_db_manager):
+    for guild_id in range(3):
+        write_behind_db_manager.db_execute_commit("INSERT INTO GuildWelcomeMessages VALUES (?, ?)",
+                                                  args=[guild_id, "hi"])
+    for _ in range(100):
+        if count_welcome_messages(write_behind_db_manager) == 3:
+            break
+        threading.Event().wait(0.01)
+    assert count_welcome_messages(write_behind_db_manager) == 3
+
+
+def test_write_behind_bad_statement_keeps_rest_of_batch(write_behind_db_manager):
+    write_behind_db_manager.db_execute_commit("INSERT INTO GuildWelcomeMessages VALUES (?, ?)", args=[1, "hi"])
+    write_behind_db_manager.db_execute_commit("INSERT INTO MissingTable VALUES (?)", args=[1])
+    write_behind_db_manager.flush()
+    assert count_welcome_messages(write_behind_db_manager) == 1
+
+
+def test_write_behind_drains_on_close():
+    db_manager = KoalaDBManager.KoalaDBManager("KoalaWriteBehindTest.db", "", write_behind_interval=60)
+    db_manager.db_execute_commit("INSERT INTO GuildWelcomeMessages VALUES (?, ?)", args=[1, "hi"])
+    db_manager.close()
+    assert count_welcome_messages(db_manager) == 1
+    os.remove(db_manager.db_file_path)
+
+
+def test_transaction_is_atomic(pooled_db_manager):
+    with pytest.raises(Exception):
+        pooled_db_manager.db_execute_transaction([("INSERT INTO GuildWelcomeMessages VALUES (?, ?)", [1, "hi"]),
+                                                  ("INSERT INTO MissingTable VALUES (?)", [1])], pass_errors=True)
+    assert pooled_db_manager.fetch_guild_welcome_message(1) is None
+
+
+@pytest.fixture
+def migration_db_manager():
+    db_manager = KoalaDBManager.KoalaDBManager("KoalaMigrationTest.db", "")
+    yield db_manager
+    db_manager.close()
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(db_manager.db_file_path + suffix):
+            os.remove(db_manager.db_file_path + suffix)
+
+
+def test_connection_pragmas(migration_db_manager):
+    conn = migration_db_manager.open_connection()
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    assert conn.execute("PRAGMA cache_size").fetchone()[0] == -KoalaDBManager.DB_CACHE_SIZE_KIB
+    conn.close()
+
+
+def test_connection_failure_raises_sqlite_error(migration_db_manager):
+    with mock.patch.object(KoalaDBManager.sqlite3, "connect",
+                           side_effect=KoalaDBManager.sqlite3.OperationalError("unable to open")):
+        with pytest.raises(KoalaDBManager.sqlite3.OperationalError):
+            migration_db_manager.db_execute_select("SELECT 1", pass_errors=True)
+        assert migration_db_manager.db_execute_select("SELECT 1") is None
+
+def test_migrate_enables_wal_and_indexes_existing_tables(migration_db_manager):
+    assert migration_db_manager.migrate() == 1
+    assert migration_db_manager.db_execute_select("PRAGMA journal_mode") == [("wal",)]
+    assert migration_db_manager.db_execute_select(
+        "SELECT name FROM sqlite_master WHERE type='index' AND name='idx_GuildExtensions_guild_id'") != []
+
+
+@mock.patch("utils.KoalaDBManager.MIGRATIONS", [
+    [(None, "CREATE TABLE IF NOT EXISTS MigrationTest (a, b)")],
+    [("MigrationTest", "CREATE INDEX IF NOT EXISTS idx_MigrationTest_b ON MigrationTest (b)")]])
+def test_migrate_records_version_once(migration_db_manager):
+    assert migration_db_manager.migrate() == 2
+    assert migration_db_manager.db_execute_select("PRAGMA user_version") == [(2,)]
+    assert migration_db_manager.migrate() == 2
+
+
+@mock.patch("utils.KoalaDBManager.MIGRATIONS", [
+    [("MigrationTest", "CREATE INDEX IF NOT EXISTS idx_MigrationTest_b ON MigrationTest (b)")]])
+def test_migrate_waits_for_missing_tables(migration_db_manager):
+    assert migration_db_manager.migrate() == 0
+    migration_db_manager.db_execute_commit("CREATE TABLE MigrationTest (a, b)")
+    assert migration_db_manager.migrate() == 1
+
+
+@pytest.fixture
+def extension_db_manager():
+    db_manager = KoalaDBManager.KoalaDBManager("KoalaExtensionCacheTest.db", "")
+    db_manager.insert_extension("Test", 0, True, True)
+    yield db_manager
+    db_manager.close()
+    os.remove(db_manager.db_file_path)
+
+
+def test_extension_enabled_is_cached(extension_db_manager):
+    extension_db_manager.give_guild_extension(1, "Test")
+    extension_db_manager.db_execute_select = mock.MagicMock(wraps=extension_db_manager.db_execute_select)
+    assert extension_db_manager.extension_enabled(1, "Test")
+    assert extension_db_manager.extension_enabled(1, "Test")
+    assert not extension_db_manager.extension_enabled(1, "Other")
+    extension_db_manager.db_execute_select.assert_called_once()
+
+
+def test_extension_cache_invalidated_on_change(extension_db_manager):
+    assert not extension_db_manager.extension_enabled(1, "Test")
+    extension_db_manager.give_guild_extension(1, "Test")
+    assert extension_db_manager.extension_enabled(1, "Test")
+    extension_db_manager.remove_guild_extension(1, "Test")
+    assert not extension_db_manager.extension_enabled(1, "Test")
+
+
+def test_extension_failed_select_not_cached(extension_db_manager):
+    extension_db_manager.give_guild_extension(1, "Test")
+    with mock.patch.object(extension_db_manager, "db_execute_select", mock.MagicMock(return_value=None)):
+        assert not extension_db_manager.extension_enabled(1, "Test")
+    assert extension_db_manager.extension_enabled(1, "Test")
+
+def test_extension_cache_expires(extension_db_manager):
+    assert not extension_db_manager.extension_enabled(1, "Test")
+    extension_db_manager.db_execute_commit("INSERT INTO GuildExtensions VALUES (?, ?)", args=["Test", 1])
+    assert not extension_db_manager.extension_enabled(1, "Test")
+    with mock.patch("time.monotonic",
+                    mock.MagicMock(return_value=KoalaDBManager.time.monotonic() +
+                                   KoalaDBManager.GUILD_EXTENSIONS_CACHE_TTL + 1)):
+        assert extension_db_manager.extension_enabled(1, "Test")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""
+Testing KoalaBot Regex Sandbox
+
+Commented using reStructuredText (reST)
+"""
+# Futures
+
+# Built-in/Generic Imports
+import subprocess
+
+# Libs
+import mock
+import pytest
+
+# Own modules
+from utils import KoalaRegexSandbox
+
+# Constants
+
+# Variables
+
+
+@pytest.fixture
+def sandbox():
+    regex_sandbox = KoalaRegexSandbox.RegexSandbox(time_budget=0.5)
+    yield regex_sandbox
+    regex_sandbox.close()
+
+
+@pytest.mark.parametrize("pattern", [r"[a-z0-9]+[\._]?[a-z0-9]+[@]+[herts]+[.ac.uk]", r"^verify [a-z]+@soton\.ac\.uk$",
+                                     r"(ab?)+", r"(a|b)*c", r"(a{2})+", r"(foo|bar)+", r"(?:Foo|foo)+",
+                                     r"(a|(a|b)c)"])
+def test_check_regex_complexity_safe(pattern):
+    assert KoalaRegexSandbox.check_regex_complexity(pattern) is None
+
+
+@pytest.mark.parametrize("pattern", [r"(a+)+$", r"(a*)*b", r"(\w+\s?)*$", r"(x|(y+))+", r"(x)\1",
+                                     r"(a|a)*b", r"(a|ab)*c", r"(\d|1x)+", r"(.|x)*", r"(?i:Foo|foo)+",
+                                     "a" * (KoalaRegexSandbox.MAX_REGEX_LENGTH + 1)])
+def test_check_regex_complexity_unsafe(pattern):
+    assert KoalaRegexSandbox.check_regex_complexity(pattern) is not None
+
+
+def test_sandbox_worker_does_not_import_the_bot(sandbox):
+    command = sandbox.command[:1] + ["-X", "importtime"] + sandbox.command[1:]
+    worker = subprocess.run(command, input=b"", stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30)
+    assert worker.returncode == 0
+    imported = {line.rsplit("|", 1)[-1].strip() for line in worker.stderr.decode().splitlines()}
+    assert "re" in imported
+    assert not imported & {"KoalaBot", "__mp_main__", "discord", "utils", "cogs"}
+
+
+def test_sandbox_first_match(sandbox):
+    assert sandbox.first_match([("risky", "x"), ("banned", "b+")], "abc") == "banned"
+    assert sandbox.first_match([("banned", "x")], "abc") is None
+
+
+def test_sandbox_times_out_and_recovers(sandbox):
+    with pytest.raises(KoalaRegexSandbox.RegexTimeoutError):
+        sandbox.first_match([("banned", r"(a+)+$")], "a" * 40 + "b")
+    assert sandbox.process is None
+    assert sandbox.first_match([("banned", "b")], "abc") == "banned"
+
+
+@pytest.mark.asyncio
+async def test_sandbox_search(sandbox):
+    assert await sandbox.search([("banned", "b")], "abc") == "banned"
+
+
+@pytest.mark.asyncio
+async def test_sandbox_search_restarts_worker(sandbox):
+    with pytest.raises(KoalaRegexSandbox.RegexTimeoutError):
+        await sandbox.search([("banned", r"(a+)+$")], "a" * 40 + "b")
+    assert not sandbox.is_running()
+    with mock.patch.object(sandbox, "start", wraps=sandbox.start) as start:
+        assert await sandbox.search([("banned", "b")], "abc") == "banned"
+    start.assert_called_once_with()
+    with pytest.raises(KoalaRegexSandbox.RegexSandboxStoppedError):
+        sandbox.close()
+        sandbox.first_match([("banned", "b")], "abc", start=False)
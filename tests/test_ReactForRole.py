@@ -8,13 +8,16 @@ Commented using reStructuredText (reST)
 # Futures
 
 # Built-in/Generic Imports
+import asyncio
 import random
+import threading
 from typing import *
 
 # Libs
 import aiohttp
 import discord
 import discord.ext.test as dpytest
+import emoji
 import mock
 import pytest
 from discord.ext import commands
@@ -824,8 +827,7 @@ async def test_rfr_edit_inline_all(arg):
                     await dpytest.message("k!rfr edit inline")
                     assert dpytest.verify().message()
                     assert dpytest.verify().message()
-                    assert dpytest.verify().message().content(
-                        "Keep in mind that this process may take a while if you have a lot of RFR messages on your server.")
+                    assert dpytest.verify().message().content("Running edit inline on rfr messages: 0/2 done.")
                     assert dpytest.verify().message().content("Okay, the process should be finished now. Please check.")
 
 
@@ -907,6 +909,41 @@ async def test_rfr_remove_roles_from_msg():
                         remove_emoji_role.has_calls(calls)
 
 
+@pytest.mark.asyncio
+async def test_rfr_remove_custom_emoji_from_msg(rfr_cog):
+    config: dpytest.RunnerConfig = dpytest.get_config()
+    guild: discord.Guild = config.guilds[0]
+    channel: discord.TextChannel = guild.text_channels[0]
+    message: discord.Message = await dpytest.message("rfr")
+    rfr_cog.rfr_database_manager.add_rfr_message(guild.id, channel.id, message.id)
+    emoji_role_id = rfr_cog.rfr_database_manager.get_rfr_message(guild.id, channel.id, message.id)[3]
+    custom_role = testutils.fake_guild_role(guild)
+    unicode_role = testutils.fake_guild_role(guild)
+    rfr_cog.rfr_database_manager.add_rfr_message_emoji_role(emoji_role_id, "<:koala:123>", custom_role.id)
+    rfr_cog.rfr_database_manager.add_rfr_message_emoji_role(emoji_role_id, ":thumbs_up:", unicode_role.id)
+    embed: discord.Embed = discord.Embed(title="title", description="description")
+    embed.add_field(name="<:koala:123>", value=custom_role.mention, inline=False)
+    embed.add_field(name=emoji.emojize(":thumbs_up:"), value=unicode_role.mention, inline=False)
+    custom_emoji = mock.MagicMock(spec=discord.Emoji)
+    custom_emoji.__str__.return_value = "<:koala:123>"
+    reaction = mock.MagicMock(emoji=custom_emoji, clear=mock.AsyncMock())
+    message.reactions = [reaction]
+
+    input_msg: discord.Message = dpytest.back.make_message("<:koala:123>", config.members[0], channel)
+    with mock.patch('cogs.ReactForRole.ReactForRole.get_rfr_message_from_prompts',
+                    mock.AsyncMock(return_value=(message, channel))), \
+            mock.patch('cogs.ReactForRole.ReactForRole.get_embed_from_message', return_value=embed), \
+            mock.patch('utils.KoalaUtils.wait_for_message', return_value=(input_msg, None)), \
+            mock.patch('cogs.ReactForRole.ReactForRole.get_first_emoji_from_str',
+                       mock.AsyncMock(return_value=custom_emoji)):
+        await dpytest.message(KoalaBot.COMMAND_PREFIX + "rfr edit removeRoles")
+
+    reaction.clear.assert_awaited_once_with()
+    assert DBManager.get_rfr_message_emoji_roles(emoji_role_id) == [(emoji_role_id, ":thumbs_up:", unicode_role.id)]
+    assert rfr_cog.rfr_database_manager.get_indexed_rfr_message_roles(guild.id, channel.id, message.id) == \
+        {":thumbs_up:": unicode_role.id}
+
+
 # role-check tests
 @pytest.mark.parametrize("num_roles, num_required",
                          [(0, 0), (1, 0), (1, 1), (2, 0), (2, 1), (2, 2), (5, 1), (5, 2), (20, 5)])
@@ -937,6 +974,48 @@ async def test_can_have_rfr_role(num_roles, num_required, rfr_cog):
                 x in required for x in member.roles), f"\n\r{member.roles}\n\r{required}"
 
 
+@pytest.mark.asyncio
+async def test_rfr_required_roles_cached(rfr_cog):
+    config: dpytest.RunnerConfig = dpytest.get_config()
+    guild: discord.Guild = config.guilds[0]
+    member: discord.Member = config.members[0]
+    required_role = testutils.fake_guild_role(guild)
+    rfr_database_manager = rfr_cog.rfr_database_manager
+    assert rfr_database_manager.get_cached_guild_rfr_required_roles(guild.id) is None
+    assert rfr_cog.can_have_rfr_role(member)
+    assert rfr_database_manager.get_cached_guild_rfr_required_roles(guild.id) == frozenset()
+
+    rfr_database_manager.add_guild_rfr_required_role(guild.id, required_role.id)
+    assert rfr_database_manager.get_cached_guild_rfr_required_roles(guild.id) is None
+    assert not rfr_cog.can_have_rfr_role(member)
+    await member.add_roles(required_role)
+    with mock.patch.object(rfr_database_manager, "get_guild_rfr_required_roles") as get_required_roles:
+        assert rfr_cog.can_have_rfr_role(member)
+        get_required_roles.assert_not_called()
+
+    rfr_database_manager.remove_guild_rfr_required_role(guild.id, required_role.id)
+    assert rfr_database_manager.get_cached_guild_rfr_required_roles(guild.id) is None
+    assert rfr_database_manager.get_guild_rfr_required_role_set(guild.id) == frozenset()
+
+
+@pytest.mark.asyncio
+async def test_rfr_list_required_roles(rfr_cog):
+    config: dpytest.RunnerConfig = dpytest.get_config()
+    guild: discord.Guild = config.guilds[0]
+    roles = [testutils.fake_guild_role(guild) for _ in range(3)]
+    for role in roles:
+        rfr_cog.rfr_database_manager.add_guild_rfr_required_role(guild.id, role.id)
+    await dpytest.message(KoalaBot.COMMAND_PREFIX + "rfr listRequiredRoles")
+    assert dpytest.verify().message().content(
+        "You will need one of these roles to react to rfr messages on this server:\n" +
+        "".join(f"{role.mention}\n" for role in sorted(roles, reverse=True)))
+
+    for role in roles:
+        rfr_cog.rfr_database_manager.remove_guild_rfr_required_role(guild.id, role.id)
+    await dpytest.message(KoalaBot.COMMAND_PREFIX + "rfr listRequiredRoles")
+    assert dpytest.verify().message().content("Anyone can react to rfr messages on this server.")
+
+
 @pytest.mark.skip("No support for reactions")
 @pytest.mark.asyncio
 async def test_rfr_without_req_role():
@@ -967,3 +1046,309 @@ def setup_is_dpytest():
 async def setup_clean_messages():
     await dpytest.empty_queue()
     yield dpytest
+
+
+def test_rfr_message_index_kept_in_sync():
+    rfr_db_manager = ReactForRoleDBManager(KoalaBot.database_manager)
+    rfr_db_manager.load_rfr_message_index()
+    guild_id, channel_id, message_id = (random.randint(1, 10 ** 18) for _ in range(3))
+    assert rfr_db_manager.get_indexed_rfr_message_roles(guild_id, channel_id, message_id) is None
+
+    rfr_db_manager.add_rfr_message(guild_id, channel_id, message_id)
+    emoji_role_id = rfr_db_manager.get_rfr_message(guild_id, channel_id, message_id)[3]
+    rfr_db_manager.add_rfr_message_emoji_role(emoji_role_id, ":thumbs_up:", 1)
+    rfr_db_manager.add_rfr_message_emoji_role(emoji_role_id, "<:koala:123>", 2)
+    # Rejected by the database as the role is already on the message
+    rfr_db_manager.add_rfr_message_emoji_role(emoji_role_id, ":fire:", 2)
+    assert rfr_db_manager.get_indexed_rfr_message_roles(guild_id, channel_id, message_id) == \
+        {":thumbs_up:": 1, "123": 2}
+    reloaded_db_manager = ReactForRoleDBManager(KoalaBot.database_manager)
+    reloaded_db_manager.load_rfr_message_index()
+    assert reloaded_db_manager.get_indexed_rfr_message_roles(guild_id, channel_id, message_id) == \
+        {":thumbs_up:": 1, "123": 2}
+
+    rfr_db_manager.remove_rfr_message_emoji_role(emoji_role_id, role_id=2)
+    assert rfr_db_manager.get_indexed_rfr_message_roles(guild_id, channel_id, message_id) == {":thumbs_up:": 1}
+    rfr_db_manager.remove_rfr_message_emoji_role(emoji_role_id, emoji_raw=":thumbs_up:")
+    assert rfr_db_manager.get_indexed_rfr_message_roles(guild_id, channel_id, message_id) == {}
+    assert rfr_db_manager.get_indexed_guild_rfr_messages(guild_id) == {(channel_id, message_id): {}}
+
+    rfr_db_manager.remove_rfr_message(guild_id, channel_id, message_id)
+    assert rfr_db_manager.get_indexed_rfr_message_roles(guild_id, channel_id, message_id) is None
+    assert rfr_db_manager.get_indexed_guild_rfr_messages(guild_id) == {}
+
+
+@pytest.mark.asyncio
+async def test_rfr_message_index_retried_after_failed_load(rfr_cog):
+    rfr_db_manager = rfr_cog.rfr_database_manager
+    guild_id, channel_id, message_id = (random.randint(1, 10 ** 18) for _ in range(3))
+    rfr_db_manager.add_rfr_message(guild_id, channel_id, message_id)
+    rfr_db_manager.rfr_message_index = None
+    query_threads = []
+
+    def failed_select(*args, **kwargs):
+        query_threads.append(threading.current_thread())
+        return None
+
+    with mock.patch.object(KoalaBot.database_manager, "db_execute_select", side_effect=failed_select):
+        await rfr_cog.load_rfr_message_index()
+        assert rfr_db_manager.get_indexed_rfr_message_roles(guild_id, channel_id, message_id) is None
+        assert rfr_db_manager.get_indexed_guild_rfr_messages(guild_id) == {}
+        # Not retried until the delay has passed, which doubles after each failure
+        await rfr_cog.load_rfr_message_index()
+        assert rfr_cog.rfr_index_retry_delay == 2 * ReactForRole.RFR_INDEX_RETRY_DELAY
+        rfr_cog.rfr_index_retry_time = 0
+        await rfr_cog.load_rfr_message_index()
+        assert rfr_cog.rfr_index_retry_delay == 4 * ReactForRole.RFR_INDEX_RETRY_DELAY
+    assert len(query_threads) == 2
+    assert threading.main_thread() not in query_threads
+    assert rfr_db_manager.rfr_message_index is None
+
+    rfr_cog.rfr_index_retry_time = 0
+    await rfr_cog.load_rfr_message_index()
+    assert rfr_db_manager.get_indexed_rfr_message_roles(guild_id, channel_id, message_id) == {}
+    assert rfr_cog.rfr_index_retry_delay == ReactForRole.RFR_INDEX_RETRY_DELAY
+    rfr_db_manager.remove_rfr_message(guild_id, channel_id, message_id)
+
+
+def test_rfr_message_index_lock_not_held_for_queries():
+    rfr_db_manager = ReactForRoleDBManager(KoalaBot.database_manager)
+    rfr_db_manager.load_rfr_message_index()
+    guild_id, channel_id, message_id = (random.randint(1, 10 ** 18) for _ in range(3))
+    select = KoalaBot.database_manager.db_execute_select
+    lock = rfr_db_manager.index_lock
+    held = []
+
+    def check_lock():
+        if lock.acquire(blocking=False):
+            lock.release()
+            held.append(False)
+        else:
+            held.append(True)
+
+    def select_checking_lock(*args, **kwargs):
+        # An RLock can be re-acquired by its owner, so check from another thread
+        thread = threading.Thread(target=check_lock)
+        thread.start()
+        thread.join()
+        return select(*args, **kwargs)
+
+    with mock.patch.object(KoalaBot.database_manager, "db_execute_select", side_effect=select_checking_lock):
+        rfr_db_manager.add_rfr_message(guild_id, channel_id, message_id)
+        emoji_role_id = rfr_db_manager.get_rfr_message(guild_id, channel_id, message_id)[3]
+        rfr_db_manager.add_rfr_message_emoji_role(emoji_role_id, ":thumbs_up:", 1)
+    assert held and not any(held)
+    assert rfr_db_manager.get_indexed_rfr_message_roles(guild_id, channel_id, message_id) == {":thumbs_up:": 1}
+    rfr_db_manager.remove_rfr_message(guild_id, channel_id, message_id)
+
+@pytest.mark.asyncio
+async def test_rfr_reactions_use_index(rfr_cog):
+    config: dpytest.RunnerConfig = dpytest.get_config()
+    guild: discord.Guild = config.guilds[0]
+    channel: discord.TextChannel = guild.text_channels[0]
+    member: discord.Member = config.members[0]
+    role: discord.Role = testutils.fake_guild_role(guild)
+    message_id = random.randint(1, 10 ** 18)
+    rfr_cog.rfr_database_manager.add_rfr_message(guild.id, channel.id, message_id)
+    emoji_role_id = rfr_cog.rfr_database_manager.get_rfr_message(guild.id, channel.id, message_id)[3]
+    rfr_cog.rfr_database_manager.add_rfr_message_emoji_role(emoji_role_id, emoji.demojize("👍"), role.id)
+    payload = mock.MagicMock(guild_id=guild.id, channel_id=channel.id, message_id=message_id, user_id=member.id,
+                             member=member, emoji=discord.PartialEmoji(name="👍"))
+
+    with mock.patch.object(rfr_cog.rfr_database_manager, "get_rfr_message") as get_rfr_message, \
+            mock.patch.object(rfr_cog, "can_have_rfr_role", return_value=True), \
+            mock.patch("discord.abc.Messageable.fetch_message", mock.AsyncMock()) as fetch_message, \
+            mock.patch("discord.Member.add_roles", mock.AsyncMock()) as add_roles, \
+            mock.patch("discord.Member.remove_roles", mock.AsyncMock()) as remove_roles:
+        await rfr_cog.on_raw_reaction_add(payload)
+        await rfr_cog.on_raw_reaction_remove(payload)
+        payload.message_id += 1
+        await rfr_cog.on_raw_reaction_add(payload)
+
+    add_roles.assert_called_once_with(role)
+    remove_roles.assert_called_once_with(role)
+    get_rfr_message.assert_not_called()
+    fetch_message.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_role_member_info_looks_up_by_id(rfr_cog):
+    config: dpytest.RunnerConfig = dpytest.get_config()
+    guild: discord.Guild = config.guilds[0]
+    channel: discord.TextChannel = guild.text_channels[0]
+    member: discord.Member = config.members[0]
+    role: discord.Role = testutils.fake_guild_role(guild)
+    message_id = random.randint(1, 10 ** 18)
+    rfr_cog.rfr_database_manager.add_rfr_message(guild.id, channel.id, message_id)
+    emoji_role_id = rfr_cog.rfr_database_manager.get_rfr_message(guild.id, channel.id, message_id)[3]
+    rfr_cog.rfr_database_manager.add_rfr_message_emoji_role(emoji_role_id, emoji.demojize("🔥"), role.id)
+
+    with mock.patch("discord.Guild.members", new_callable=mock.PropertyMock) as members, \
+            mock.patch("discord.Guild.roles", new_callable=mock.PropertyMock) as roles:
+        assert await rfr_cog.get_role_member_info(discord.PartialEmoji(name="🔥"), guild.id, channel.id,
+                                                  message_id, member.id) == (member, role)
+        assert await rfr_cog.get_role_member_info(discord.PartialEmoji(name="🔥"), guild.id, channel.id,
+                                                  message_id, 1234) is None
+    members.assert_not_called()
+    roles.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_rfr_revoke_roles_without_required_role(rfr_cog):
+    config: dpytest.RunnerConfig = dpytest.get_config()
+    guild: discord.Guild = config.guilds[0]
+    channel: discord.TextChannel = guild.text_channels[0]
+    member: discord.Member = config.members[0]
+    held_roles = [testutils.fake_guild_role(guild) for _ in range(2)]
+    other_role = testutils.fake_guild_role(guild)
+    reacted_role = testutils.fake_guild_role(guild)
+    for role in held_roles:
+        await member.add_roles(role)
+    message_ids = [random.randint(1, 10 ** 18) for _ in range(2)]
+    combos = [(message_ids[0], "🔥", held_roles[0]), (message_ids[0], "🎉", other_role),
+              (message_ids[1], "👍", held_roles[1]), (message_ids[1], "🐨", reacted_role)]
+    for message_id in message_ids:
+        rfr_cog.rfr_database_manager.add_rfr_message(guild.id, channel.id, message_id)
+    for message_id, rfr_emoji, role in combos:
+        emoji_role_id = rfr_cog.rfr_database_manager.get_rfr_message(guild.id, channel.id, message_id)[3]
+        rfr_cog.rfr_database_manager.add_rfr_message_emoji_role(emoji_role_id, emoji.demojize(rfr_emoji), role.id)
+    payload = mock.MagicMock(guild_id=guild.id, channel_id=channel.id, message_id=message_ids[1], user_id=member.id,
+                             member=member, emoji=discord.PartialEmoji(name="🐨"))
+
+    with mock.patch.object(rfr_cog, "can_have_rfr_role", return_value=False), \
+            mock.patch("discord.abc.Messageable.fetch_message", mock.AsyncMock()) as fetch_message, \
+            mock.patch("discord.Member.remove_roles", mock.AsyncMock()) as remove_roles, \
+            mock.patch("discord.PartialMessage.remove_reaction", autospec=True) as remove_reaction:
+        await rfr_cog.on_raw_reaction_add(payload)
+
+    remove_roles.assert_called_once()
+    assert set(remove_roles.call_args[0]) == set(held_roles) and remove_roles.call_args[1]["atomic"] is False
+    assert sorted((call[0][0].id, str(call[0][1])) for call in remove_reaction.call_args_list) == \
+        sorted([(message_ids[0], "🔥"), (message_ids[1], "👍"), (message_ids[1], "🐨")])
+    assert all(call[0][2] == member for call in remove_reaction.call_args_list)
+    fetch_message.assert_not_called()
+
+
+def make_bulk_guild(message_ids, fetch_message):
+    channel = mock.MagicMock(id=1)
+    channel.fetch_message = fetch_message
+    guild = mock.MagicMock(id=2)
+    guild.get_channel = lambda channel_id: channel if channel_id == channel.id else None
+    status_channel = mock.MagicMock()
+    status_channel.send = mock.AsyncMock(return_value=mock.MagicMock(edit=mock.AsyncMock()))
+    return guild, status_channel, [(channel.id, message_id) for message_id in message_ids]
+
+
+@pytest.mark.asyncio
+async def test_rfr_bulk_operation_bounded_concurrency():
+    running = 0
+    most_running = 0
+
+    async def operation(msg):
+        nonlocal running, most_running
+        running += 1
+        most_running = max(most_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    guild, status_channel, rfr_messages = make_bulk_guild(range(10), mock.AsyncMock(side_effect=lambda id: id))
+    bulk_operation = ReactForRole.RFRBulkOperation("test", operation, rfr_messages, max_concurrent=3)
+    assert await bulk_operation.run(guild, status_channel)
+    assert most_running == 3 and bulk_operation.done == 10 and not bulk_operation.pending
+    status_channel.send.assert_called_once_with("Running test on rfr messages: 0/10 done.")
+    status_message = status_channel.send.return_value
+    status_message.edit.assert_called_with(content="Finished test on rfr messages: 10/10 done.")
+
+
+@pytest.mark.asyncio
+async def test_rfr_bulk_operation_retries_and_resumes():
+    response = mock.MagicMock(status=500, reason="Internal Server Error")
+    attempts = {}
+
+    async def operation(msg):
+        attempts[msg] = attempts.get(msg, 0) + 1
+        if msg == 1 and attempts[msg] < 3:
+            raise discord.HTTPException(response, "error")
+        if msg == 2:
+            raise discord.HTTPException(response, "error")
+
+    async def fetch_message(message_id):
+        if message_id == 3:
+            raise discord.NotFound(mock.MagicMock(status=404, reason="Not Found"), "Unknown Message")
+        return message_id
+
+    guild, status_channel, rfr_messages = make_bulk_guild(range(4), fetch_message)
+    rfr_messages.append((3, 4))
+    bulk_operation = ReactForRole.RFRBulkOperation("test", operation, rfr_messages, max_attempts=3, retry_delay=0)
+    assert not await bulk_operation.run(guild, status_channel)
+    assert attempts == {0: 1, 1: 3, 2: 3}
+    assert bulk_operation.pending == [(1, 2)]
+    assert set(bulk_operation.missing) == {(1, 3), (3, 4)}
+    assert "2/5 done, 1 failed, 2 skipped as missing or not rfr messages" in status_channel.send.return_value.edit.call_args[1]["content"]
+
+    bulk_operation.operation = mock.AsyncMock()
+    assert await bulk_operation.run(guild, status_channel)
+    bulk_operation.operation.assert_called_once_with(2)
+    assert not bulk_operation.pending and bulk_operation.total == 1
+
+
+@pytest.mark.asyncio
+async def test_rfr_resume_bulk_operation(rfr_cog):
+    config: dpytest.RunnerConfig = dpytest.get_config()
+    guild: discord.Guild = config.guilds[0]
+    channel: discord.TextChannel = guild.text_channels[0]
+    await dpytest.message(KoalaBot.COMMAND_PREFIX + "rfr edit resume")
+    assert dpytest.verify().message().content(
+        "There's nothing to resume, every rfr operation on this server has finished.")
+
+    operation = mock.AsyncMock()
+    rfr_cog.rfr_bulk_operations[guild.id] = ReactForRole.RFRBulkOperation("test", operation, [(channel.id, 1)])
+    with mock.patch("discord.abc.Messageable.fetch_message", mock.AsyncMock(return_value="msg")):
+        await dpytest.message(KoalaBot.COMMAND_PREFIX + "rfr edit resume")
+    operation.assert_called_once_with("msg")
+    assert dpytest.verify().message().content("Running test on rfr messages: 0/1 done.")
+    assert dpytest.verify().message().content("Okay, the process should be finished now. Please check.")
+    assert guild.id not in rfr_cog.rfr_bulk_operations
+
+
+@pytest.mark.asyncio
+async def test_rfr_fix_embed_from_database(rfr_cog):
+    config: dpytest.RunnerConfig = dpytest.get_config()
+    guild: discord.Guild = config.guilds[0]
+    channel: discord.TextChannel = guild.text_channels[0]
+    role: discord.Role = testutils.fake_guild_role(guild)
+    msg = mock.MagicMock(id=random.randint(1, 10 ** 18), channel=channel, reactions=[mock.MagicMock(emoji="🔥")],
+                         embeds=[discord.Embed(title="title", description="description")],
+                         clear_reaction=mock.AsyncMock(), add_reaction=mock.AsyncMock(), edit=mock.AsyncMock())
+    assert not await rfr_cog.fix_rfr_embed(guild, msg)
+
+    rfr_cog.rfr_database_manager.add_rfr_message(guild.id, channel.id, msg.id)
+    emoji_role_id = rfr_cog.rfr_database_manager.get_rfr_message(guild.id, channel.id, msg.id)[3]
+    rfr_cog.rfr_database_manager.add_rfr_message_emoji_role(emoji_role_id, emoji.demojize("👍"), role.id)
+    assert await rfr_cog.fix_rfr_embed(guild, msg)
+    msg.clear_reaction.assert_called_once_with("🔥")
+    msg.add_reaction.assert_called_once_with("👍")
+    embed = msg.edit.call_args[1]["embed"]
+    assert [(field.name, field.value) for field in embed.fields] == [("👍", role.mention)]
+    assert dpytest.verify().message().nothing()
+    rfr_cog.rfr_database_manager.remove_rfr_message(guild.id, channel.id, msg.id)
+
+
+@pytest.mark.asyncio
+async def test_rfr_bulk_operation_skips_non_rfr_messages():
+    guild, status_channel, rfr_messages = make_bulk_guild(range(2), mock.AsyncMock(side_effect=lambda id: id))
+    bulk_operation = ReactForRole.RFRBulkOperation("test", mock.AsyncMock(side_effect=[True, False]), rfr_messages)
+    assert await bulk_operation.run(guild, status_channel)
+    assert bulk_operation.done == 1 and len(bulk_operation.missing) == 1 and not bulk_operation.pending
+
+
+@pytest.mark.parametrize("sql_str", ["SELECT * FROM GuildRFRMessages WHERE guild_id = ? AND channel_id = ? AND "
+                                     "message_id = ?",
+                                     "SELECT * FROM GuildRFRMessages WHERE guild_id = ? AND 0 = ? AND 0 = ?",
+                                     "SELECT * FROM RFRMessageEmojiRoles WHERE emoji_role_id = ? AND 0 = ? AND 0 = ?",
+                                     "SELECT * FROM RFRMessageEmojiRoles WHERE emoji_role_id = ? AND emoji_raw = ? "
+                                     "AND 0 = ?",
+                                     "SELECT * FROM GuildRFRRequiredRoles WHERE guild_id = ? AND 0 = ? AND 0 = ?"])
+def test_rfr_lookups_use_indexes(sql_str):
+    plan = KoalaBot.database_manager.db_execute_select("EXPLAIN QUERY PLAN " + sql_str, args=[1, 2, 3])
+    assert plan and all("USING" in row[-1] and "INDEX" in row[-1] for row in plan), plan
@@ -19,7 +19,7 @@ from cogs import BaseCog
 from cogs import TextFilter
 from tests.utils_testing import LastCtxCog
 from tests.utils_testing.TestUtils import assert_activity
-from utils import KoalaDBManager
+from utils import KoalaDBManager, KoalaRegexSandbox
 from utils.KoalaColours import *
 from utils.KoalaUtils import is_int
 
@@ -446,6 +446,140 @@ async def test_list_ignored():
     await dpytest.message(KoalaBot.COMMAND_PREFIX + "listIgnored")
     assert listIgnoredEmbed([dpytest.get_config().guilds[0].channels[0], mes.author])
 
+def test_filter_engine_matches_literals_and_regex():
+    engine = TextFilter.FilterEngine([("no", "banned", "0"), ("yup", "risky", "0"), (r"ab+c", "banned", "1"),
+                                      (r"[0-9]{3}", "risky", "1")])
+    assert engine.match("nothing here") == [("no", "banned", "0")]
+    assert engine.match("abbbc 123 yup") == [("yup", "risky", "0"), (r"ab+c", "banned", "1"),
+                                             (r"[0-9]{3}", "risky", "1")]
+    assert engine.match("fine") == []
+
+
+def test_filter_engine_banned_outranks_risky():
+    engine = TextFilter.FilterEngine([("yup", "risky", "0"), ("no", "banned", "0")])
+    assert engine.most_severe("yup no") == "banned"
+    assert engine.most_severe("yup") == "risky"
+    assert engine.most_severe("fine") is None
+
+
+def test_filter_engine_regex_not_treated_as_literal_when_not_regex():
+    engine = TextFilter.FilterEngine([("a.c", "banned", "0")])
+    assert engine.most_severe("abc") is None
+    assert engine.most_severe("a.c") == "banned"
+
+
+def test_filter_engine_backreference_rule():
+    engine = TextFilter.FilterEngine([(r"(x)\1", "banned", "1"), (r"(y)z", "banned", "1")])
+    assert engine.match("xx yz") == [(r"(x)\1", "banned", "1"), (r"(y)z", "banned", "1")]
+    assert engine.most_severe("xy") is None
+
+
+def test_filter_engine_global_flag_rule():
+    engine = TextFilter.FilterEngine([(r"(?i)foo", "banned", "1"), (r"bar", "banned", "1"), (r"baz", "banned", "1")])
+    assert len(engine.regexes["banned"]) == 2
+    assert engine.match("FOO BAR baz") == [(r"(?i)foo", "banned", "1"), (r"baz", "banned", "1")]
+    assert engine.most_severe("BAR") is None
+
+
+def test_filter_engine_cached_until_rules_change(tf_cog):
+    guild_id = dpytest.get_config().guilds[0].id
+    tf_cog.tf_database_manager.new_filtered_text(guild_id, "cachetest", "risky", False)
+    engine = tf_cog.tf_database_manager.get_filter_engine(guild_id)
+    assert tf_cog.tf_database_manager.get_filter_engine(guild_id) is engine
+    assert engine.most_severe("cachetest") == "risky"
+
+    tf_cog.tf_database_manager.remove_filter_text(guild_id, "cachetest")
+    assert tf_cog.tf_database_manager.get_cached_filter_engine(guild_id) is None
+    assert tf_cog.tf_database_manager.get_filter_engine(guild_id).most_severe("cachetest") is None
+    cleanup(guild_id, tf_cog)
+
+
+def test_ignore_lists_cached_until_ignores_change(tf_cog):
+    guild_id = dpytest.get_config().guilds[0].id
+    tf_cog.tf_database_manager.new_ignore(guild_id, "user", 1234)
+    tf_cog.tf_database_manager.new_ignore(guild_id, "channel", "5678")
+    ignore_lists = tf_cog.tf_database_manager.get_ignore_lists(guild_id)
+    assert ignore_lists.users == {1234}
+    assert ignore_lists.channels == {5678}
+    assert tf_cog.tf_database_manager.get_ignore_lists(guild_id) is ignore_lists
+
+    tf_cog.tf_database_manager.remove_ignore(guild_id, 1234)
+    tf_cog.tf_database_manager.remove_ignore(guild_id, 5678)
+    assert tf_cog.tf_database_manager.get_cached_ignore_lists(guild_id) is None
+    assert tf_cog.tf_database_manager.get_ignore_lists(guild_id).users == set()
+
+
+@pytest.mark.asyncio()
+async def test_ignored_channel_is_not_scanned(tf_cog):
+    channel = dpytest.get_config().guilds[0].channels[0]
+    await dpytest.message(KoalaBot.COMMAND_PREFIX + "ignoreChannel " + channel.mention)
+    assertNewIgnore(channel.mention)
+
+    with mock.patch("cogs.TextFilter.FilterEngine.most_severe") as most_severe:
+        await dpytest.message("anything")
+        most_severe.assert_not_called()
+    tf_cog.tf_database_manager.remove_ignore(channel.guild.id, channel.id)
+
+
+@pytest.mark.asyncio()
+async def test_filter_regex_rejects_catastrophic_backtracking(tf_cog):
+    with pytest.raises(Exception):
+        await dpytest.message(KoalaBot.COMMAND_PREFIX + r"filter_regex (a+)+$")
+    assert tf_cog.tf_database_manager.get_filtered_text_for_guild(dpytest.get_config().guilds[0].id) == []
+
+
+@pytest.mark.asyncio()
+async def test_sandboxed_regex_filter(tf_cog):
+    tf_cog.regex_sandbox = KoalaRegexSandbox.RegexSandbox()
+    await dpytest.message(KoalaBot.COMMAND_PREFIX + r"filter_regex ab+c")
+    assertFilteredConfirmation("ab+c", "banned")
+
+    await dpytest.message("abbbc")
+    assertBannedWarning("abbbc")
+    await dpytest.message("ac")
+    assert dpytest.verify().message().nothing()
+
+    tf_cog.cog_unload()
+    cleanup(dpytest.get_config().guilds[0].id, tf_cog)
+
+
+def test_regex_sandbox_started_with_cog(bot):
+    with mock.patch("cogs.TextFilter.REGEX_SANDBOX", True):
+        cog = TextFilter.TextFilter(bot)
+    assert cog.regex_sandbox.is_running()
+    cog.cog_unload()
+    assert not cog.regex_sandbox.is_running()
+
+@pytest.mark.asyncio()
+async def test_sandboxed_regex_timeout_reported(tf_cog):
+    channel = dpytest.backend.make_text_channel(name="TestChannel", guild=dpytest.get_config().guilds[0])
+    dpytest.get_config().channels.append(channel)
+    await dpytest.message(KoalaBot.COMMAND_PREFIX + "setupModChannel " + str(channel.id))
+    assert dpytest.verify().message().embed(embed=createNewModChannelEmbed(channel))
+    await dpytest.message(KoalaBot.COMMAND_PREFIX + r"filter_regex ab+c")
+    assertFilteredConfirmation("ab+c", "banned")
+
+    tf_cog.regex_sandbox = mock.MagicMock()
+    tf_cog.regex_sandbox.search = mock.AsyncMock(side_effect=KoalaRegexSandbox.RegexTimeoutError())
+    message = await dpytest.message("abbbc")
+    assert dpytest.verify().message().embed(embed=TextFilter.build_moderation_regex_timeout_embed(message))
+    assert dpytest.verify().message().nothing()
+    tf_cog.tf_database_manager.remove_mod_channel(channel.guild.id, channel.id)
+    cleanup(dpytest.get_config().guilds[0].id, tf_cog)
+
+
+@pytest.mark.asyncio()
+async def test_banned_word_outranks_risky_word(tf_cog):
+    await dpytest.message(KoalaBot.COMMAND_PREFIX + "filter_word yup risky")
+    assertFilteredConfirmation("yup", "risky")
+    await dpytest.message(KoalaBot.COMMAND_PREFIX + "filter_word nope banned")
+    assertFilteredConfirmation("nope", "banned")
+
+    await dpytest.message("yup nope")
+    assertBannedWarning("yup nope")
+    cleanup(dpytest.get_config().guilds[0].id, tf_cog)
+
+
 @pytest.fixture(autouse=True)
 async def clear_queue():
     await dpytest.empty_queue()
@@ -456,3 +590,14 @@ def setup_is_dpytest():
     KoalaBot.is_dpytest = True
     yield
     KoalaBot.is_dpytest = False
+
+
+@pytest.mark.asyncio()
+async def test_moderation_channels_unavailable(tf_cog):
+    message = mock.MagicMock()
+    message.guild.id = dpytest.get_config().guilds[0].id
+    with mock.patch.object(tf_cog.tf_database_manager, "get_mod_channel", return_value=None):
+        await tf_cog.send_to_moderation_channels(message)
+    with mock.patch.object(tf_cog.tf_database_manager, "get_mod_channel", return_value=[(1234,)]):
+        await tf_cog.send_to_moderation_channels(message)
+    assert dpytest.verify().message().nothing()
@@ -10,6 +10,8 @@ Commented using reStructuredText (reST)
 # Built-in/Generic Imports
 import os
 import asyncio
+import datetime
+import time
 
 # Libs
 import discord.ext.test as dpytest
@@ -24,6 +26,8 @@ import KoalaBot
 from cogs import TwitchAlert
 from utils import KoalaDBManager
 from utils.KoalaColours import *
+from tests.utils_testing.FakeEventSub import FakeEventSub, eventsub_timestamp
+from tests.utils_testing.FakeTwitchAPI import FakeTwitchAPI
 
 # Constants
 DB_PATH = "KoalaBotTwitchTest.db"
@@ -364,6 +368,292 @@ async def test_loop_check_live(twitch_cog):
     assert dpytest.verify().message().embed(expected_embed)
 
 
+@pytest.fixture
+async def twitch_loop_cog(bot):
+    database_manager = KoalaDBManager.KoalaDBManager("KoalaBotTwitchLoopTest.db", KoalaBot.DB_KEY,
+                                                     KoalaBot.config_dir)
+    twitch_cog = TwitchAlert.TwitchAlert(bot, database_manager=database_manager)
+    guild = dpytest.get_config().guilds[0]
+    database_manager.give_guild_extension(guild.id, "TwitchAlert")
+    twitch_cog.ta_database_manager.new_ta(guild.id, guild.channels[0].id)
+    yield twitch_cog
+    database_manager.close()
+    os.remove(database_manager.db_file_path)
+
+
+@pytest.mark.asyncio
+async def test_loop_check_live_bulk(twitch_loop_cog):
+    channel = dpytest.get_config().guilds[0].channels[0]
+    for username in ["monstercat", "offlineuser"]:
+        twitch_loop_cog.ta_database_manager.add_user_to_ta(channel.id, username, None, channel.guild.id)
+    live_embed = discord.Embed(title="monstercat is live")
+    twitch_loop_cog.ta_database_manager.twitch_handler.get_streams_data = mock.AsyncMock(
+        return_value=[{'user_login': 'monstercat', 'type': 'live'}])
+    twitch_loop_cog.create_alert_embed = mock.AsyncMock(return_value=live_embed)
+    twitch_loop_cog.async_db_manager.select = mock.AsyncMock(wraps=twitch_loop_cog.async_db_manager.select)
+    twitch_handler = twitch_loop_cog.ta_database_manager.twitch_handler
+    twitch_handler.get_users_data = mock.AsyncMock(return_value={})
+    twitch_handler.get_games_data = mock.AsyncMock(return_value={})
+
+    await twitch_loop_cog.loop_check_live()
+
+    assert dpytest.verify().message().embed(live_embed)
+    assert sorted(twitch_loop_cog.ta_database_manager.twitch_handler.get_streams_data.call_args[0][0]) == \
+        ["monstercat", "offlineuser"]
+    # One bulk select for the alerts, nobody was live before so there are no offline streams to clear
+    assert twitch_loop_cog.async_db_manager.select.call_count == 1
+    message_ids = twitch_loop_cog.ta_database_manager.database_manager.db_execute_select(
+        "SELECT twitch_username, message_id FROM UserInTwitchAlert ORDER BY twitch_username")
+    assert message_ids[0][0] == "monstercat" and message_ids[0][1] is not None
+    assert message_ids[1] == ("offlineuser", None)
+    twitch_handler.get_users_data.assert_called_once_with(["monstercat"])
+    twitch_handler.get_games_data.assert_called_once_with([])
+
+
+@pytest.mark.asyncio
+async def test_loop_check_live_saves_poll_states(twitch_loop_cog, bot):
+    channel = dpytest.get_config().guilds[0].channels[0]
+    twitch_loop_cog.ta_database_manager.add_user_to_ta(channel.id, "offlineuser", None, channel.guild.id)
+    twitch_loop_cog.ta_database_manager.twitch_handler.get_streams_data = mock.AsyncMock(return_value=[])
+
+    await twitch_loop_cog.loop_check_live()
+
+    restarted_cog = TwitchAlert.TwitchAlert(bot, database_manager=twitch_loop_cog.ta_database_manager.database_manager)
+    restarted_cog.ta_database_manager.twitch_handler.get_streams_data = mock.AsyncMock(return_value=[])
+    await restarted_cog.loop_check_live()
+    # Polled a moment ago by the last run, so not due yet
+    restarted_cog.ta_database_manager.twitch_handler.get_streams_data.assert_not_called()
+    assert restarted_cog.poll_scheduler.states["offlineuser"].last_polled == \
+        twitch_loop_cog.poll_scheduler.states["offlineuser"].last_polled
+
+
+@pytest.mark.asyncio
+async def test_loop_check_team_live_bulk(twitch_loop_cog):
+    channel = dpytest.get_config().guilds[0].channels[0]
+    database_manager = twitch_loop_cog.ta_database_manager.database_manager
+    database_manager.db_execute_commit("INSERT INTO TeamInTwitchAlert(team_twitch_alert_id, channel_id, "
+                                       "twitch_team_name) VALUES(900, ?, 'koalateam')", args=[channel.id])
+    for username in ["monstercat", "offlineuser"]:
+        database_manager.db_execute_commit("INSERT INTO UserInTwitchTeam(team_twitch_alert_id, twitch_username) "
+                                           "VALUES(900, ?)", args=[username])
+    live_embed = discord.Embed(title="monstercat is live")
+    twitch_loop_cog.ta_database_manager.twitch_handler.get_streams_data = mock.AsyncMock(
+        return_value=[{'user_login': 'monstercat', 'type': 'live'}])
+    twitch_loop_cog.create_alert_embed = mock.AsyncMock(return_value=live_embed)
+    twitch_loop_cog.ta_database_manager.twitch_handler.get_users_data = mock.AsyncMock(return_value={})
+    twitch_loop_cog.ta_database_manager.twitch_handler.get_games_data = mock.AsyncMock(return_value={})
+
+    await twitch_loop_cog.loop_check_live()
+
+    assert dpytest.verify().message().embed(live_embed)
+    message_ids = database_manager.db_execute_select(
+        "SELECT twitch_username, message_id FROM UserInTwitchTeam ORDER BY twitch_username")
+    assert message_ids[0][0] == "monstercat" and message_ids[0][1] is not None
+    assert message_ids[1] == ("offlineuser", None)
+
+
+@pytest.mark.asyncio
+async def test_loop_check_live_user_and_team(twitch_loop_cog):
+    channel = dpytest.get_config().guilds[0].channels[0]
+    database_manager = twitch_loop_cog.ta_database_manager.database_manager
+    twitch_loop_cog.ta_database_manager.add_user_to_ta(channel.id, "monstercat", None, channel.guild.id)
+    database_manager.db_execute_commit("INSERT INTO TeamInTwitchAlert(team_twitch_alert_id, channel_id, "
+                                       "twitch_team_name) VALUES(901, ?, 'koalateam')", args=[channel.id])
+    database_manager.db_execute_commit("INSERT INTO UserInTwitchTeam(team_twitch_alert_id, twitch_username) "
+                                       "VALUES(901, 'monstercat')")
+    twitch_handler = twitch_loop_cog.ta_database_manager.twitch_handler
+    twitch_handler.get_streams_data = mock.AsyncMock(return_value=[{'user_login': 'monstercat', 'type': 'live'}])
+    twitch_handler.get_users_data = mock.AsyncMock(return_value={})
+    twitch_handler.get_games_data = mock.AsyncMock(return_value={})
+    twitch_loop_cog.create_alert_embed = mock.AsyncMock(return_value=discord.Embed(title="monstercat is live"))
+
+    await twitch_loop_cog.loop_check_live()
+
+    twitch_handler.get_streams_data.assert_called_once_with(["monstercat"])
+    assert twitch_loop_cog.create_alert_embed.call_count == 1
+    assert database_manager.db_execute_select("SELECT message_id FROM UserInTwitchAlert "
+                                              "WHERE twitch_username = 'monstercat'")[0][0] is not None
+    assert database_manager.db_execute_select("SELECT message_id FROM UserInTwitchTeam "
+                                              "WHERE twitch_username = 'monstercat'")[0][0] is not None
+    assert twitch_loop_cog.live_users == {"monstercat"}
+
+
+@pytest.mark.asyncio
+async def test_loop_check_live_transitions(twitch_loop_cog):
+    channel = dpytest.get_config().guilds[0].channels[0]
+    twitch_loop_cog.ta_database_manager.add_user_to_ta(channel.id, "monstercat", None, channel.guild.id)
+    twitch_handler = twitch_loop_cog.ta_database_manager.twitch_handler
+    twitch_handler.get_users_data = mock.AsyncMock(return_value={})
+    twitch_handler.get_games_data = mock.AsyncMock(return_value={})
+    twitch_loop_cog.create_alert_embed = mock.AsyncMock(return_value=discord.Embed(title="monstercat is live"))
+    twitch_loop_cog.ta_database_manager.delete_all_offline_streams = mock.AsyncMock()
+
+    twitch_handler.get_streams_data = mock.AsyncMock(return_value=[{'user_login': 'monstercat', 'type': 'live'}])
+    await twitch_loop_cog.loop_check_live()
+    await twitch_loop_cog.loop_check_live()
+    # Still live, so the second tick has nothing to do
+    assert twitch_loop_cog.create_alert_embed.call_count == 1
+    twitch_handler.get_users_data.assert_called_once()
+    twitch_loop_cog.ta_database_manager.delete_all_offline_streams.assert_not_called()
+
+    twitch_handler.get_streams_data = mock.AsyncMock(return_value=[])
+    await twitch_loop_cog.loop_check_live()
+    await twitch_loop_cog.loop_check_live()
+    assert twitch_loop_cog.ta_database_manager.delete_all_offline_streams.call_args_list == \
+        [mock.call(False, ["monstercat"], fan_out=mock.ANY), mock.call(True, ["monstercat"], fan_out=mock.ANY)]
+    assert twitch_loop_cog.live_users == set()
+
+
+@pytest.mark.asyncio
+async def test_loop_check_live_seeds_live_users(twitch_loop_cog):
+    channel = dpytest.get_config().guilds[0].channels[0]
+    database_manager = twitch_loop_cog.ta_database_manager.database_manager
+    database_manager.db_execute_commit("INSERT INTO UserInTwitchAlert(channel_id, twitch_username, message_id) "
+                                       "VALUES(?, 'wentoffline', 1234)", args=[channel.id])
+    twitch_loop_cog.ta_database_manager.twitch_handler.get_streams_data = mock.AsyncMock(return_value=[])
+    twitch_loop_cog.ta_database_manager.delete_all_offline_streams = mock.AsyncMock()
+
+    await twitch_loop_cog.loop_check_live()
+
+    twitch_loop_cog.ta_database_manager.delete_all_offline_streams.assert_any_call(False, ["wentoffline"],
+                                                                                   fan_out=mock.ANY)
+
+
+@pytest.mark.asyncio
+async def test_loop_check_live_skips_cold_users(twitch_loop_cog):
+    channel = dpytest.get_config().guilds[0].channels[0]
+    twitch_loop_cog.ta_database_manager.add_user_to_ta(channel.id, "colduser", None, channel.guild.id)
+    twitch_handler = twitch_loop_cog.ta_database_manager.twitch_handler
+    twitch_handler.get_streams_data = mock.AsyncMock(return_value=[])
+
+    await twitch_loop_cog.loop_check_live()
+    await twitch_loop_cog.loop_check_live()
+
+    twitch_handler.get_streams_data.assert_called_once_with(["colduser"])
+
+
+def test_poll_scheduler_intervals():
+    scheduler = TwitchAlert.PollScheduler(budget=0, tick=60)
+    now = 1000 * 24 * 60 * 60
+    assert scheduler.due_logins(["cold", "hot", "live"], set(), now) == ["cold", "hot", "live"]
+    scheduler.record(["cold", "hot", "live"], {"hot", "live"}, now)
+
+    # Only users live within the hot window are polled again the next minute
+    assert scheduler.due_logins(["cold", "hot", "live"], {"live"}, now + 60) == ["live", "hot"]
+    scheduler.record(["live", "hot"], {"live"}, now + 60)
+    assert scheduler.due_logins(["cold", "hot", "live"], {"live"}, now + TwitchAlert.POLL_COLD_INTERVAL) == \
+        ["live", "hot", "cold"]
+
+    # Users not live for a while are polled less often
+    later = now + TwitchAlert.POLL_HOT_WINDOW + 12 * 60 * 60
+    scheduler.record(["hot"], set(), later)
+    assert "hot" not in scheduler.due_logins(["hot"], set(), later + 60)
+    assert "hot" in scheduler.due_logins(["hot"], set(), later + TwitchAlert.POLL_WARM_INTERVAL)
+
+    # Removed users are forgotten
+    scheduler.due_logins(["hot"], set(), later)
+    assert list(scheduler.states) == ["hot"]
+
+
+def test_poll_scheduler_typical_hours():
+    scheduler = TwitchAlert.PollScheduler(budget=0, tick=60)
+    day = 24 * 60 * 60
+    start = 1000 * day + 20 * 60 * 60
+    for days_ago in [30, 29]:
+        scheduler.record(["regular"], {"regular"}, start - days_ago * day)
+    # Polled a minute ago, but usually live at this hour
+    scheduler.record(["regular"], set(), start - 60)
+    assert scheduler.due_logins(["regular"], set(), start) == ["regular"]
+    scheduler.record(["regular"], set(), start + 6 * 60 * 60 - 60)
+    assert scheduler.due_logins(["regular"], set(), start + 6 * 60 * 60) == []
+
+
+def test_poll_scheduler_changes_and_load():
+    scheduler = TwitchAlert.PollScheduler(budget=0, tick=60)
+    day = 24 * 60 * 60
+    start = 1000 * day + 20 * 60 * 60
+    for days_ago in [30, 29]:
+        scheduler.record(["regular", "gone"], {"regular"}, start - days_ago * day)
+    scheduler.record(["regular"], set(), start - 60)
+    rows, removed = scheduler.changes()
+    assert sorted(row[0] for row in rows) == ["gone", "regular"] and removed == []
+    assert scheduler.changes() == ([], [])
+    scheduler.due_logins(["regular"], set(), start)
+    assert scheduler.changes() == ([], ["gone"])
+
+    restored = TwitchAlert.PollScheduler(budget=0, tick=60)
+    restored.load(rows)
+    assert restored.due_logins(["regular"], set(), start) == ["regular"]
+    assert restored.states["regular"].live_hours == scheduler.states["regular"].live_hours
+
+
+def test_poll_scheduler_budget():
+    scheduler = TwitchAlert.PollScheduler(budget=1, tick=60)
+    logins = [f"user{i}" for i in range(150)]
+    scheduler.record(logins[:100], set(), 0)
+    due = scheduler.due_logins(logins, {"user0"}, TwitchAlert.POLL_COLD_INTERVAL)
+    assert len(due) == TwitchAlert.TWITCH_MAX_LOGINS_PER_REQUEST
+    # Live users first, then users never polled
+    assert due[:51] == ["user0"] + logins[100:]
+
+
+class FakeAlertChannel:
+    def __init__(self, channel_id, tracker, error=None):
+        self.id = channel_id
+        self.tracker = tracker
+        self.error = error
+
+    async def send(self, embed):
+        self.tracker["in_flight"] += 1
+        self.tracker["max_in_flight"] = max(self.tracker["max_in_flight"], self.tracker["in_flight"])
+        await asyncio.sleep(0.01)
+        self.tracker["in_flight"] -= 1
+        if self.error is not None:
+            raise self.error
+        self.tracker["embeds"][self.id] = embed
+        return mock.MagicMock(id=self.id + 1000)
+
+
+@pytest.mark.asyncio
+async def test_send_live_alerts_fan_out(twitch_cog):
+    tracker = {"in_flight": 0, "max_in_flight": 0, "embeds": {}}
+    forbidden = discord.errors.Forbidden(mock.MagicMock(status=403), "Missing Permissions")
+    channels = {channel_id: FakeAlertChannel(channel_id, tracker, forbidden if channel_id == 0 else None)
+                for channel_id in range(50)}
+    alerts = [(channel_id, None, "custom" if channel_id % 2 else None, "default", None) for channel_id in range(50)]
+    alerts.append((99, 1234, None, "default", None))
+    twitch_cog.create_alert_embed = mock.AsyncMock(side_effect=lambda stream_data, message: message)
+
+    with mock.patch.object(twitch_cog.bot, 'get_channel', side_effect=lambda id: channels.get(id)):
+        sent, forbidden_statements = await twitch_cog.send_live_alerts({'user_login': 'monstercat'}, alerts,
+                                                                        TwitchAlert.AlertFanOut(5))
+
+    assert tracker["max_in_flight"] == 5
+    assert twitch_cog.create_alert_embed.call_count == 2
+    assert tracker["embeds"][1] == "custom" and tracker["embeds"][2] == "default"
+    assert sorted(message_id for _, message_id in sent) == list(range(1001, 1050))
+    assert forbidden_statements == [("DELETE FROM TwitchAlerts WHERE channel_id = ?", [0])]
+
+
+def test_latency_percentiles():
+    assert TwitchAlert.latency_percentiles([0.3, 0.1, 0.2]) == (0.2, 0.3, 0.3)
+    assert TwitchAlert.latency_percentiles([float(i) for i in range(1, 101)]) == (50.0, 95.0, 100.0)
+
+
+@pytest.mark.asyncio
+async def test_alert_fan_out_returns_errors():
+    fan_out = TwitchAlert.AlertFanOut(2)
+
+    async def request(value):
+        if value == 1:
+            raise ValueError(value)
+        return value
+
+    results = await fan_out.map(request, [(0,), (1,), (2,)])
+    assert results[0] == 0 and isinstance(results[1], ValueError) and results[2] == 2
+    assert len(fan_out.latencies) == 3
+
+
 @pytest.mark.asyncio
 async def test_create_alert_embed(twitch_cog):
     stream_data = {'id': '3215560150671170227', 'user_id': '27446517',
@@ -425,6 +715,231 @@ async def test_get_team_users(twitch_api_handler):
     assert False
 
 
+def test_chunks():
+    assert list(TwitchAlert.chunks(list(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(TwitchAlert.chunks([], 2)) == []
+
+
+@pytest.mark.asyncio
+async def test_get_streams_data_pages_concurrently(twitch_api_handler):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fake_requests_get(url, priority=None):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        logins = url.split("user_login=")[1:]
+        return {"data": [{"user_login": login.strip("&"), "type": "live"} for login in logins]}
+
+    usernames = [f"user{i}" for i in range(1050)]
+    twitch_api_handler.requests_get = fake_requests_get
+    streams_data = await twitch_api_handler.get_streams_data(usernames)
+    assert sorted(stream.get("user_login") for stream in streams_data) == sorted(usernames)
+    assert max_in_flight == TwitchAlert.TWITCH_MAX_CONCURRENT_REQUESTS
+
+
+@pytest.mark.asyncio
+async def test_get_streams_data_failed_page(twitch_api_handler):
+    twitch_api_handler.requests_get = mock.AsyncMock(side_effect=[{"data": []}, {"error": "Unauthorized"}])
+    assert await twitch_api_handler.get_streams_data([f"user{i}" for i in range(150)]) is None
+
+
+@pytest.mark.asyncio
+async def test_open_session_reused(twitch_api_handler):
+    session = twitch_api_handler.open_session()
+    assert twitch_api_handler.open_session() is session
+    assert session.connector.limit == TwitchAlert.TWITCH_CONNECTION_LIMIT
+    await twitch_api_handler.close_session()
+    assert session.closed
+    assert twitch_api_handler.session is None
+
+
+def fake_twitch_response(status=200, json=None, headers=None):
+    response = mock.MagicMock(status=status, headers=headers or {})
+    response.json = mock.AsyncMock(return_value=json if json is not None else {"data": []})
+    response.__aenter__ = mock.AsyncMock(return_value=response)
+    response.__aexit__ = mock.AsyncMock(return_value=False)
+    return response
+
+
+@pytest.mark.asyncio
+async def test_requests_get_shares_session(twitch_api_handler):
+    response = fake_twitch_response()
+    twitch_api_handler.token = {"access_token": "token", "expires_in": time.time() + 3600}
+    session = twitch_api_handler.open_session()
+    with mock.patch.object(session, 'request', return_value=response) as mock_get:
+        await twitch_api_handler.requests_get("https://api.twitch.tv/helix/streams?")
+        await twitch_api_handler.requests_get("https://api.twitch.tv/helix/users?")
+    assert mock_get.call_count == 2
+    assert twitch_api_handler.session is session
+    await twitch_api_handler.close_session()
+
+
+@pytest.mark.asyncio
+async def test_requests_get_backs_off_on_429(twitch_api_handler):
+    twitch_api_handler.token = {"access_token": "token", "expires_in": time.time() + 3600}
+    throttled = fake_twitch_response(429, {"error": "Too Many Requests"},
+                                     {"Ratelimit-Limit": "800", "Ratelimit-Remaining": "0",
+                                      "Ratelimit-Reset": str(time.time())})
+    responses = [throttled, fake_twitch_response(500, {"error": "Internal Server Error"}), fake_twitch_response()]
+    session = twitch_api_handler.open_session()
+    with mock.patch.object(session, 'request', side_effect=responses) as mock_get, \
+            mock.patch.object(TwitchAlert, 'TWITCH_BACKOFF_BASE', 0.01):
+        assert await twitch_api_handler.requests_get("https://api.twitch.tv/helix/streams?") == {"data": []}
+    assert mock_get.call_count == 3
+    await twitch_api_handler.close_session()
+
+
+@pytest.mark.asyncio
+async def test_requests_get_refreshes_token_once_on_401(twitch_api_handler):
+    twitch_api_handler.token = {"access_token": "old", "expires_in": time.time() + 3600}
+
+    async def new_token():
+        twitch_api_handler.token = {"access_token": "new", "expires_in": time.time() + 3600}
+
+    session = twitch_api_handler.open_session()
+    with mock.patch.object(session, 'request', side_effect=[fake_twitch_response(401), fake_twitch_response()]), \
+            mock.patch.object(twitch_api_handler, 'get_new_twitch_oauth', side_effect=new_token) as mock_oauth:
+        assert await twitch_api_handler.requests_get("https://api.twitch.tv/helix/streams?") == {"data": []}
+        await twitch_api_handler.refresh_twitch_oauth("old")
+    mock_oauth.assert_called_once()
+    await twitch_api_handler.close_session()
+
+
+@pytest.mark.asyncio
+async def test_requests_get_gives_up(twitch_api_handler):
+    twitch_api_handler.token = {"access_token": "token", "expires_in": time.time() + 3600}
+    session = twitch_api_handler.open_session()
+    with mock.patch.object(session, 'request', side_effect=lambda *args, **kwargs: fake_twitch_response(503)) as mock_get, \
+            mock.patch.object(TwitchAlert, 'TWITCH_BACKOFF_BASE', 0.001):
+        with pytest.raises(TimeoutError):
+            await twitch_api_handler.requests_get("https://api.twitch.tv/helix/streams?")
+    assert mock_get.call_count == TwitchAlert.TWITCH_MAX_ATTEMPTS
+    await twitch_api_handler.close_session()
+
+
+@pytest.mark.asyncio
+async def test_prefetch_alert_details(twitch_cog):
+    twitch_handler = twitch_cog.ta_database_manager.twitch_handler
+    twitch_handler.get_users_data = mock.AsyncMock(return_value={})
+    twitch_handler.get_games_data = mock.AsyncMock(return_value={})
+    streams_data = [{'user_login': 'Monstercat', 'game_id': '26936', 'type': 'live'},
+                    {'user_login': 'alreadyposted', 'game_id': '1', 'type': 'live'},
+                    {'user_login': 'nogame', 'game_id': '', 'type': 'live'}]
+    alerts = {'monstercat': [(1, None, None, "", 1)], 'alreadyposted': [(1, 2, None, "", 1)],
+              'nogame': [(1, None, None, "", 1)]}
+    await twitch_cog.prefetch_alert_details(streams_data, alerts)
+    twitch_handler.get_users_data.assert_called_once_with(['Monstercat', 'nogame'])
+    twitch_handler.get_games_data.assert_called_once_with(['26936'])
+
+
+@pytest.mark.asyncio
+async def test_twitch_cache_hits_and_misses():
+    cache = TwitchAlert.TwitchCache(60)
+    load = mock.AsyncMock(side_effect=lambda keys: {key: key.upper() for key in keys})
+    assert await cache.get_many(["a", "b"], load) == {"a": "A", "b": "B"}
+    assert await cache.get_many(["b", "c"], load) == {"b": "B", "c": "C"}
+    assert load.call_args_list == [mock.call(["a", "b"]), mock.call(["c"])]
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+@pytest.mark.asyncio
+async def test_twitch_cache_expiry_and_eviction():
+    cache = TwitchAlert.TwitchCache(0, max_size=2)
+    load = mock.AsyncMock(side_effect=lambda keys: {key: key for key in keys})
+    await cache.get_many(["a"], load)
+    await cache.get_many(["a"], load)
+    assert load.call_count == 2
+    cache.ttl = 60
+    await cache.get_many(["a", "b", "c"], load)
+    assert list(cache.entries) == ["b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_twitch_cache_shares_in_flight_lookups():
+    cache = TwitchAlert.TwitchCache(60)
+    calls = []
+
+    async def load(keys):
+        calls.append(keys)
+        await asyncio.sleep(0.01)
+        return {key: key for key in keys}
+
+    results = await asyncio.gather(cache.get_many(["a"], load), cache.get_many(["a", "b"], load))
+    assert results == [{"a": "a"}, {"a": "a", "b": "b"}]
+    assert calls == [["a"], ["b"]]
+    assert cache.in_flight == {}
+
+
+@pytest.mark.asyncio
+async def test_twitch_cache_failed_load_not_cached():
+    cache = TwitchAlert.TwitchCache(60)
+    assert await cache.get_many(["a"], mock.AsyncMock(return_value=None)) == {}
+    with pytest.raises(TimeoutError):
+        await cache.get_many(["a"], mock.AsyncMock(side_effect=TimeoutError))
+    assert len(cache) == 0
+    assert cache.in_flight == {}
+
+
+@pytest.mark.asyncio
+async def test_get_users_and_games_data_batched(twitch_api_handler):
+    async def fake_requests_get(url, priority=None):
+        if "/users?" in url:
+            logins = [login.strip("&") for login in url.split("login=")[1:]]
+            return {"data": [{"login": login, "profile_image_url": login} for login in logins if login != "missing"]}
+        return {"data": [{"id": game_id.strip("&"), "name": "Music"} for game_id in url.split("id=")[1:]]}
+
+    twitch_api_handler.requests_get = mock.AsyncMock(side_effect=fake_requests_get)
+    users = await twitch_api_handler.get_users_data(["Monstercat", "jaydwee", "missing"])
+    assert sorted(users) == ["jaydwee", "missing", "monstercat"]
+    assert users["missing"] is None
+    assert (await twitch_api_handler.get_user_data("monstercat")).get("profile_image_url") == "monstercat"
+    assert (await twitch_api_handler.get_game_data("26936")).get("name") == "Music"
+    assert await twitch_api_handler.get_game_data("") is None
+    assert twitch_api_handler.requests_get.call_count == 2
+    assert twitch_api_handler.user_cache.hits == 1
+
+
+def test_rate_limiter_update():
+    rate_limiter = TwitchAlert.TwitchRateLimiter()
+    rate_limiter.update({"Ratelimit-Limit": "120", "Ratelimit-Remaining": "7", "Ratelimit-Reset": "1700000000"})
+    assert rate_limiter.capacity == 120
+    assert rate_limiter.tokens == 7
+    assert rate_limiter.reset_at == 1700000000
+    rate_limiter.update({})
+    assert rate_limiter.capacity == 120
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_priority():
+    rate_limiter = TwitchAlert.TwitchRateLimiter(capacity=100, period=1)
+    rate_limiter.tokens = 0
+    order = []
+
+    async def request(name, priority):
+        await rate_limiter.acquire(priority)
+        order.append(name)
+
+    await asyncio.gather(request("team", TwitchAlert.TWITCH_PRIORITY_TEAMS),
+                         request("user", TwitchAlert.TWITCH_PRIORITY_LOOKUP),
+                         request("stream", TwitchAlert.TWITCH_PRIORITY_STREAMS))
+    assert order == ["stream", "user", "team"]
+    assert rate_limiter.waiters == []
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_blocks_after_429():
+    rate_limiter = TwitchAlert.TwitchRateLimiter()
+    delay = rate_limiter.backoff(429, {"Ratelimit-Reset": str(time.time() + 0.05)}, 0)
+    assert 0 < delay <= TwitchAlert.TWITCH_BACKOFF_MAX
+    start = time.monotonic()
+    await rate_limiter.acquire()
+    assert time.monotonic() - start >= 0.04
+
+
 # Test TwitchAlertDBManager
 @pytest.fixture
 def twitch_alert_db_manager(twitch_cog):
@@ -522,9 +1037,74 @@ async def test_remove_user_from_ta(twitch_alert_db_manager_tables):
 
 @pytest.mark.asyncio()
 async def test_delete_message(twitch_alert_db_manager_tables):
-    with mock.patch.object(discord.TextChannel, 'fetch_message') as mock1:
+    with mock.patch.object(discord.TextChannel, 'fetch_message') as mock_fetch, \
+            mock.patch.object(discord.PartialMessage, 'delete') as mock_delete:
         await twitch_alert_db_manager_tables.delete_message(1234, dpytest.get_config().channels[0].id)
-    mock1.assert_called_with(1234)
+    mock_fetch.assert_not_called()
+    mock_delete.assert_called_once()
+
+
+def make_message_id(age):
+    return int((time.time() - age) * 1000 - discord.utils.DISCORD_EPOCH) << 22
+
+
+def test_message_age():
+    assert 99 < TwitchAlert.message_age(make_message_id(100)) < 101
+
+
+@pytest.mark.asyncio()
+async def test_delete_messages_bulk(twitch_alert_db_manager_tables):
+    channel = mock.MagicMock(id=700)
+    channel.permissions_for.return_value.manage_messages = True
+    channel.delete_messages = mock.AsyncMock()
+    channel.get_partial_message.side_effect = lambda message_id: mock.MagicMock(id=message_id, delete=mock.AsyncMock())
+    recent = [make_message_id(60 * i) for i in range(1, 4)]
+    old = make_message_id(15 * 24 * 60 * 60)
+
+    with mock.patch.object(twitch_alert_db_manager_tables.bot, 'get_channel', return_value=channel):
+        await twitch_alert_db_manager_tables.delete_messages(700, recent + [old])
+
+    channel.delete_messages.assert_called_once()
+    assert [message.id for message in channel.delete_messages.call_args[0][0]] == recent
+    assert [call[0][0] for call in channel.get_partial_message.call_args_list[len(recent):]] == [old]
+
+
+@pytest.mark.asyncio()
+async def test_delete_messages_bulk_fallback(twitch_alert_db_manager_tables):
+    channel = mock.MagicMock(id=701)
+    channel.permissions_for.return_value.manage_messages = True
+    channel.delete_messages = mock.AsyncMock(side_effect=discord.errors.HTTPException(mock.MagicMock(status=400),
+                                                                                         "Bad Request"))
+    deleted = []
+
+    def get_partial_message(message_id):
+        async def delete():
+            if message_id == recent[0]:
+                raise discord.errors.NotFound(mock.MagicMock(status=404), "Unknown Message")
+            deleted.append(message_id)
+        return mock.MagicMock(id=message_id, delete=delete)
+
+    channel.get_partial_message.side_effect = get_partial_message
+    recent = [make_message_id(60 * i) for i in range(1, 4)]
+
+    with mock.patch.object(twitch_alert_db_manager_tables.bot, 'get_channel', return_value=channel):
+        await twitch_alert_db_manager_tables.delete_messages(701, recent)
+
+    assert deleted == recent[1:]
+
+
+@pytest.mark.asyncio()
+async def test_delete_messages_without_manage_messages(twitch_alert_db_manager_tables):
+    channel = mock.MagicMock(id=702)
+    channel.permissions_for.return_value.manage_messages = False
+    channel.delete_messages = mock.AsyncMock()
+    channel.get_partial_message.return_value.delete = mock.AsyncMock()
+
+    with mock.patch.object(twitch_alert_db_manager_tables.bot, 'get_channel', return_value=channel):
+        await twitch_alert_db_manager_tables.delete_messages(702, [make_message_id(60), make_message_id(120)])
+
+    channel.delete_messages.assert_not_called()
+    assert channel.get_partial_message.return_value.delete.call_count == 2
 
 
 def test_add_team_to_ta(twitch_alert_db_manager_tables):
@@ -564,9 +1144,9 @@ async def test_remove_team_from_ta_deletes_messages(twitch_alert_db_manager_tabl
     sql_add_message = "UPDATE UserInTwitchTeam SET message_id = 1 " \
                       "WHERE team_twitch_alert_id = 604 AND twitch_username = 'monstercat'"
     twitch_alert_db_manager_tables.get_parent_database_manager().db_execute_commit(sql_add_message)
-    with mock.patch.object(TwitchAlert.TwitchAlertDBManager, 'delete_message') as mock1:
+    with mock.patch.object(TwitchAlert.TwitchAlertDBManager, 'delete_messages') as mock1:
         await twitch_alert_db_manager_tables.remove_team_from_ta(605, "monstercat")
-    mock1.assert_called_with(1, 605)
+    mock1.assert_called_with(605, [1])
 
 
 @pytest.mark.asyncio()
@@ -601,6 +1181,47 @@ async def test_update_all_teams_members(twitch_alert_db_manager_tables):
     pass
 
 
+@pytest.mark.asyncio()
+async def test_update_all_teams_members_diff(twitch_loop_cog):
+    twitch_alert_db_manager = twitch_loop_cog.ta_database_manager
+    database_manager = twitch_alert_db_manager.get_parent_database_manager()
+    for team_twitch_alert_id, channel_id in [(624, 625), (626, 627)]:
+        database_manager.db_execute_commit("INSERT INTO TeamInTwitchAlert(team_twitch_alert_id,channel_id,"
+                                           "twitch_team_name) VALUES(?,?,'koalateam')",
+                                           args=[team_twitch_alert_id, channel_id])
+    database_manager.db_execute_commit("INSERT INTO UserInTwitchTeam(team_twitch_alert_id,twitch_username,message_id)"
+                                       " VALUES(624,'leftteam',5),(624,'stayed',NULL),(626,'stayed',NULL)")
+    twitch_alert_db_manager.twitch_handler.get_team_users = mock.AsyncMock(
+        return_value=[{"user_login": "stayed"}, {"user_login": "joined"}])
+
+    with mock.patch.object(TwitchAlert.TwitchAlertDBManager, 'delete_messages') as mock_delete:
+        await twitch_alert_db_manager.update_all_teams_members()
+
+    twitch_alert_db_manager.twitch_handler.get_team_users.assert_called_once_with("koalateam")
+    mock_delete.assert_called_once_with(625, [5])
+    result = database_manager.db_execute_select("SELECT team_twitch_alert_id, twitch_username FROM UserInTwitchTeam "
+                                                "WHERE team_twitch_alert_id IN (624, 626) "
+                                                "ORDER BY team_twitch_alert_id, twitch_username")
+    assert [(int(team_twitch_alert_id), username) for team_twitch_alert_id, username in result] == \
+        [(624, "joined"), (624, "stayed"), (626, "joined"), (626, "stayed")]
+
+
+@pytest.mark.asyncio()
+async def test_update_all_teams_members_failed_team_kept(twitch_loop_cog):
+    twitch_alert_db_manager = twitch_loop_cog.ta_database_manager
+    database_manager = twitch_alert_db_manager.get_parent_database_manager()
+    database_manager.db_execute_commit("INSERT INTO TeamInTwitchAlert(team_twitch_alert_id,channel_id,"
+                                       "twitch_team_name) VALUES(634,635,'brokenteam')")
+    database_manager.db_execute_commit("INSERT INTO UserInTwitchTeam(team_twitch_alert_id,twitch_username) "
+                                       "VALUES(634,'member')")
+    twitch_alert_db_manager.twitch_handler.get_team_users = mock.AsyncMock(side_effect=TimeoutError)
+
+    await twitch_alert_db_manager.update_all_teams_members()
+
+    assert database_manager.db_execute_select("SELECT twitch_username FROM UserInTwitchTeam "
+                                              "WHERE team_twitch_alert_id = 634") == [("member",)]
+
+
 @pytest.mark.asyncio()
 async def test_delete_all_offline_streams(twitch_alert_db_manager_tables, bot: discord.ext.commands.Bot):
     message_id = (await dpytest.message("test_msg",bot.guilds[0].channels[0])).id
@@ -635,3 +1256,246 @@ async def test_delete_all_offline_streams_team(twitch_alert_db_manager_tables, b
     assert result[0][0] is None
     assert result[1][0] is None
     pass
+
+
+# Test EventSub
+@pytest.fixture
+async def eventsub_server():
+    handlers = {"stream.online": mock.AsyncMock(), "stream.offline": mock.AsyncMock()}
+    server = TwitchAlert.EventSubServer("eventsub_secret", handlers)
+    host, port = await server.start("127.0.0.1", 0)
+    yield server, FakeEventSub(f"http://{host}:{port}{TwitchAlert.TWITCH_EVENTSUB_PATH}", "eventsub_secret")
+    await server.stop()
+
+
+def test_verify_eventsub_signature():
+    fake_eventsub = FakeEventSub("", "eventsub_secret")
+    headers = {"Twitch-Eventsub-Message-Id": "1", "Twitch-Eventsub-Message-Timestamp": "2021-05-14T10:11:12.1Z",
+               "Twitch-Eventsub-Message-Signature": fake_eventsub.sign("1", "2021-05-14T10:11:12.1Z", b"{}")}
+    assert TwitchAlert.verify_eventsub_signature("eventsub_secret", headers, b"{}")
+    assert not TwitchAlert.verify_eventsub_signature("other_secret", headers, b"{}")
+    assert not TwitchAlert.verify_eventsub_signature("eventsub_secret", headers, b"{ }")
+    assert not TwitchAlert.verify_eventsub_signature("eventsub_secret", {}, b"{}")
+
+
+def test_parse_eventsub_timestamp():
+    assert TwitchAlert.parse_eventsub_timestamp("1970-01-01T00:01:00.500000123Z") == 60.500000123
+    assert TwitchAlert.parse_eventsub_timestamp("1970-01-01T00:01:00Z") == 60
+    assert TwitchAlert.parse_eventsub_timestamp("yesterday") is None
+    assert TwitchAlert.parse_eventsub_timestamp(None) is None
+
+
+@pytest.mark.asyncio
+async def test_eventsub_callback_verification(eventsub_server):
+    server, fake_eventsub = eventsub_server
+    assert await fake_eventsub.post("webhook_callback_verification", "stream.online", challenge="pogchamp") == \
+        (200, "pogchamp")
+
+
+@pytest.mark.asyncio
+async def test_eventsub_rejects_bad_messages(eventsub_server):
+    server, fake_eventsub = eventsub_server
+    event = {"broadcaster_user_login": "monstercat"}
+    status, _ = await fake_eventsub.post("notification", "stream.online", event=event, secret="wrong_secret")
+    assert status == 403
+    old = eventsub_timestamp(datetime.datetime.utcnow() - datetime.timedelta(minutes=11))
+    status, _ = await fake_eventsub.post("notification", "stream.online", event=event, timestamp=old)
+    assert status == 403
+    await asyncio.sleep(0)
+    server.handlers["stream.online"].assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_eventsub_notifications(eventsub_server):
+    server, fake_eventsub = eventsub_server
+    online = {"broadcaster_user_login": "monstercat", "type": "live"}
+    offline = {"broadcaster_user_login": "monstercat"}
+    assert (await fake_eventsub.post("notification", "stream.online", event=online, message_id="1"))[0] == 204
+    # Twitch may send a message more than once
+    assert (await fake_eventsub.post("notification", "stream.online", event=online, message_id="1"))[0] == 204
+    assert (await fake_eventsub.post("notification", "stream.offline", event=offline, message_id="2"))[0] == 204
+    assert (await fake_eventsub.post("revocation", "stream.offline", message_id="3"))[0] == 204
+    await asyncio.sleep(0.01)
+    server.handlers["stream.online"].assert_called_once_with(online)
+    server.handlers["stream.offline"].assert_called_once_with(offline)
+
+
+@pytest.mark.asyncio
+async def test_eventsub_online_and_offline_alerts(twitch_loop_cog):
+    channel = dpytest.get_config().guilds[0].channels[0]
+    twitch_loop_cog.ta_database_manager.add_user_to_ta(channel.id, "monstercat", None, channel.guild.id)
+    twitch_loop_cog.ta_database_manager.add_user_to_ta(channel.id, "otheruser", None, channel.guild.id)
+    twitch_handler = twitch_loop_cog.ta_database_manager.twitch_handler
+    twitch_handler.get_streams_data = mock.AsyncMock(return_value=[{'user_login': 'monstercat', 'type': 'live'}])
+    twitch_handler.get_users_data = mock.AsyncMock(return_value={})
+    twitch_handler.get_games_data = mock.AsyncMock(return_value={})
+    live_embed = discord.Embed(title="monstercat is live")
+    twitch_loop_cog.create_alert_embed = mock.AsyncMock(return_value=live_embed)
+    database_manager = twitch_loop_cog.ta_database_manager.database_manager
+    sql_select_message_id = "SELECT message_id FROM UserInTwitchAlert WHERE twitch_username = 'monstercat'"
+
+    await twitch_loop_cog.on_stream_online({"broadcaster_user_login": "MonsterCat"})
+
+    assert dpytest.verify().message().embed(live_embed)
+    twitch_handler.get_streams_data.assert_called_once_with(["monstercat"])
+    assert database_manager.db_execute_select(sql_select_message_id)[0][0] is not None
+
+    twitch_loop_cog.ta_database_manager.delete_all_offline_streams = mock.AsyncMock(
+        wraps=twitch_loop_cog.ta_database_manager.delete_all_offline_streams)
+    await twitch_loop_cog.on_stream_offline({"broadcaster_user_login": "monstercat"})
+
+    assert database_manager.db_execute_select(sql_select_message_id)[0][0] is None
+    twitch_loop_cog.ta_database_manager.delete_all_offline_streams.assert_any_call(False, ["monstercat"],
+                                                                                   fan_out=mock.ANY)
+
+
+@pytest.mark.asyncio
+async def test_eventsub_online_before_stream_listed(twitch_loop_cog):
+    channel = dpytest.get_config().guilds[0].channels[0]
+    twitch_loop_cog.ta_database_manager.add_user_to_ta(channel.id, "monstercat", None, channel.guild.id)
+    twitch_handler = twitch_loop_cog.ta_database_manager.twitch_handler
+    twitch_handler.get_streams_data = mock.AsyncMock(return_value=[])
+    now = time.time()
+    twitch_loop_cog.poll_scheduler.record(["monstercat"], set(), now - 60)
+
+    await twitch_loop_cog.on_stream_online({"broadcaster_user_login": "MonsterCat"})
+
+    assert dpytest.verify().message().nothing()
+    # Requested again the next check rather than once the cold interval has passed
+    assert twitch_loop_cog.poll_scheduler.due_logins(["monstercat"], set(), now + 60) == ["monstercat"]
+
+
+@pytest.mark.asyncio
+async def test_eventsub_start_failure_logged(twitch_loop_cog):
+    with mock.patch.object(TwitchAlert, "TWITCH_EVENTSUB_CALLBACK", "https://koala.example/eventsub"), \
+            mock.patch.object(TwitchAlert, "TWITCH_EVENTSUB_SECRET", "eventsub_secret"), \
+            mock.patch.object(TwitchAlert.EventSubServer, "start", mock.AsyncMock(side_effect=OSError("in use"))), \
+            mock.patch.object(twitch_loop_cog, "loop_update_teams"), \
+            mock.patch.object(twitch_loop_cog, "loop_check_live"), \
+            mock.patch.object(twitch_loop_cog, "loop_sync_eventsub") as loop_sync_eventsub, \
+            mock.patch("logging.error") as log_error:
+        twitch_loop_cog.start_loops()
+        for _ in range(3):
+            await asyncio.sleep(0)
+    log_error.assert_called_once_with("TwitchAlert: Failed to start EventSub in use")
+    loop_sync_eventsub.start.assert_not_called()
+    assert twitch_loop_cog.eventsub is None
+    await twitch_loop_cog.ta_database_manager.twitch_handler.close_session()
+
+
+@pytest.mark.asyncio
+async def test_sync_eventsub_subscriptions(twitch_loop_cog):
+    channel = dpytest.get_config().guilds[0].channels[0]
+    for username in ["monstercat", "newuser"]:
+        twitch_loop_cog.ta_database_manager.add_user_to_ta(channel.id, username, None, channel.guild.id)
+    callback = "https://koala.example/eventsub"
+    twitch_handler = twitch_loop_cog.ta_database_manager.twitch_handler
+    twitch_handler.get_users_data = mock.AsyncMock(return_value={"monstercat": {"id": "1"}, "newuser": {"id": "2"}})
+
+    def subscription(subscription_id, subscription_type, user_id, status="enabled", subscription_callback=callback):
+        return {"id": subscription_id, "type": subscription_type, "status": status,
+                "condition": {"broadcaster_user_id": user_id}, "transport": {"callback": subscription_callback}}
+
+    twitch_handler.get_eventsub_subscriptions = mock.AsyncMock(return_value=[
+        subscription("a", "stream.online", "1"),
+        subscription("b", "stream.offline", "1", status="notification_failures_exceeded"),
+        subscription("c", "stream.online", "3"),
+        subscription("d", "stream.online", "4", subscription_callback="https://someone.else/eventsub")])
+    twitch_handler.create_eventsub_subscription = mock.AsyncMock()
+    twitch_handler.delete_eventsub_subscription = mock.AsyncMock()
+
+    await twitch_loop_cog.sync_eventsub_subscriptions(callback)
+
+    assert sorted(call[0][:2] for call in twitch_handler.create_eventsub_subscription.call_args_list) == \
+        [("stream.offline", "1"), ("stream.offline", "2"), ("stream.online", "2")]
+    assert sorted(call[0][0] for call in twitch_handler.delete_eventsub_subscription.call_args_list) == ["b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_get_eventsub_subscriptions_pages(twitch_api_handler):
+    twitch_api_handler.requests_get = mock.AsyncMock(side_effect=[
+        {"data": [{"id": "a"}], "pagination": {"cursor": "next"}},
+        {"data": [{"id": "b"}], "pagination": {}}])
+    assert await twitch_api_handler.get_eventsub_subscriptions() == [{"id": "a"}, {"id": "b"}]
+    assert twitch_api_handler.requests_get.call_args_list[1][1]["params"] == {"after": "next"}
+
+
+@pytest.fixture
+async def fake_twitch_api():
+    fake_api = FakeTwitchAPI(seed=0)
+    await fake_api.start()
+    twitch_handler = TwitchAlert.TwitchAPIHandler("fakeclientid", "fakesecret", api_url=fake_api.api_url,
+                                                  oauth_url=fake_api.oauth_url)
+    yield fake_api, twitch_handler
+    await twitch_handler.close_session()
+    await fake_api.stop()
+
+
+@pytest.mark.asyncio
+async def test_fake_twitch_api_streams(fake_twitch_api):
+    fake_api, twitch_handler = fake_twitch_api
+    usernames = [f"user{user}" for user in range(150)]
+    for username in usernames:
+        fake_api.add_user(username)
+    fake_api.set_live("user1")
+    fake_api.set_live("user120")
+
+    streams_data = await twitch_handler.get_streams_data(usernames)
+
+    assert sorted(stream_data["user_login"] for stream_data in streams_data) == ["user1", "user120"]
+    assert fake_api.requests["/oauth2/token"] == 1
+    assert fake_api.requests["/helix/streams"] == 2
+
+
+@pytest.mark.asyncio
+async def test_fake_twitch_api_users_games_and_teams(fake_twitch_api):
+    fake_api, twitch_handler = fake_twitch_api
+    fake_api.add_user("monstercat", game_id="26936")
+    fake_api.add_team("koalateam", ["monstercat", "koala"])
+
+    users = await twitch_handler.get_users_data(["monstercat", "koala", "missing"])
+    assert users["monstercat"]["login"] == "monstercat" and users["missing"] is None
+    assert (await twitch_handler.get_game_data("26936"))["name"] == "Game 26936"
+    assert [user["user_login"] for user in await twitch_handler.get_team_users("koalateam")] == \
+        ["monstercat", "koala"]
+    await twitch_handler.get_user_data("monstercat")
+    assert fake_api.requests["/helix/users"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fake_twitch_api_rate_limit_retried(fake_twitch_api):
+    fake_api, twitch_handler = fake_twitch_api
+    fake_api.rate_limit = fake_api.remaining = 1
+    fake_api.rate_limit_period = 1
+    fake_api.reset_at = time.time() + 1
+    fake_api.add_user("monstercat")
+    fake_api.set_live("monstercat")
+
+    assert len(await twitch_handler.get_streams_data(["monstercat"])) == 1
+    assert len(await twitch_handler.get_streams_data(["monstercat"])) == 1
+    assert fake_api.throttled >= 1
+
+
+def test_fake_twitch_api_churn():
+    fake_api = FakeTwitchAPI(churn=0.5, seed=0)
+    for user in range(10):
+        fake_api.add_user(f"user{user}")
+    went_live, went_offline = fake_api.tick()
+    assert len(went_live) == 5 and went_offline == []
+    assert sorted(fake_api.live) == sorted(went_live)
+
+
+@pytest.mark.asyncio
+async def test_loop_check_live_with_fake_twitch_api(twitch_loop_cog, fake_twitch_api):
+    fake_api, twitch_handler = fake_twitch_api
+    channel = dpytest.get_config().guilds[0].channels[0]
+    twitch_loop_cog.ta_database_manager.twitch_handler = twitch_handler
+    twitch_loop_cog.ta_database_manager.add_user_to_ta(channel.id, "monstercat", None, channel.guild.id)
+    fake_api.add_user("monstercat")
+    fake_api.set_live("monstercat", title="Fake Stream")
+
+    await twitch_loop_cog.loop_check_live()
+
+    message = await dpytest.sent_queue.get()
+    assert message.embeds[0].fields[0].value == "Fake Stream"
+    assert twitch_loop_cog.live_users == {"monstercat"}
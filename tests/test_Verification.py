@@ -213,6 +213,26 @@ async def test_re_verify():
     db_manager.db_execute_commit(f"DELETE FROM to_re_verify WHERE u_id={member.id}")
 
 
+@pytest.mark.asyncio
+async def test_re_verify_already_pending():
+    test_config = dpytest.get_config()
+    guild = test_config.guilds[0]
+    role = dpytest.back.make_role("testRole", guild, id_num=555)
+    members = [test_config.members[0], await dpytest.member_join()]
+    db_manager.db_execute_commit("DROP TABLE to_re_verify")
+    db_manager.db_execute_commit("CREATE TABLE to_re_verify (u_id, r_id, PRIMARY KEY (u_id, r_id))")
+    for member in members:
+        await dpytest.add_role(member, role)
+    db_manager.db_execute_commit(f"INSERT INTO to_re_verify VALUES ({members[0].id}, {role.id})")
+    db_manager.db_execute_commit(f"INSERT INTO roles VALUES ({guild.id}, {role.id}, 'egg.com')")
+    await dpytest.message(KoalaBot.COMMAND_PREFIX + "reVerify <@&555>")
+    for member in members:
+        assert role not in member.roles
+        assert db_manager.db_execute_select(f"SELECT * FROM to_re_verify WHERE u_id={member.id}")
+    assert dpytest.verify().message().content("That role has now been removed from all users and they will need to re-verify the associated email.")
+    db_manager.db_execute_commit(f"DELETE FROM roles WHERE s_id={guild.id}")
+    db_manager.db_execute_commit(f"DELETE FROM to_re_verify WHERE r_id={role.id}")
+
 @pytest.fixture(scope='session', autouse=True)
 def setup_is_dpytest():
     KoalaBot.is_dpytest = True
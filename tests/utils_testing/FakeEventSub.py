@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""
+Testing utilities standing in for Twitch EventSub, posting signed webhook messages to a local EventSub server
+
+Commented using reStructuredText (reST)
+"""
+# Futures
+
+# Built-in/Generic Imports
+import datetime
+import hashlib
+import hmac
+import json
+import uuid
+
+# Libs
+import aiohttp
+
+# Own modules
+
+# Constants
+
+# Variables
+
+
+def eventsub_timestamp(when=None):
+    """
+    Formats a time the way Twitch does in EventSub headers, with nanoseconds
+
+    :param when: The UTC datetime to format, now by default
+    :return: The RFC3339 timestamp
+    """
+    when = when or datetime.datetime.utcnow()
+    return when.strftime("%Y-%m-%dT%H:%M:%S.%f") + "123Z"
+
+
+class FakeEventSub:
+    """
+    Posts EventSub messages to a webhook the way Twitch does
+    """
+
+    def __init__(self, url, secret):
+        """
+        Initialises the class variables
+
+        :param url: The callback URL of the webhook
+        :param secret: The secret the messages are signed with
+        """
+        self.url = url
+        self.secret = secret
+
+    def sign(self, message_id, timestamp, body, secret=None):
+        """
+        Signs a message
+
+        :param message_id: The Twitch-Eventsub-Message-Id of the message
+        :param timestamp: The Twitch-Eventsub-Message-Timestamp of the message
+        :param body: The raw body of the message
+        :param secret: The secret to sign with, the webhook's secret by default
+        :return: The Twitch-Eventsub-Message-Signature of the message
+        """
+        message = message_id.encode() + timestamp.encode() + body
+        return "sha256=" + hmac.new((secret or self.secret).encode(), message, hashlib.sha256).hexdigest()
+
+    async def post(self, message_type, subscription_type, event=None, challenge=None, message_id=None,
+                   timestamp=None, secret=None):
+        """
+        Posts a signed message to the webhook
+
+        :param message_type: notification, webhook_callback_verification or revocation
+        :param subscription_type: The subscription type e.g. stream.online
+        :param event: The event of a notification
+        :param challenge: The challenge of a webhook_callback_verification
+        :param message_id: The message ID, a new one by default
+        :param timestamp: The message timestamp, now by default
+        :param secret: The secret to sign with, the webhook's secret by default
+        :return: The status and text of the response
+        """
+        message_id = message_id or str(uuid.uuid4())
+        timestamp = timestamp or eventsub_timestamp()
+        payload = {"subscription": {"id": str(uuid.uuid4()), "type": subscription_type, "version": "1",
+                                    "status": "enabled", "condition": {}}}
+        if event is not None:
+            payload["event"] = event
+        if challenge is not None:
+            payload["challenge"] = challenge
+        body = json.dumps(payload).encode()
+        headers = {"Content-Type": "application/json",
+                   "Twitch-Eventsub-Message-Id": message_id,
+                   "Twitch-Eventsub-Message-Timestamp": timestamp,
+                   "Twitch-Eventsub-Message-Signature": self.sign(message_id, timestamp, body, secret),
+                   "Twitch-Eventsub-Message-Type": message_type,
+                   "Twitch-Eventsub-Subscription-Type": subscription_type}
+        async with aiohttp.ClientSession() as session:
+            async with session.post(self.url, data=body, headers=headers) as response:
+                return response.status, await response.text()
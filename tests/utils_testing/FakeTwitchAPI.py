@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+
+"""
+Testing utilities standing in for the Twitch Helix API, a local aiohttp server with configurable latency, rate limits
+and churn of which users are live
+
+Commented using reStructuredText (reST)
+"""
+# Futures
+
+# Built-in/Generic Imports
+import asyncio
+import random
+import time
+from collections import Counter
+
+# Libs
+from aiohttp import web
+
+# Own modules
+
+# Constants
+MAX_IDS_PER_REQUEST = 100
+FAKE_ACCESS_TOKEN = "fakeaccesstoken"
+
+# Variables
+
+
+class FakeTwitchAPI:
+    """
+    A fake Helix server covering OAuth, streams, users, games, teams and EventSub subscriptions
+    """
+
+    def __init__(self, latency=0, rate_limit=800, rate_limit_period=60, churn=0, seed=None):
+        """
+        Initialises the class variables
+
+        :param latency: Seconds each request takes
+        :param rate_limit: Requests allowed per rate_limit_period, 0 for no limit
+        :param rate_limit_period: Seconds for the rate limit bucket to refill
+        :param churn: The fraction of users whose live status flips each tick
+        :param seed: The seed of the churn
+        """
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_limit_period = rate_limit_period
+        self.churn = churn
+        self.random = random.Random(seed)
+        self.users = {}
+        self.games = {}
+        self.teams = {}
+        self.live = {}
+        self.subscriptions = {}
+        self.requests = Counter()
+        self.throttled = 0
+        self.remaining = rate_limit
+        self.reset_at = time.time() + rate_limit_period
+        self.runner = None
+        self.url = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/oauth2/token", self.oauth_token)
+        self.app.router.add_get("/helix/streams", self.get_streams)
+        self.app.router.add_get("/helix/users", self.get_users)
+        self.app.router.add_get("/helix/games", self.get_games)
+        self.app.router.add_get("/helix/teams", self.get_teams)
+        self.app.router.add_get("/helix/eventsub/subscriptions", self.get_subscriptions)
+        self.app.router.add_post("/helix/eventsub/subscriptions", self.create_subscription)
+        self.app.router.add_delete("/helix/eventsub/subscriptions", self.delete_subscription)
+
+    @property
+    def api_url(self):
+        """
+        :return: The base URL of the fake Helix API
+        """
+        return self.url + "/helix"
+
+    @property
+    def oauth_url(self):
+        """
+        :return: The URL of the fake OAuth2 token endpoint
+        """
+        return self.url + "/oauth2/token"
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Starts the server
+
+        :param host: The interface to listen on
+        :param port: The port to listen on, 0 for any free port
+        :return: The base URL of the server
+        """
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        """
+        Stops the server
+        """
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def add_user(self, login, game_id="26936"):
+        """
+        Adds a Twitch user, and the game they stream
+
+        :param login: The login of the user
+        :param game_id: The ID of the game the user streams
+        :return: The user data
+        """
+        login = login.lower()
+        user = {"id": str(len(self.users) + 1), "login": login, "display_name": login, "type": "",
+                "broadcaster_type": "", "description": "",
+                "profile_image_url": f"https://static-cdn.jtvnw.net/jtv_user_pictures/{login}.png"}
+        self.users[login] = user
+        self.games.setdefault(game_id, {"id": game_id, "name": f"Game {game_id}", "box_art_url": ""})
+        user["game_id"] = game_id
+        return user
+
+    def add_team(self, name, logins):
+        """
+        Adds a Twitch team
+
+        :param name: The name of the team
+        :param logins: The logins of the team's members, added as users if needed
+        """
+        for login in logins:
+            if login.lower() not in self.users:
+                self.add_user(login)
+        self.teams[name.lower()] = [login.lower() for login in logins]
+
+    def set_live(self, login, title="Live on the fake Twitch API"):
+        """
+        Starts a stream for a user
+
+        :param login: The login of the user
+        :param title: The title of the stream
+        """
+        user = self.users[login.lower()]
+        self.live[user["login"]] = {"id": str(self.random.getrandbits(40)), "user_id": user["id"],
+                                    "user_login": user["login"], "user_name": user["display_name"],
+                                    "game_id": user["game_id"], "type": "live", "title": title,
+                                    "viewer_count": self.random.randint(0, 10000),
+                                    "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+
+    def set_offline(self, login):
+        """
+        Ends the stream of a user
+
+        :param login: The login of the user
+        """
+        self.live.pop(login.lower(), None)
+
+    def tick(self):
+        """
+        Flips the live status of a churn fraction of the users
+
+        :return: The logins that went live, and the logins that went offline
+        """
+        went_live = []
+        went_offline = []
+        if not self.users or not self.churn:
+            return went_live, went_offline
+        for login in self.random.sample(list(self.users), max(1, int(len(self.users) * self.churn))):
+            if login in self.live:
+                self.set_offline(login)
+                went_offline.append(login)
+            else:
+                self.set_live(login)
+                went_live.append(login)
+        return went_live, went_offline
+
+    async def throttle(self, request):
+        """
+        Applies the latency and rate limit of the server to a request
+
+        :param request: The aiohttp request
+        :return: The rate limit headers, and an error response if the request was rejected
+        """
+        self.requests[request.path] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if request.path == "/oauth2/token":
+            # OAuth is not part of the Helix rate limit
+            return {}, None
+        if request.headers.get("Authorization") != f"Bearer {FAKE_ACCESS_TOKEN}":
+            return {}, web.json_response({"error": "Unauthorized", "status": 401}, status=401)
+        if not self.rate_limit:
+            return {}, None
+        now = time.time()
+        if now >= self.reset_at:
+            self.remaining = self.rate_limit
+            self.reset_at = now + self.rate_limit_period
+        headers = {"Ratelimit-Limit": str(self.rate_limit),
+                   "Ratelimit-Reset": str(int(self.reset_at))}
+        if self.remaining <= 0:
+            self.throttled += 1
+            headers["Ratelimit-Remaining"] = "0"
+            return headers, web.json_response({"error": "Too Many Requests", "status": 429}, status=429,
+                                              headers=headers)
+        self.remaining -= 1
+        headers["Ratelimit-Remaining"] = str(self.remaining)
+        return headers, None
+
+    @staticmethod
+    def bad_request(message):
+        """
+        :param message: The error message
+        :return: A 400 response
+        """
+        return web.json_response({"error": "Bad Request", "status": 400, "message": message}, status=400)
+
+    async def oauth_token(self, request):
+        _, error = await self.throttle(request)
+        return error or web.json_response({"access_token": FAKE_ACCESS_TOKEN, "expires_in": 5000000,
+                                           "token_type": "bearer"})
+
+    async def get_streams(self, request):
+        headers, error = await self.throttle(request)
+        if error:
+            return error
+        logins = request.query.getall("user_login", [])
+        if len(logins) > MAX_IDS_PER_REQUEST:
+            return self.bad_request("too many user_login values")
+        streams = [self.live[login.lower()] for login in logins if login.lower() in self.live]
+        return web.json_response({"data": streams, "pagination": {}}, headers=headers)
+
+    async def get_users(self, request):
+        headers, error = await self.throttle(request)
+        if error:
+            return error
+        logins = request.query.getall("login", [])
+        if len(logins) > MAX_IDS_PER_REQUEST:
+            return self.bad_request("too many login values")
+        users = [self.users[login.lower()] for login in logins if login.lower() in self.users]
+        return web.json_response({"data": users}, headers=headers)
+
+    async def get_games(self, request):
+        headers, error = await self.throttle(request)
+        if error:
+            return error
+        game_ids = request.query.getall("id", [])
+        if len(game_ids) > MAX_IDS_PER_REQUEST:
+            return self.bad_request("too many id values")
+        games = [self.games[game_id] for game_id in game_ids if game_id in self.games]
+        return web.json_response({"data": games}, headers=headers)
+
+    async def get_teams(self, request):
+        headers, error = await self.throttle(request)
+        if error:
+            return error
+        name = request.query.get("name", "").lower()
+        if name not in self.teams:
+            return web.json_response({"error": "Not Found", "status": 404}, status=404, headers=headers)
+        users = [{"user_id": self.users[login]["id"], "user_login": login, "user_name": login}
+                 for login in self.teams[name]]
+        return web.json_response({"data": [{"team_name": name, "users": users}]}, headers=headers)
+
+    async def get_subscriptions(self, request):
+        headers, error = await self.throttle(request)
+        if error:
+            return error
+        return web.json_response({"data": list(self.subscriptions.values()), "pagination": {}}, headers=headers)
+
+    async def create_subscription(self, request):
+        headers, error = await self.throttle(request)
+        if error:
+            return error
+        body = await request.json()
+        subscription = {"id": str(len(self.subscriptions) + 1), "status": "enabled", "type": body.get("type"),
+                        "version": body.get("version"), "condition": body.get("condition"),
+                        "transport": {"method": "webhook", "callback": body.get("transport", {}).get("callback")}}
+        self.subscriptions[subscription["id"]] = subscription
+        return web.json_response({"data": [subscription]}, status=202, headers=headers)
+
+    async def delete_subscription(self, request):
+        headers, error = await self.throttle(request)
+        if error:
+            return error
+        if self.subscriptions.pop(request.query.get("id"), None) is None:
+            return web.json_response({"error": "Not Found", "status": 404}, status=404, headers=headers)
+        return web.Response(status=204, headers=headers)
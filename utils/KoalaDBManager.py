@@ -8,7 +8,15 @@ Commented using reStructuredText (reST)
 # Futures
 
 # Built-in/Generic Imports
+import asyncio
+import atexit
+import functools
 import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 # Libs
 from dotenv import load_dotenv
@@ -26,6 +34,46 @@ else:
 # Own modules
 
 # Constants
+POOL_CHECKOUT_TIMEOUT = 30
+ASYNC_DB_WORKERS = 1
+WRITE_BEHIND_MAX_BATCH = 500
+DB_CACHE_SIZE_KIB = 8192
+GUILD_EXTENSIONS_CACHE_TTL = 300
+DB_MMAP_SIZE = 64 * 1024 * 1024
+
+# Schema migrations, applied in order and recorded in PRAGMA user_version. Each migration is a list of
+# (table, sql) pairs, where table is the table the statement needs to exist (None if it needs no table)
+MIGRATIONS = [
+    # 1: Write-ahead logging, so readers no longer block the writer
+    [(None, "PRAGMA journal_mode=WAL")],
+    # 2: Secondary indexes for the columns cogs look rows up by. The ReactForRole tables need none, their lookups by
+    # (guild_id, channel_id, message_id), guild_id, emoji_role_id and GuildRFRRequiredRoles.guild_id are all leftmost
+    # columns of the indexes SQLite already makes for their primary keys and unique constraints
+    [("GuildExtensions", "CREATE INDEX IF NOT EXISTS idx_GuildExtensions_guild_id ON GuildExtensions (guild_id)"),
+     ("TextFilter", "CREATE INDEX IF NOT EXISTS idx_TextFilter_guild_id ON TextFilter (guild_id)"),
+     ("TextFilterModeration",
+      "CREATE INDEX IF NOT EXISTS idx_TextFilterModeration_guild_id ON TextFilterModeration (guild_id)"),
+     ("TextFilterIgnoreList",
+      "CREATE INDEX IF NOT EXISTS idx_TextFilterIgnoreList_guild_id ON TextFilterIgnoreList (guild_id)"),
+     ("TwitchAlerts", "CREATE INDEX IF NOT EXISTS idx_TwitchAlerts_channel_id ON TwitchAlerts (channel_id)"),
+     ("UserInTwitchAlert",
+      "CREATE INDEX IF NOT EXISTS idx_UserInTwitchAlert_twitch_username ON UserInTwitchAlert (twitch_username)"),
+     ("TeamInTwitchAlert",
+      "CREATE INDEX IF NOT EXISTS idx_TeamInTwitchAlert_channel_id ON TeamInTwitchAlert (channel_id)"),
+     ("UserInTwitchTeam",
+      "CREATE INDEX IF NOT EXISTS idx_UserInTwitchTeam_twitch_username ON UserInTwitchTeam (twitch_username)"),
+     ("Votes", "CREATE INDEX IF NOT EXISTS idx_Votes_end_time ON Votes (end_time)"),
+     ("Votes", "CREATE INDEX IF NOT EXISTS idx_Votes_author_id ON Votes (author_id)"),
+     ("VoteTargetRoles", "CREATE INDEX IF NOT EXISTS idx_VoteTargetRoles_vote_id ON VoteTargetRoles (vote_id)"),
+     ("VoteOptions", "CREATE INDEX IF NOT EXISTS idx_VoteOptions_vote_id ON VoteOptions (vote_id)"),
+     ("VoteSent", "CREATE INDEX IF NOT EXISTS idx_VoteSent_vote_id ON VoteSent (vote_id)"),
+     ("VoteSent",
+      "CREATE INDEX IF NOT EXISTS idx_VoteSent_vote_receiver_message ON VoteSent (vote_receiver_message)"),
+     ("roles", "CREATE INDEX IF NOT EXISTS idx_roles_r_id ON roles (r_id)"),
+     ("to_re_verify", "CREATE INDEX IF NOT EXISTS idx_to_re_verify_r_id ON to_re_verify (r_id)"),
+     ("non_verified_emails",
+      "CREATE INDEX IF NOT EXISTS idx_non_verified_emails_u_id ON non_verified_emails (u_id)")],
+]
 
 # Variables
 
@@ -57,15 +105,229 @@ def format_db_path(directory: str, filename: str):
         return directory + filename
 
 
+class KoalaDBConnectionPool:
+    """
+    A bounded pool of long-lived database connections
+
+    Connections are keyed once when they are opened and then reused, a thread keeps the same connection for as long as
+    it has one checked out so nested calls on that thread share it.
+    """
+
+    def __init__(self, connect, size, checkout_timeout=POOL_CHECKOUT_TIMEOUT):
+        """
+        Initialises local variables
+
+        :param connect: A callable returning a new, ready to use connection
+        :param size: The maximum number of connections that can be open at once
+        :param checkout_timeout: Seconds to wait for a free connection before raising TimeoutError
+        """
+        if size < 1:
+            raise ValueError("Connection pool size must be at least 1")
+        self.connect = connect
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self.closed = False
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._open_count = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the current thread, returning it to the pool when the outermost checkout ends
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._acquire()
+            self._local.conn = conn
+            self._local.depth = 0
+        self._local.depth += 1
+        try:
+            yield conn
+        finally:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                self._local.conn = None
+                self._release(conn)
+
+    def close(self):
+        """
+        Close all idle connections, connections still checked out are closed when they are returned
+        """
+        self.closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+    def _acquire(self):
+        """
+        Take a healthy connection from the pool, opening a new one if the pool is not yet full
+
+        :return: A database connection
+        """
+        if self.closed:
+            raise RuntimeError("Connection pool is closed")
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open_if_space()
+                if conn is None:
+                    try:
+                        conn = self._idle.get(timeout=self.checkout_timeout)
+                    except queue.Empty:
+                        raise TimeoutError(f"No database connection became free within {self.checkout_timeout}s")
+            if self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+    def _open_if_space(self):
+        """
+        Open a new connection if fewer than size connections are open
+
+        :return: The new connection, or None if the pool is full
+        """
+        with self._lock:
+            if self._open_count >= self.size:
+                return None
+            self._open_count += 1
+        try:
+            return self.connect()
+        except Exception:
+            with self._lock:
+                self._open_count -= 1
+            raise
+
+    def _release(self, conn):
+        """
+        Return a connection to the pool, discarding any uncommitted work
+
+        :param conn: The connection being returned
+        """
+        try:
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        if self.closed:
+            self._discard(conn)
+        else:
+            self._idle.put_nowait(conn)
+
+    def _discard(self, conn):
+        """
+        Close a connection and free its slot in the pool
+
+        :param conn: The connection to close
+        """
+        with self._lock:
+            self._open_count -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_healthy(conn):
+        """
+        Health check a pooled connection before handing it out
+
+        :param conn: The connection to check
+        :return: True if the connection can still run queries
+        """
+        try:
+            conn.execute("SELECT 1").fetchall()
+            return True
+        except Exception:
+            return False
+
+
 class KoalaDBManager:
     """
     The database manager for KoalaBot
     """
 
-    def __init__(self, db_filename, db_secret_key, db_directory=None):
+    def __init__(self, db_filename, db_secret_key, db_directory=None, pool_size=0, write_behind_interval=0,
+                 write_behind_batch_size=WRITE_BEHIND_MAX_BATCH):
+        """
+        Initialises local variables
+
+        :param db_filename: The filename of the database
+        :param db_secret_key: The SQLCipher key of the database
+        :param db_directory: The directory for the database file
+        :param pool_size: The number of pooled connections to keep open, 0 opens a new connection for every query
+        :param write_behind_interval: Seconds between flushes of buffered commits, 0 commits every query immediately
+        :param write_behind_batch_size: The number of buffered commits that triggers an early flush
+        """
         self.db_file_path = format_db_path(db_directory, db_filename)
         self.db_secret_key = db_secret_key
+        self.pool = None
+        if pool_size:
+            self.pool = KoalaDBConnectionPool(lambda: self.open_connection(check_same_thread=False), pool_size)
+        self._thread_local = threading.local()
+        self._pinned_connections = []
+        self.async_manager = AsyncKoalaDBManager(self)
+        self.write_behind_interval = write_behind_interval
+        self.write_behind_batch_size = write_behind_batch_size
+        self._write_queue = []
+        self._write_queue_lock = threading.Lock()
+        self._flush_lock = threading.RLock()
+        self._flush_wanted = threading.Event()
+        self._flusher = None
+        self._guild_extensions_cache = {}
+        self._guild_extensions_cache_lock = threading.Lock()
         self.create_base_tables()
+        if write_behind_interval:
+            self._flusher = threading.Thread(target=self._flush_loop, name="KoalaDBFlusher", daemon=True)
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    def open_connection(self, check_same_thread=True):
+        """
+        Open a new, keyed connection to the SQLite3 database specified in db_file_path
+
+        :param check_same_thread: False if the connection may be used by threads other than the one opening it
+        :return: Connection object
+        """
+        conn = sqlite3.connect(self.db_file_path, check_same_thread=check_same_thread)
+        if not (os.name == 'nt' or not ENCRYPTED_DB):
+            conn.execute('''PRAGMA key="x'{}'"'''.format(self.db_secret_key))
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        return conn
+
+    def migrate(self):
+        """
+        Apply any schema migrations newer than the database's user_version
+
+        Should be run once all cogs have created their tables. A migration whose tables do not exist yet is applied as
+        far as it can be, but is not recorded, so it is completed on a later startup.
+
+        :return: The schema version of the database after migrating
+        """
+        self.flush()
+        with self.connection() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for migration in MIGRATIONS[version:]:
+                tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+                complete = True
+                for table, sql_str in migration:
+                    if table is None or table in tables:
+                        conn.execute(sql_str)
+                    else:
+                        complete = False
+                conn.commit()
+                if not complete:
+                    break
+                version += 1
+                conn.execute(f"PRAGMA user_version={version}")
+                conn.commit()
+        return version
 
     def create_connection(self):
         """
@@ -75,10 +337,8 @@ class KoalaDBManager:
         """
         conn = None
         try:
-            conn = sqlite3.connect(self.db_file_path)
+            conn = self.open_connection()
             c = conn.cursor()
-            if not (os.name == 'nt' or not ENCRYPTED_DB):
-                c.execute('''PRAGMA key="x'{}'"'''.format(self.db_secret_key))
 
             return conn, c
         except Exception as e:
@@ -86,6 +346,53 @@ class KoalaDBManager:
 
         return conn
 
+    def pin_thread_connection(self):
+        """
+        Open a connection that the current thread keeps using for every query, unless pooling is enabled
+        """
+        if self.pool is None and getattr(self._thread_local, "conn", None) is None:
+            self._thread_local.conn = self.open_connection(check_same_thread=False)
+            self._pinned_connections.append(self._thread_local.conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Get a connection for a single query, taken from the thread's pinned connection or the pool if available
+        """
+        pinned = getattr(self._thread_local, "conn", None)
+        if pinned is not None:
+            try:
+                yield pinned
+            except BaseException:
+                pinned.rollback()
+                raise
+        elif self.pool is not None:
+            with self.pool.connection() as conn:
+                yield conn
+        else:
+            # Opened directly rather than with create_connection, which returns None on failure and hides the error
+            conn = self.open_connection()
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+    def close(self):
+        """
+        Flush buffered commits then close any pooled connections and the async executor held by this database manager
+        """
+        if self._flusher is not None:
+            flusher, self._flusher = self._flusher, None
+            self._flush_wanted.set()
+            flusher.join()
+            atexit.unregister(self.flush)
+        self.async_manager.close()
+        self.flush()
+        while self._pinned_connections:
+            self._pinned_connections.pop().close()
+        if self.pool is not None:
+            self.pool.close()
+
     def db_execute_select(self, sql_str, args=None, pass_errors=False):
         """ Execute an SQL selection with the connection stored in this object
 
@@ -96,15 +403,16 @@ class KoalaDBManager:
         :param pass_errors: Raise errors that are raised by this query
         :return:
         """
+        self.flush()
         try:
-            conn, c = self.create_connection()
-            if args:
-                c.execute(sql_str, args)
-            else:
-                c.execute(sql_str)
-            results = c.fetchall()
-            c.close()
-            conn.close()
+            with self.connection() as conn:
+                c = conn.cursor()
+                if args:
+                    c.execute(sql_str, args)
+                else:
+                    c.execute(sql_str)
+                results = c.fetchall()
+                c.close()
             return results
         except Exception as e:
             if pass_errors:
@@ -117,26 +425,93 @@ class KoalaDBManager:
 
         All Koala Cogs should use this rather than interfacing with sqlite3 directly
 
+        In write-behind mode the statement is buffered and committed by the next flush, unless pass_errors is set
+
         :param sql_str: An SQL transaction
         :param args: Additional args to pass with the sql statement
         :param pass_errors: Raise errors that are raised by this query
         :return: void
         """
+        if self._flusher is not None and not pass_errors:
+            with self._write_queue_lock:
+                self._write_queue.append((sql_str, args))
+                if len(self._write_queue) >= self.write_behind_batch_size:
+                    self._flush_wanted.set()
+            return
+        self.db_execute_transaction([(sql_str, args)], pass_errors=pass_errors)
+
+    def db_execute_transaction(self, statements, pass_errors=False):
+        """ Execute several SQL statements as a single transaction, so either all or none of them are committed
+
+        :param statements: A list of (sql_str, args) tuples, args may be None
+        :param pass_errors: Raise errors that are raised by this transaction
+        :return: void
+        """
+        self.flush()
         try:
-            conn, c = self.create_connection()
-            if args:
-                c.execute(sql_str, args)
-            else:
-                c.execute(sql_str)
-            conn.commit()
-            c.close()
-            conn.close()
+            self._execute_transaction(statements)
         except Exception as e:
             if pass_errors:
                 raise e
             else:
                 print(e)
 
+    def flush(self):
+        """
+        Commit all buffered write-behind statements, so that following queries can read them
+
+        The buffer is committed as one transaction. If that fails, each statement is retried on its own so a single bad
+        statement does not lose the rest of the batch.
+        """
+        if self._flusher is None and not self._write_queue:
+            return
+        with self._flush_lock:
+            with self._write_queue_lock:
+                statements, self._write_queue = self._write_queue, []
+            if not statements:
+                return
+            try:
+                self._execute_transaction(statements)
+            except Exception:
+                for statement in statements:
+                    try:
+                        self._execute_transaction([statement])
+                    except Exception as e:
+                        print(e)
+
+    def _execute_transaction(self, statements):
+        """
+        Execute the given statements on one connection and commit them together, rolling back on error
+
+        :param statements: A list of (sql_str, args) tuples
+        """
+        with self.connection() as conn:
+            c = conn.cursor()
+            try:
+                for sql_str, args in statements:
+                    if args:
+                        c.execute(sql_str, args)
+                    else:
+                        c.execute(sql_str)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                c.close()
+
+    def _flush_loop(self):
+        """
+        Background thread flushing buffered commits every write_behind_interval, or sooner when a batch fills up
+        """
+        while self._flusher is not None:
+            self._flush_wanted.wait(self.write_behind_interval)
+            self._flush_wanted.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(e)
+
     def create_base_tables(self):
         """
         Create base tables required for KoalaBot.
@@ -209,11 +584,44 @@ class KoalaDBManager:
         :param guild_id: Discord guild ID for a given server
         :param extension_id: The Koala extension ID
         """
+        extension_ids = self.get_guild_extension_ids(guild_id)
+        return "All" in extension_ids or extension_id in extension_ids
+
+    def get_guild_extension_ids(self, guild_id):
+        """
+        Get the IDs of every extension given to a guild, cached for GUILD_EXTENSIONS_CACHE_TTL seconds
+
+        :param guild_id: Discord guild ID for a given server
+        :return: A frozenset of extension IDs
+        """
+        with self._guild_extensions_cache_lock:
+            cached = self._guild_extensions_cache.get(guild_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
         sql_select_extension = "SELECT extension_id " \
                                "FROM GuildExtensions " \
                                "WHERE guild_id = ?"
         result = self.db_execute_select(sql_select_extension, args=[guild_id])
-        return ("All",) in result or (extension_id,) in result
+        if result is None:
+            # The select failed, so don't cache a guild with no extensions
+            return frozenset()
+        extension_ids = frozenset(row[0] for row in result)
+        with self._guild_extensions_cache_lock:
+            self._guild_extensions_cache[guild_id] = (time.monotonic() + GUILD_EXTENSIONS_CACHE_TTL, extension_ids)
+        return extension_ids
+
+    def invalidate_guild_extensions(self, guild_id=None):
+        """
+        Forget the cached extensions of a guild, so they are read from the database on next use
+
+        :param guild_id: Discord guild ID for a given server, None to forget every guild
+        """
+        with self._guild_extensions_cache_lock:
+            if guild_id is None:
+                self._guild_extensions_cache.clear()
+            else:
+                self._guild_extensions_cache.pop(guild_id, None)
 
     def give_guild_extension(self, guild_id, extension_id: str):
         """
@@ -228,6 +636,7 @@ class KoalaDBManager:
             INSERT INTO GuildExtensions 
             VALUES (?,?)"""
             self.db_execute_commit(sql_insert_guild_extension, args=[extension_id, guild_id])
+            self.invalidate_guild_extensions(guild_id)
         else:
             raise NotImplementedError(f"{extension_id} is not a valid extension")
 
@@ -240,7 +649,10 @@ class KoalaDBManager:
         """
         sql_remove_extension = "DELETE FROM GuildExtensions " \
                                "WHERE extension_id = ? AND guild_id = ?"
-        self.db_execute_commit(sql_remove_extension, args=[extension_id, guild_id], pass_errors=True)
+        try:
+            self.db_execute_commit(sql_remove_extension, args=[extension_id, guild_id], pass_errors=True)
+        finally:
+            self.invalidate_guild_extensions(guild_id)
 
     def get_enabled_guild_extensions(self, guild_id: int):
         """
@@ -280,6 +692,7 @@ class KoalaDBManager:
         """
         for table in tables:
             self.db_execute_commit('DELETE FROM ' + table[0] + ';')
+        self.invalidate_guild_extensions()
 
     def fetch_guild_welcome_message(self, guild_id):
         """
@@ -324,3 +737,84 @@ class KoalaDBManager:
             "INSERT INTO GuildWelcomeMessages (guild_id, welcome_message) VALUES (?, ?);",
             args=[guild_id, IntroCog.DEFAULT_WELCOME_MESSAGE])
         return self.fetch_guild_welcome_message(guild_id)
+
+
+class AsyncKoalaDBManager:
+    """
+    An async facade for a KoalaDBManager
+
+    Queries are run on a dedicated executor whose threads each hold their own connection, so coroutines on the discord
+    event loop never block on database I/O.
+    """
+
+    def __init__(self, database_manager: KoalaDBManager, max_workers=ASYNC_DB_WORKERS):
+        """
+        Initialises local variables
+
+        :param database_manager: The database manager to run queries with
+        :param max_workers: The number of executor threads (and so connections) used for queries
+        """
+        self.database_manager = database_manager
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="KoalaDB",
+                                           initializer=self._init_worker)
+
+    def _init_worker(self):
+        """
+        Gives a new executor thread its own connection to the database
+        """
+        try:
+            self.database_manager.pin_thread_connection()
+        except Exception as e:
+            print(e)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run a blocking database function on the database executor
+
+        e.g. await async_manager.run(rfr_database_manager.get_rfr_message, guild_id, channel_id, message_id)
+
+        :param func: The function to run
+        :param args: Positional arguments for func
+        :param kwargs: Keyword arguments for func
+        :return: The return value of func
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def select(self, sql_str, args=None, pass_errors=False):
+        """
+        Async version of KoalaDBManager.db_execute_select
+
+        :param sql_str: An SQL SELECT statement
+        :param args: Additional args to pass with the sql statement
+        :param pass_errors: Raise errors that are raised by this query
+        :return: The selected rows
+        """
+        return await self.run(self.database_manager.db_execute_select, sql_str, args=args, pass_errors=pass_errors)
+
+    async def commit(self, sql_str, args=None, pass_errors=False):
+        """
+        Async version of KoalaDBManager.db_execute_commit
+
+        :param sql_str: An SQL transaction
+        :param args: Additional args to pass with the sql statement
+        :param pass_errors: Raise errors that are raised by this query
+        :return: void
+        """
+        return await self.run(self.database_manager.db_execute_commit, sql_str, args=args, pass_errors=pass_errors)
+
+    async def transaction(self, statements, pass_errors=False):
+        """
+        Async version of KoalaDBManager.db_execute_transaction
+
+        :param statements: A list of (sql_str, args) tuples, args may be None
+        :param pass_errors: Raise errors that are raised by this transaction
+        :return: void
+        """
+        return await self.run(self.database_manager.db_execute_transaction, statements, pass_errors=pass_errors)
+
+    def close(self):
+        """
+        Stop accepting new queries, waiting for queued queries to finish
+        """
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+
+"""
+Koala Bot Regex Sandbox code
+Runs untrusted regular expressions in a worker process with a time limit, and statically checks them for patterns
+prone to catastrophic backtracking
+
+Commented using reStructuredText (reST)
+"""
+# Futures
+
+# Built-in/Generic Imports
+import asyncio
+import functools
+import pickle
+import queue
+import re
+import subprocess
+import sys
+import threading
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+# Libs
+
+# Own modules
+
+# Constants
+REGEX_TIME_BUDGET = 0.1
+WORKER_START_TIMEOUT = 30
+MAX_REGEX_LENGTH = 300
+REPEAT_OPCODES = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, "POSSESSIVE_REPEAT"):
+    REPEAT_OPCODES.add(sre_constants.POSSESSIVE_REPEAT)
+MAX_RANGE_SIZE = 1024
+# ASCII approximations of the character classes, enough to tell whether alternatives can start the same way
+CATEGORY_CHARS = {
+    sre_constants.CATEGORY_DIGIT: frozenset(map(ord, "0123456789")),
+    sre_constants.CATEGORY_SPACE: frozenset(map(ord, " \t\n\r\f\v")),
+    sre_constants.CATEGORY_WORD: frozenset(map(ord, "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_"))
+}
+
+# Sent by read_results when the worker's output ends
+WORKER_STOPPED = object()
+
+# Variables
+
+
+class RegexTimeoutError(Exception):
+    """
+    Raised when a regex search takes longer than its time budget
+    """
+    pass
+
+
+class RegexSandboxStoppedError(Exception):
+    """
+    Raised when a search is made without the worker process running
+    """
+    pass
+
+
+def check_regex_complexity(pattern):
+    """
+    Statically checks a regex for constructs that can make it run in exponential time
+
+    :param pattern: The regex to check
+    :return: A description of the problem, or None if the regex looks safe
+    """
+    if len(pattern) > MAX_REGEX_LENGTH:
+        return f"it is longer than {MAX_REGEX_LENGTH} characters"
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error as err:
+        return f"it is not a valid regex ({err})"
+    return find_unsafe_construct(parsed, False, bool(parsed.state.flags & re.IGNORECASE))
+
+
+def find_unsafe_construct(parsed, in_unbounded_repeat, ignore_case=False):
+    """
+    Walks a parsed regex looking for backreferences, and variable length repeats or overlapping alternatives inside
+    unbounded repeats
+
+    :param parsed: A parsed regex or sub-pattern
+    :param in_unbounded_repeat: True if parsed is repeated an unbounded number of times
+    :param ignore_case: True if parsed is matched ignoring case
+    :return: A description of the problem, or None if none was found
+    """
+    for opcode, value in parsed:
+        if opcode in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            return "it uses a backreference"
+        if opcode in REPEAT_OPCODES:
+            minimum, maximum, sub_pattern = value
+            if in_unbounded_repeat and maximum > 1 and minimum != maximum:
+                return "it repeats a repeated group (e.g. (a+)+)"
+            problem = find_unsafe_construct(sub_pattern,
+                                            in_unbounded_repeat or maximum == sre_constants.MAXREPEAT, ignore_case)
+        elif opcode == sre_constants.SUBPATTERN:
+            problem = find_unsafe_construct(value[-1], in_unbounded_repeat, subpattern_ignore_case(value, ignore_case))
+        elif opcode == sre_constants.BRANCH:
+            problem = None
+            if in_unbounded_repeat and branches_overlap(value[1], ignore_case):
+                problem = "it repeats alternatives that can match the same text (e.g. (a|ab)*)"
+            for branch in value[1]:
+                problem = problem or find_unsafe_construct(branch, in_unbounded_repeat, ignore_case)
+        elif opcode in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            problem = find_unsafe_construct(value[1], in_unbounded_repeat, ignore_case)
+        else:
+            problem = None
+        if problem:
+            return problem
+    return None
+
+
+def branches_overlap(branches, ignore_case=False):
+    """
+    Checks whether any two alternatives of a branch can start with the same character. The parser moves a prefix
+    shared by every alternative out of the branch, so an alternative that can match nothing, e.g. what remains of a in
+    (a|ab), overlaps with all the others.
+
+    :param branches: The parsed alternatives of a branch
+    :param ignore_case: True if the branch is matched ignoring case
+    :return: True if two alternatives can start the same way
+    """
+    seen = set()
+    for branch in branches:
+        chars, nullable = first_chars(branch, ignore_case)
+        if nullable or chars is None or seen & chars:
+            return True
+        seen |= chars
+    return False
+
+
+def subpattern_ignore_case(value, ignore_case):
+    """
+    :param value: The value of a parsed group, (group, add_flags, del_flags, sub-pattern)
+    :param ignore_case: True if the group's parent is matched ignoring case
+    :return: True if the group's sub-pattern is matched ignoring case
+    """
+    _, add_flags, del_flags, _ = value
+    return (ignore_case or bool(add_flags & re.IGNORECASE)) and not del_flags & re.IGNORECASE
+
+
+def case_chars(char, ignore_case):
+    """
+    :param char: A character code
+    :param ignore_case: True if it is matched ignoring case
+    :return: The set of character codes it matches
+    """
+    if not ignore_case:
+        return {char}
+    return {char, ord(chr(char).lower()), ord(chr(char).upper())}
+
+
+def first_chars(parsed, ignore_case=False):
+    """
+    Finds the characters a parsed regex can start with
+
+    :param parsed: A parsed regex or sub-pattern
+    :param ignore_case: True if parsed is matched ignoring case
+    :return: The set of character codes it can start with, None if it could be almost any, and whether it can match
+    the empty string
+    """
+    chars = set()
+    for opcode, value in parsed:
+        if opcode == sre_constants.LITERAL:
+            item_chars, nullable = case_chars(value, ignore_case), False
+        elif opcode == sre_constants.IN:
+            item_chars, nullable = in_chars(value, ignore_case), False
+        elif opcode in REPEAT_OPCODES:
+            item_chars, nullable = first_chars(value[2], ignore_case)
+            nullable = nullable or value[0] == 0
+        elif opcode == sre_constants.SUBPATTERN:
+            item_chars, nullable = first_chars(value[-1], subpattern_ignore_case(value, ignore_case))
+        elif opcode == sre_constants.BRANCH:
+            item_chars, nullable = set(), False
+            for branch in value[1]:
+                branch_chars, branch_nullable = first_chars(branch, ignore_case)
+                item_chars = None if item_chars is None or branch_chars is None else item_chars | branch_chars
+                nullable = nullable or branch_nullable
+        elif opcode in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            item_chars, nullable = set(), True
+        else:
+            item_chars, nullable = None, False
+        if item_chars is None:
+            return None, False
+        chars |= item_chars
+        if not nullable:
+            return chars, False
+    return chars, True
+
+
+def in_chars(items, ignore_case=False):
+    """
+    Finds the characters a parsed character set matches
+
+    :param items: The items of a parsed character set
+    :param ignore_case: True if the set is matched ignoring case
+    :return: The set of character codes, or None if it could be almost any
+    """
+    chars = set()
+    for opcode, value in items:
+        if opcode == sre_constants.LITERAL:
+            chars |= case_chars(value, ignore_case)
+        elif opcode == sre_constants.RANGE and value[1] - value[0] < MAX_RANGE_SIZE:
+            for char in range(value[0], value[1] + 1):
+                chars |= case_chars(char, ignore_case)
+        elif opcode == sre_constants.CATEGORY and value in CATEGORY_CHARS:
+            chars |= CATEGORY_CHARS[value]
+        else:
+            return None
+    return chars
+
+
+def regex_worker(requests, results):
+    """
+    The sandbox process, answering (patterns, content) requests with the key of the first pattern found in content
+
+    :param requests: The binary stream requests are read from
+    :param results: The binary stream results are written to
+    """
+    try:
+        send_result(results, None)
+        while True:
+            try:
+                patterns, content = pickle.load(requests)
+            except (EOFError, pickle.UnpicklingError):
+                return
+            result = None
+            for key, pattern in patterns:
+                try:
+                    if re.search(pattern, content):
+                        result = key
+                        break
+                except re.error:
+                    continue
+            send_result(results, result)
+    except OSError:
+        return
+
+
+def send_result(results, result):
+    """
+    Write a result from the worker process
+
+    :param results: The binary stream results are written to
+    :param result: The result to write
+    """
+    pickle.dump(result, results)
+    results.flush()
+
+
+def read_results(results, results_queue):
+    """
+    Move results from the worker process to a queue until its output ends, then put WORKER_STOPPED
+
+    :param results: The worker's binary stdout
+    :param results_queue: The queue to put results on
+    """
+    with results:
+        while True:
+            try:
+                results_queue.put(pickle.load(results))
+            except (EOFError, OSError, ValueError, pickle.UnpicklingError):
+                results_queue.put(WORKER_STOPPED)
+                return
+
+
+class RegexSandbox:
+    """
+    Runs regex searches in a separate process, killing and replacing it when a search runs out of time
+    """
+
+    def __init__(self, time_budget=REGEX_TIME_BUDGET):
+        """
+        Initialises local variables, call start to start the worker process
+
+        :param time_budget: The seconds a single search may take
+        """
+        self.time_budget = time_budget
+        self.process = None
+        self.results = None
+        self.ready = False
+        self.lock = threading.Lock()
+        # A fresh isolated interpreter running only this file, multiprocessing would fork the bot process or re-import
+        # its main module in the worker
+        self.command = [sys.executable, "-I", __file__]
+
+    def is_running(self):
+        """
+        :return: True if the worker process is running
+        """
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """
+        Start a new worker process if one isn't running. Workers take a moment to be ready, the first search waits for
+        them.
+        """
+        with self.lock:
+            if self.is_running():
+                return
+            self.close_worker()
+            self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.results = queue.Queue()
+            threading.Thread(target=read_results, args=(self.process.stdout, self.results),
+                             name="KoalaRegexSandbox", daemon=True).start()
+            self.ready = False
+
+    def close(self):
+        """
+        Stop the worker process
+        """
+        with self.lock:
+            self.close_worker()
+
+    def close_worker(self):
+        """
+        Stop the worker process, the lock must be held
+        """
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process.stdin.close()
+            self.process = None
+            self.results = None
+
+    def first_match(self, patterns, content, start=True):
+        """
+        Search content for each pattern in turn, blocking for at most time_budget seconds once the worker is ready
+
+        :param patterns: A list of (key, regex) pairs
+        :param content: The text to search
+        :param start: Whether to start the worker if it isn't running
+        :return: The key of the first pattern found in content, or None if none were
+        :raises RegexTimeoutError: If the search ran out of time, the worker is stopped
+        :raises RegexSandboxStoppedError: If the worker isn't running and start is False
+        """
+        if start:
+            self.start()
+        with self.lock:
+            if not self.is_running():
+                raise RegexSandboxStoppedError("The regex sandbox worker isn't running")
+            if not self.ready:
+                self.get_result(WORKER_START_TIMEOUT, RegexSandboxStoppedError("The regex sandbox worker didn't start"))
+                self.ready = True
+            try:
+                pickle.dump((patterns, content), self.process.stdin)
+                self.process.stdin.flush()
+            except OSError:
+                self.close_worker()
+                raise RegexSandboxStoppedError("The regex sandbox worker stopped")
+            return self.get_result(self.time_budget,
+                                   RegexTimeoutError(f"Regex search took longer than {self.time_budget}s"))
+
+    def get_result(self, timeout, timeout_error):
+        """
+        Wait for the next result from the worker, the lock must be held
+
+        :param timeout: The seconds to wait
+        :param timeout_error: The error to raise if no result came in time, the worker is stopped
+        :return: The result
+        :raises RegexSandboxStoppedError: If the worker stopped
+        """
+        try:
+            result = self.results.get(timeout=timeout)
+        except queue.Empty:
+            self.close_worker()
+            raise timeout_error
+        if result is WORKER_STOPPED:
+            self.close_worker()
+            raise RegexSandboxStoppedError("The regex sandbox worker stopped")
+        return result
+
+    async def search(self, patterns, content):
+        """
+        Async version of first_match. A stopped worker is restarted here rather than on the executor thread running the
+        search.
+
+        :param patterns: A list of (key, regex) pairs
+        :param content: The text to search
+        :return: The key of the first pattern found in content, or None if none were
+        :raises RegexTimeoutError: If the search ran out of time
+        :raises RegexSandboxStoppedError: If the worker couldn't be started
+        """
+        loop = asyncio.get_event_loop()
+        for attempt in range(2):
+            if not self.is_running():
+                self.start()
+            try:
+                return await loop.run_in_executor(None, functools.partial(self.first_match, patterns, content,
+                                                                          start=False))
+            except RegexSandboxStoppedError:
+                # Another search may have timed out and stopped the worker first, so restart it once
+                if attempt:
+                    raise
+
+
+if __name__ == "__main__":
+    regex_worker(sys.stdin.buffer, sys.stdout.buffer)